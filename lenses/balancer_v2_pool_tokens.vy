@@ -0,0 +1,44 @@
+# @version 0.3.10
+"""
+@title Balancer V2 pool tokens lens
+@notice Reads `getPoolTokens(poolId)` from the vault for many pools.
+        The result is flat: for each pool, the number of tokens `n` followed by `n` pairs of (token, balance).
+        A pool whose call fails, or that has more than MAX_POOL_TOKENS tokens, gets `n = max_value(uint256)` and no pairs.
+"""
+
+MAX_POOLS: constant(uint256) = 500
+MAX_POOL_TOKENS: constant(uint256) = 16
+# 1 + 2 * MAX_POOL_TOKENS words per pool
+MAX_WORDS: constant(uint256) = 16500
+# the abi encoded response for a pool with MAX_POOL_TOKENS tokens
+MAX_RESPONSE: constant(uint256) = 1184
+
+
+@external
+@view
+def pool_tokens(vault: address, pool_ids: DynArray[bytes32, MAX_POOLS]) -> DynArray[uint256, MAX_WORDS]:
+    packed: DynArray[uint256, MAX_WORDS] = []
+    for pool_id in pool_ids:
+        success: bool = False
+        response: Bytes[1216] = b""
+        success, response = raw_call(
+            vault,
+            _abi_encode(pool_id, method_id=method_id("getPoolTokens(bytes32)")),
+            max_outsize=1216,
+            is_static_call=True,
+            revert_on_failure=False
+        )
+        if not success or len(response) > MAX_RESPONSE or len(response) < 160:
+            packed.append(max_value(uint256))
+            continue
+        tokens: DynArray[address, MAX_POOL_TOKENS] = []
+        balances: DynArray[uint256, MAX_POOL_TOKENS] = []
+        last_change_block: uint256 = 0
+        tokens, balances, last_change_block = _abi_decode(response, (DynArray[address, MAX_POOL_TOKENS], DynArray[uint256, MAX_POOL_TOKENS], uint256))
+        packed.append(len(tokens))
+        for i in range(MAX_POOL_TOKENS):
+            if i >= len(tokens):
+                break
+            packed.append(convert(tokens[i], uint256))
+            packed.append(balances[i])
+    return packed
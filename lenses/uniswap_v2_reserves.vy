@@ -0,0 +1,26 @@
+# @version 0.3.10
+"""
+@title Uniswap V2 reserves lens
+@notice Reads `getReserves()` from many uniswap v2 style pairs.
+        Both reserves of a pair are packed into one word, `reserve0 << 128 | reserve1`.
+        A pair whose call fails gets `max_value(uint256)`, which no pair can return since reserves are uint112.
+"""
+
+MAX_PAIRS: constant(uint256) = 2000
+
+
+@external
+@view
+def reserves(pairs: DynArray[address, MAX_PAIRS]) -> DynArray[uint256, MAX_PAIRS]:
+    packed: DynArray[uint256, MAX_PAIRS] = []
+    for pair in pairs:
+        success: bool = False
+        response: Bytes[96] = b""
+        success, response = raw_call(pair, method_id("getReserves()"), max_outsize=96, is_static_call=True, revert_on_failure=False)
+        if not success or len(response) < 64:
+            packed.append(max_value(uint256))
+            continue
+        reserve0: uint256 = extract32(response, 0, output_type=uint256)
+        reserve1: uint256 = extract32(response, 32, output_type=uint256)
+        packed.append((reserve0 << 128) | reserve1)
+    return packed
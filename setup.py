@@ -18,6 +18,8 @@ setup(
         'cachetools>=4.1.1',
         'eth-brownie>=1.18.1',
         'joblib>=1.0.1',
+        'msgpack>=1.0.0',
+        'numpy',
     ],
     setup_requires=[
         'setuptools_scm',
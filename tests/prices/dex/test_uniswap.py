@@ -67,3 +67,28 @@ def test_uniswap_v3(token):
     alt_price = magic.get_price(token)
     print(token, price, alt_price)
     assert price == pytest.approx(alt_price, rel=5e-2)
+
+
+def _blocks():
+    return [chain.height - 500_000 * i for i in range(4)]
+
+@pytest.mark.parametrize('token', V2_TOKENS)
+def test_uniswap_v2_at_blocks(token):
+    blocks = _blocks()
+    prices = uniswap_multiplexer.get_prices_at_blocks(token, blocks)
+    for block, price in zip(blocks, prices):
+        # the route should be the one chosen at `block`, not the deepest one today
+        router = uniswap_multiplexer.deepest_router(token, block=block)
+        alt_price = router.get_price(token, block) if router else None
+        print(token, block, price, alt_price)
+        if alt_price is None:
+            assert price is None
+        else:
+            assert price == pytest.approx(alt_price, rel=5e-2)
+
+
+@pytest.mark.parametrize('token', V2_TOKENS)
+def test_uniswap_v3_at_blocks(token):
+    blocks = _blocks()
+    prices = v3.uniswap_v3.get_prices_at_blocks(token, blocks)
+    assert prices == [v3.uniswap_v3.get_price(token, block) for block in blocks]
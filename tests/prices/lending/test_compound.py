@@ -1,4 +1,5 @@
 import pytest
+from brownie import chain
 from tests.fixtures import blocks_for_contract, mutate_addresses
 from y.classes.common import ERC20
 from y.prices.lending.compound import CToken, compound
@@ -20,3 +21,20 @@ def test_compound_pricing(token):
         price = compound.get_price(token, block)
         assert price, 'Failed to fetch price.'
         print(f'                price = {price}')
+
+@pytest.mark.parametrize('token',CTOKENS)
+def test_compound_prices_at_blocks(token):
+    blocks = blocks_for_contract(token)
+    prices = compound.get_prices_at_blocks(token, blocks)
+    for block, price in zip(blocks, prices):
+        if price is None:
+            continue
+        assert price == pytest.approx(compound.get_price(token, block))
+
+def test_compound_get_prices():
+    block = chain.height
+    prices = compound.get_prices(CTOKENS, block)
+    for token, price in zip(CTOKENS, prices):
+        if price is None:
+            continue
+        assert price == pytest.approx(compound.get_price(token, block))
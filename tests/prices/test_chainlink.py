@@ -1,6 +1,6 @@
 import pytest
 from brownie import ZERO_ADDRESS, chain
-from tests.fixtures import mutate_addresses
+from tests.fixtures import blocks_for_contract, mutate_addresses
 from y.contracts import contract_creation_block
 from y.networks import Network
 from y.prices.chainlink import FEEDS, chainlink
@@ -137,3 +137,10 @@ def test_chainlink_before_feed():
     # try to fetch yfi price one block before feed is deployed
     price = chainlink.get_price('0x0bc529c00C6401aEF6D220BE8C6Ea1667F6Ad93e', 12742718)
     assert price is None
+
+
+@pytest.mark.parametrize('token', FEEDS)
+def test_chainlink_prices_at_blocks(token):
+    blocks = blocks_for_contract(chainlink.get_feed(token).address)
+    prices = chainlink.get_prices_at_blocks(token, blocks)
+    assert prices == [chainlink.get_price(token, block) for block in blocks]
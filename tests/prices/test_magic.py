@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from brownie import chain
+from tests.prices.lending.test_compound import CTOKENS
+from y.constants import STABLECOINS, WRAPPED_GAS_COIN
+from y.datatypes import UsdPrice
+from y.exceptions import DeadlineExceeded
+from y.prices import magic
+from y.prices.utils import price_store
+from y.utils import deadline
+
+TOKENS = [WRAPPED_GAS_COIN, list(STABLECOINS)[0], *CTOKENS[:3]]
+
+
+@pytest.fixture
+def no_price_store():
+    old_store = price_store.get_price_store()
+    price_store.set_price_store(None)
+    yield
+    price_store.set_price_store(old_store)
+
+
+def _slow_get_price(token_address, block=None, fail_to_None=False, silent=False, timeout=None):
+    time.sleep(0.3)
+    deadline.check(f'pricing {token_address}')
+    return 1
+
+
+def test_get_prices_async():
+    block = chain.height - 10
+    prices = asyncio.run(magic.get_prices_async(TOKENS, block, fail_to_None=True, silent=True))
+    assert prices == magic.get_prices(TOKENS, block, fail_to_None=True, silent=True)
+
+def test_get_prices_async_is_one_batch(monkeypatch):
+    calls = []
+    def get_prices(token_addresses, block=None, fail_to_None=False, silent=False, dop=4, timeout=None):
+        calls.append((token_addresses, timeout))
+        return [None] * len(token_addresses)
+    monkeypatch.setattr(magic, 'get_prices', get_prices)
+    assert asyncio.run(magic.get_prices_async(iter(TOKENS), timeout=5)) == [None] * len(TOKENS)
+    assert calls == [(TOKENS, 5)], 'the whole batch should go to `get_prices` at once, with the timeout'
+
+def test_get_prices_timeout(monkeypatch, no_price_store):
+    # every token falls back to `get_price`, which runs in worker threads and should still see the deadline
+    monkeypatch.setattr(magic, '_exit_early_for_known_tokens_in_bulk', lambda bucket, token_addresses, block: None)
+    monkeypatch.setattr(magic, 'get_price', _slow_get_price)
+    block = chain.height
+    assert magic.get_prices(TOKENS, block, fail_to_None=True, silent=True, timeout=0.1) == [None] * len(TOKENS)
+    with pytest.raises(DeadlineExceeded):
+        magic.get_prices(TOKENS, block, silent=True, timeout=0.1)
+    assert magic.get_prices(TOKENS, block, silent=True) == [1] * len(TOKENS)
+
+def test_get_prices_stablecoins_are_usd_prices():
+    stables = list(STABLECOINS)[:3]
+    assert all(isinstance(price, UsdPrice) for price in magic.get_prices(stables, chain.height))
+
+def test_get_price_matrix():
+    blocks = [chain.height - 100_000, chain.height - 10]
+    matrix = magic.get_price_matrix(TOKENS, blocks, silent=True)
+    assert matrix.shape == (len(TOKENS), len(blocks))
+    assert matrix.dtype == np.float64
+    for j, block in enumerate(blocks):
+        expected = [np.nan if price is None else price for price in magic.get_prices(TOKENS, block, fail_to_None=True, silent=True)]
+        # one row per token and one column per block, in the order they were asked for
+        np.testing.assert_allclose(matrix[:, j], expected, rtol=1e-9)
+
+def test_get_price_matrix_order(monkeypatch):
+    def get_prices(token_addresses, block=None, fail_to_None=False, silent=False, dop=4, timeout=None):
+        return [None if i == 1 else i * 10 + block for i, _ in enumerate(token_addresses)]
+    monkeypatch.setattr(magic, 'get_prices', get_prices)
+    matrix = magic.get_price_matrix(TOKENS[:3], [1, 2], silent=True)
+    np.testing.assert_array_equal(matrix, [[1, 2], [np.nan, np.nan], [21, 22]])
@@ -0,0 +1,51 @@
+import pytest
+from brownie import chain
+from tests.prices.dex.test_uniswap import V2_TOKENS
+from tests.prices.lending.test_compound import CTOKENS
+from y import convert
+from y.constants import STABLECOINS
+from y.prices.dex.uniswap.v3 import uniswap_v3
+from y.prices.magic import get_price
+from y.prices.utils.buckets import check_bucket
+from y.prices.watcher import PriceWatcher, dependencies
+
+
+@pytest.mark.parametrize('token',list(STABLECOINS)[:5])
+def test_stable_dependencies(token):
+    assert dependencies(token) == set(), 'stablecoins do not depend on any pools or feeds'
+
+
+@pytest.mark.parametrize('token',CTOKENS)
+def test_watcher_update(token):
+    token = convert.to_address(token)
+    block = chain.height - 10
+    watcher = PriceWatcher([token])
+    watcher.update(block)
+    assert watcher.block == block
+    assert watcher.get(token) == get_price(token, block, fail_to_None=True, silent=True)
+    # ctokens accrue interest every block, so we reprice them on every update
+    assert token in watcher.update(block + 1)
+
+
+@pytest.mark.parametrize('token',CTOKENS)
+def test_watcher_unknown_interval(token):
+    token = convert.to_address(token)
+    block = chain.height - 10
+    watcher = PriceWatcher([token], unknown_interval=2)
+    watcher.update(block)
+    assert token not in watcher.update(block + 1)
+    assert token in watcher.update(block + 2)
+
+
+@pytest.mark.parametrize('token',V2_TOKENS)
+def test_uniswap_v3_dependencies(token):
+    if not uniswap_v3:
+        pytest.skip('uniswap v3 is not deployed on this network')
+    if check_bucket(token) is not None:
+        pytest.skip('only tokens without a bucket are priced with uniswap v3')
+    deps = dependencies(token)
+    if deps is None:
+        pytest.skip('priced from curve')
+    pools = uniswap_v3.get_pools(convert.to_address(token))
+    assert pools, 'these tokens all have uniswap v3 pools'
+    assert set(pools) <= deps, 'a swap in any uniswap v3 pool we quote through should reprice the token'
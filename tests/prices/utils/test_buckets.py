@@ -8,7 +8,9 @@ from tests.prices.test_chainlink import FEEDS
 from tests.prices.test_popsicle import POPSICLES
 from tests.prices.test_synthetix import SYNTHS
 from y.constants import EEE_ADDRESS, WRAPPED_GAS_COIN
-from y.prices.utils.buckets import check_bucket
+from y.prices.utils import bucket_store
+from y.prices.utils.bucket_store import SQLiteBucketStore
+from y.prices.utils.buckets import check_bucket, check_buckets
 
 
 @pytest.mark.parametrize('token',ATOKENS)
@@ -38,3 +40,21 @@ def test_check_bucket_stablecoins(token):
 @pytest.mark.parametrize('token',SYNTHS)
 def test_check_bucket_synthetix(token):
     assert check_bucket(token) == 'synthetix'
+
+def test_check_buckets():
+    tokens = ATOKENS + CTOKENS + POPSICLES
+    assert check_buckets(tokens) == [check_bucket(token) for token in tokens]
+
+def test_sqlite_bucket_store(tmp_path):
+    store = SQLiteBucketStore(str(tmp_path / 'buckets.sqlite'))
+    store.set_many({WRAPPED_GAS_COIN: 'wrapped gas coin', EEE_ADDRESS: None})
+    assert store.get_many([WRAPPED_GAS_COIN, EEE_ADDRESS, '0x0000000000000000000000000000000000000001']) == {WRAPPED_GAS_COIN: 'wrapped gas coin', EEE_ADDRESS: None}
+
+def test_sqlite_bucket_store_unclassified_expire(tmp_path, monkeypatch):
+    store = SQLiteBucketStore(str(tmp_path / 'buckets.sqlite'))
+    store.set_many({EEE_ADDRESS: None})
+    assert store.get_many([EEE_ADDRESS]) == {EEE_ADDRESS: None}
+    monkeypatch.setattr(bucket_store, 'UNCLASSIFIED_TTL', -1)
+    assert store.get_many([EEE_ADDRESS]) == {}, 'tokens without a bucket should be classified again once they expire'
+    store.set_many({EEE_ADDRESS: 'wrapped gas coin'})
+    assert store.get_many([EEE_ADDRESS]) == {EEE_ADDRESS: 'wrapped gas coin'}
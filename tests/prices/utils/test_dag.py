@@ -0,0 +1,19 @@
+import pytest
+from brownie import chain
+from tests.prices.lending.test_compound import CTOKENS
+from y import convert
+from y.prices.lending.compound import CToken
+from y.prices.utils.dag import PricingDAG
+
+
+@pytest.mark.parametrize('token',CTOKENS)
+def test_dag_levels(token):
+    token = convert.to_address(token)
+    dag = PricingDAG(chain.height)
+    dag.expand([token])
+    underlying = CToken(token).underlying.address
+    assert dag.underlyings[token] == [underlying]
+    levels = dag.levels
+    token_level = [i for i, level in enumerate(levels) if token in level][0]
+    underlying_level = [i for i, level in enumerate(levels) if underlying in level][0]
+    assert underlying_level < token_level, 'underlyings must be priced before their wrappers'
@@ -0,0 +1,71 @@
+import pytest
+from tests.prices.utils.test_registry_index import _pairs
+from y import convert
+from y.prices.utils import bucket_store, buckets, fingerprint
+from y.prices.utils.bucket_store import SQLiteBucketStore
+from y.prices.utils.buckets import _check_bucket
+from y.prices.utils.fingerprint import Fingerprint
+
+# PUSH4 0xa9059cbb, PUSH1 0xf4, which is data rather than a DELEGATECALL
+DISPATCHER = bytes.fromhex('63a9059cbb' + '60f4')
+
+
+@pytest.fixture
+def store(tmp_path):
+    old_store = bucket_store.get_bucket_store()
+    bucket_store.set_bucket_store(SQLiteBucketStore(str(tmp_path / 'buckets.sqlite')))
+    yield
+    bucket_store.set_bucket_store(old_store)
+
+
+def _only(monkeypatch, allowed):
+    '''
+    Makes every check in `BUCKET_CHECKS` except the one for `allowed` fail the test if it is made.
+    '''
+    def fail(token_address):
+        raise AssertionError(f'{token_address} shares code with a token we classified, so this check should be skipped')
+    monkeypatch.setattr(buckets, 'BUCKET_CHECKS', [(bucket, check if bucket == allowed else fail) for bucket, check in buckets.BUCKET_CHECKS])
+
+
+def test_fingerprint_learnable():
+    fp = Fingerprint(DISPATCHER)
+    assert not fp.delegates, 'pushed bytes are not opcodes'
+    assert fp.learnable
+
+def test_fingerprint_delegatecall():
+    fp = Fingerprint(DISPATCHER + bytes.fromhex('f4'))
+    assert fp.delegates
+    assert not fp.learnable, 'code that delegates can run code that is not its own'
+
+def test_known_bucket_needs_fetched_code(monkeypatch):
+    def send_batch(jsonrpc_batch):
+        raise AssertionError('known_bucket should not fetch code')
+    monkeypatch.setattr(fingerprint.jsonrpc, 'send_batch', send_batch)
+    assert fingerprint.known_bucket('0x000000000000000000000000000000000000dEaD') is None
+
+def test_learned_bucket_skips_every_check(store, monkeypatch):
+    first, second = [convert.to_address(pair) for pair, supply in _pairs(10) if supply][:2]
+    fingerprint.fingerprints([first, second])
+    # pretend we learned a bucket that follows from the code alone
+    fingerprint.learn(first, 'gelato')
+    _only(monkeypatch, None)
+    assert _check_bucket(second) == 'gelato'
+
+def test_learned_template_makes_one_check(store, monkeypatch):
+    first, second = [convert.to_address(pair) for pair, supply in _pairs(10) if supply][:2]
+    fingerprint.fingerprints([first, second])
+    assert fingerprint.fingerprints([first])[first].code_hash == fingerprint.fingerprints([second])[second].code_hash
+    fingerprint.learn(first, _check_bucket(first))
+    _only(monkeypatch, 'uni or uni-like lp')
+    assert _check_bucket(second) == 'uni or uni-like lp'
+
+def test_learned_template_still_checks_state(store):
+    pairs = _pairs(500, newest=True)
+    fps = fingerprint.fingerprints(pair for pair, _ in pairs)
+    with_supply = {fps[convert.to_address(pair)].code_hash: convert.to_address(pair) for pair, supply in pairs if supply}
+    empty = [convert.to_address(pair) for pair, supply in pairs if supply == 0 and fps[convert.to_address(pair)].code_hash in with_supply]
+    if not empty:
+        pytest.skip('no pair without supply among the newest pairs')
+    fingerprint.learn(with_supply[fps[empty[0]].code_hash], 'uni or uni-like lp')
+    assert fingerprint.known_bucket(empty[0]) == 'uni or uni-like lp'
+    assert _check_bucket(empty[0]) != 'uni or uni-like lp', 'a pair without supply is not a pool, whatever its code'
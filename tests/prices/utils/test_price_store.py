@@ -0,0 +1,27 @@
+
+from brownie import chain
+from y.constants import WRAPPED_GAS_COIN
+from y.prices.utils import price_store
+from y.prices.utils.price_store import SQLitePriceStore
+from y.utils.cache import CONFIRMATIONS
+
+
+def test_sqlite_price_store(tmp_path):
+    store = SQLitePriceStore(str(tmp_path / 'prices.sqlite'))
+    assert store.get(WRAPPED_GAS_COIN, 1) is None
+    store.set(WRAPPED_GAS_COIN, 1, 1234.5)
+    store.set_many(WRAPPED_GAS_COIN, {2: 1, 3: 2})
+    assert store.get(WRAPPED_GAS_COIN, 1) == 1234.5
+    assert store.get_many(WRAPPED_GAS_COIN, [1, 2, 3, 4]) == {1: 1234.5, 2: 1, 3: 2}
+
+def test_price_store_finality(tmp_path):
+    store = SQLitePriceStore(str(tmp_path / 'prices.sqlite'))
+    old_store = price_store.get_price_store()
+    price_store.set_price_store(store)
+    try:
+        final, recent = chain.height - CONFIRMATIONS - 1, chain.height
+        price_store.save_many(WRAPPED_GAS_COIN, [(final, 1), (recent, 2)])
+        assert price_store.lookup(WRAPPED_GAS_COIN, final) == 1, 'finalized prices should be saved'
+        assert price_store.lookup(WRAPPED_GAS_COIN, recent) is None, 'prices near the chain head should not be saved'
+    finally:
+        price_store.set_price_store(old_store)
@@ -0,0 +1,75 @@
+import pytest
+from tests.prices.lending.test_compound import CTOKENS
+from y import convert
+from y.prices.dex.uniswap import uniswap_multiplexer
+from y.prices.utils import bucket_store, registry_index
+from y.prices.utils.bucket_store import SQLiteBucketStore
+from y.prices.utils.buckets import _check_bucket
+from y.utils.multicall import (multicall_same_func_no_input,
+                               multicall_same_func_same_contract_different_inputs)
+from y.utils.raw_calls import raw_call
+
+
+def _pairs(count: int, newest: bool = False):
+    '''
+    Returns the first, or newest, `count` pairs on each uniswap factory with their supplies.
+    '''
+    pairs = []
+    for router in uniswap_multiplexer.routers.values():
+        end = raw_call(router.factory, 'allPairsLength()', output='int')
+        inputs = list(range(max(end - count, 0), end)) if newest else list(range(min(count, end)))
+        pairs += multicall_same_func_same_contract_different_inputs(router.factory, 'allPairs(uint256)(address)', inputs=inputs)
+    return list(zip(pairs, multicall_same_func_no_input(pairs, 'totalSupply()(uint)', return_None_on_failure=True)))
+
+
+def test_registry_index(tmp_path):
+    old_store = bucket_store.get_bucket_store()
+    bucket_store.set_bucket_store(SQLiteBucketStore(str(tmp_path / 'buckets.sqlite')))
+    try:
+        assert registry_index.update() > 0
+        ctokens = [convert.to_address(token) for token in CTOKENS]
+        buckets = bucket_store.lookup_many(ctokens)
+        assert all(buckets.get(token) == 'compound' for token in ctokens)
+        assert registry_index.update() == 0, 'a second update should only index new tokens'
+    finally:
+        bucket_store.set_bucket_store(old_store)
+
+def test_registry_index_agrees_with_check_bucket(tmp_path):
+    old_store = bucket_store.get_bucket_store()
+    bucket_store.set_bucket_store(SQLiteBucketStore(str(tmp_path / 'buckets.sqlite')))
+    try:
+        registry_index.update()
+        pairs = [pair for pair, supply in _pairs(5) if supply]
+        tokens = [convert.to_address(token) for token in CTOKENS + pairs]
+        indexed = bucket_store.lookup_many(tokens)
+        for token in tokens:
+            assert indexed.get(token) == _check_bucket(token), f'the index and check_bucket disagree on {token}'
+    finally:
+        bucket_store.set_bucket_store(old_store)
+
+def test_registry_index_overwrites_unclassified(tmp_path):
+    old_store = bucket_store.get_bucket_store()
+    bucket_store.set_bucket_store(SQLiteBucketStore(str(tmp_path / 'buckets.sqlite')))
+    try:
+        ctoken = convert.to_address(CTOKENS[0])
+        bucket_store.save(ctoken, None)
+        registry_index.update()
+        assert bucket_store.lookup_many([ctoken]) == {ctoken: 'compound'}
+    finally:
+        bucket_store.set_bucket_store(old_store)
+
+def test_registry_index_skips_pairs_without_supply(tmp_path):
+    # pairs that were created but never got any liquidity are common among the newest pairs
+    empty = [convert.to_address(pair) for pair, supply in _pairs(500, newest=True) if supply == 0]
+    if not empty:
+        pytest.skip('no pair without supply among the newest pairs')
+    old_store = bucket_store.get_bucket_store()
+    bucket_store.set_bucket_store(SQLiteBucketStore(str(tmp_path / 'buckets.sqlite')))
+    try:
+        registry_index.update()
+        indexed = bucket_store.lookup_many(empty)
+        for pair in empty:
+            assert pair not in indexed, f'{pair} has no supply, so its bucket depends on state and should not be indexed'
+            assert _check_bucket(pair) != 'uni or uni-like lp'
+    finally:
+        bucket_store.set_bucket_store(old_store)
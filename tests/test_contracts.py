@@ -0,0 +1,20 @@
+from tests.prices.lending.test_compound import CTOKENS
+from y import convert
+from y.contracts import prefetch_methods
+from y.prices.utils.buckets import PROBES
+from y.utils import multicall
+
+
+def test_prefetch_methods_probes_failed_calls_again(monkeypatch):
+    ctoken = convert.to_address(CTOKENS[0])
+    def multicall_in_chunks(calls, block=None, require_success=True):
+        # as if every call ran out of gas inside the multicall
+        return {call.returns[0][0]: None for call in calls}
+    monkeypatch.setattr(multicall, 'multicall_in_chunks', multicall_in_chunks)
+    with prefetch_methods([(ctoken, 'isCToken()(bool)'), (ctoken, 'pricePerShare()(uint)')]) as results:
+        assert results[(ctoken, 'isCToken()(bool)')] is True, 'a probe that failed in the multicall should be sent again on its own'
+        assert results[(ctoken, 'pricePerShare()(uint)')] is None
+
+def test_probes_have_no_inputs():
+    for method in PROBES:
+        assert method.startswith(method.split('(')[0] + '()'), f'{method} takes inputs, it cannot be prefetched'
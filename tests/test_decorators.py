@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+from y.decorators import single_flight
+from y.exceptions import DeadlineExceeded
+from y.utils import deadline
+
+
+def _start(target):
+    results = {}
+    def run():
+        try:
+            results['result'] = target()
+        except Exception as e:
+            results['exception'] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, results
+
+
+def test_single_flight_follower_keeps_its_own_deadline():
+    release = threading.Event()
+
+    @single_flight
+    def slow(x):
+        release.wait(10)
+        return x
+
+    leader, leader_results = _start(lambda: slow(1))
+    time.sleep(0.1)
+    start = time.monotonic()
+    with deadline.time_limit(0.2) as limit:
+        with pytest.raises(DeadlineExceeded) as e:
+            slow(1)
+    assert e.value.limit is limit
+    assert time.monotonic() - start < 1, 'the follower should stop waiting when its own deadline runs out'
+    release.set()
+    leader.join()
+    assert leader_results == {'result': 1}
+
+
+def test_single_flight_leader_deadline_is_not_shared():
+    calls = []
+
+    @single_flight
+    def slow(x):
+        calls.append(threading.get_ident())
+        deadline.check('slow')
+        time.sleep(0.3)
+        deadline.check('slow')
+        return x
+
+    def lead():
+        with deadline.time_limit(0.1):
+            return slow(1)
+
+    leader, leader_results = _start(lead)
+    time.sleep(0.05)
+    # no deadline of its own, so it should run `slow` again instead of failing with the leader's deadline
+    assert slow(1) == 1
+    leader.join()
+    assert isinstance(leader_results['exception'], DeadlineExceeded)
+    assert len(calls) == 2
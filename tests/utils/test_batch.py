@@ -0,0 +1,34 @@
+from concurrent.futures import Future
+
+from brownie import chain
+from eth_abi import encode_abi
+from eth_utils import encode_hex
+from eth_utils import function_signature_to_4byte_selector as fourbyte
+from y.utils import batch
+
+CALLS = [
+    {'to': '0x6B175474E89094C44Da98b954EedeAC495271d0F', 'data': '0x06fdde03'},
+    {'to': '0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48', 'data': '0x06fdde03'},
+]
+
+
+def test_batch_sends_failed_calls_again_alone():
+    sent = []
+    def make_request(method, params):
+        sent.append(params[0]['data'])
+        if params[0]['data'].startswith(batch.TRY_AGGREGATE):
+            # the second call fails inside the aggregate, ie because the aggregate ran low on gas
+            return {'jsonrpc': '2.0', 'id': 0, 'result': encode_hex(encode_abi(['(bool,bytes)[]'], [[(True, b'\x01'), (False, b'')]]))}
+        return {'jsonrpc': '2.0', 'id': 0, 'result': '0x02'}
+
+    futures = [Future() for _ in CALLS]
+    batch._send(make_request, list(zip(CALLS, futures)), hex(chain.height))
+    assert futures[0].result(timeout=5) == {'jsonrpc': '2.0', 'id': 0, 'result': '0x01'}
+    assert futures[1].result(timeout=5) == {'jsonrpc': '2.0', 'id': 0, 'result': '0x02'}, 'a call that failed in the aggregate should get the answer it gets on its own'
+    assert len(sent) == 2
+
+def test_batch_sends_aggregate3_as_it_is():
+    tx = {'to': '0xcA11bde05977b3631167028862bE2a173976CA11', 'data': encode_hex(fourbyte('aggregate3((address,bool,bytes)[])')) + '00' * 64}
+    with batch.batch():
+        assert not batch.should_batch('eth_call', [tx, hex(chain.height)]), 'multicall3 aggregates should go straight to the node'
+        assert batch.should_batch('eth_call', [CALLS[0], hex(chain.height)])
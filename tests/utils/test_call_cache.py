@@ -0,0 +1,60 @@
+import pytest
+from brownie import chain, web3
+from y.utils import call_cache
+from y.utils.call_cache import SQLiteCallCache
+from y.utils.middleware import cache_middleware
+
+DAI = '0x6B175474E89094C44Da98b954EedeAC495271d0F'
+TX = {'to': DAI, 'data': '0x06fdde03'}
+# a method DAI doesn't have
+MISSING = {'to': DAI, 'data': '0xdeadbeef'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    old_store = call_cache.get_call_cache()
+    store = SQLiteCallCache(str(tmp_path / 'calls.sqlite'))
+    call_cache.set_call_cache(store)
+    yield store
+    call_cache.set_call_cache(old_store)
+
+
+def test_cache_key_at_final_block(store, monkeypatch):
+    monkeypatch.setattr(call_cache, 'is_finalized', lambda block: True)
+    monkeypatch.setattr(call_cache.block_hashes, 'hash_of', lambda block: pytest.fail('a final block is keyed by its number'))
+    block = chain.height - 1_000
+    assert call_cache.cache_key('eth_call', [TX, hex(block)]) == call_cache.cache_key('eth_call', [TX, block])
+    assert call_cache.cache_key('eth_call', [TX, hex(block)]) != call_cache.cache_key('eth_call', [TX, hex(block - 1)])
+
+def test_cache_key_at_block_near_head(store, monkeypatch):
+    hashes = {100: '0xaa'}
+    monkeypatch.setattr(call_cache, 'is_finalized', lambda block: False)
+    monkeypatch.setattr(call_cache.block_hashes, 'hash_of', lambda block: hashes.get(block))
+    key = call_cache.cache_key('eth_call', [TX, hex(100)])
+    assert key is not None
+    hashes[100] = '0xbb'
+    assert call_cache.cache_key('eth_call', [TX, hex(100)]) not in [key, None], 'a reorged block should not match the calls cached for the block it replaced'
+    assert call_cache.cache_key('eth_call', [TX, hex(101)]) is None, "we can't cache a call at a block whose hash we don't know"
+
+def test_cache_key_skips_uncacheable_calls(store):
+    block = hex(chain.height - 1_000)
+    assert call_cache.cache_key('eth_call', [TX, 'latest']) is None
+    assert call_cache.cache_key('eth_call', [{**TX, 'gas': '0x1'}, block]) is None
+    assert call_cache.cache_key('eth_getCode', [DAI, block]) is None
+
+def test_cached_revert_is_raised_again(store):
+    sent = []
+    def make_request(method, params):
+        sent.append(params)
+        return web3.provider.make_request(method, params)
+
+    middleware = cache_middleware(make_request, web3)
+    params = [MISSING, hex(chain.height - 1_000)]
+    response = middleware('eth_call', params)
+    assert 'error' in response
+    assert middleware('eth_call', params) == {'jsonrpc': '2.0', 'id': 0, 'error': response['error']}
+    assert len(sent) == 1, 'the revert should come from the cache the second time'
+    with pytest.raises(ValueError):
+        web3.eth.call(MISSING, chain.height - 1_000)
+    with pytest.raises(ValueError):
+        web3.eth.call(MISSING, chain.height - 1_000)
@@ -0,0 +1,84 @@
+import numpy as np
+from eth_abi import encode_abi
+from y.utils.codec import FunctionCodec, decode_aggregate_columns, static_output_types
+
+ADDRESS = '0x6b175474e89094c44da98b954eedeac495271d0f'
+
+
+def _aggregate(types, results):
+    # a `tryAggregate` response, `None` for a call that failed
+    return encode_abi(['(bool,bytes)[]'], [[(False, b'') if values is None else (True, encode_abi(types, values)) for values in results]])
+
+def _abi(inputs, outputs):
+    return {
+        'name': 'fn',
+        'type': 'function',
+        'stateMutability': 'view',
+        'inputs': [{'name': f'in{i}', 'type': type_str} for i, type_str in enumerate(inputs)],
+        'outputs': [{'name': '', 'type': type_str} for type_str in outputs],
+    }
+
+
+def test_decode_aggregate_columns():
+    types = ['uint256', 'int24', 'address', 'bool']
+    results = [
+        [2 ** 200 + 7, -5, ADDRESS, True],
+        None,
+        [2 ** 64 - 1, 2 ** 23 - 1, '0x' + '00' * 20, False],
+    ]
+    columns, success = decode_aggregate_columns(_aggregate(types, results), types)
+    assert success.tolist() == [True, False, True]
+    assert columns[0].tolist() == [2 ** 200 + 7, 0, 2 ** 64 - 1]
+    assert columns[1].dtype == np.int64
+    assert columns[1].tolist() == [-5, 0, 2 ** 23 - 1]
+    assert columns[2].tolist() == [ADDRESS.encode(), b'0x' + b'00' * 20, ('0x' + '00' * 20).encode()]
+    assert columns[3].tolist() == [True, False, False]
+
+def test_decode_aggregate_columns_limbs():
+    # values over 64 bits are built from 64 bit limbs, every limb should land in the right place
+    types = ['uint256', 'int256', 'uint128']
+    results = [
+        [2 ** 256 - 1, -1, 2 ** 128 - 1],
+        [2 ** 192 + 2 ** 128 + 2 ** 64 + 1, -(2 ** 255), 2 ** 64],
+        [0, 2 ** 255 - 1, 1],
+    ]
+    columns, success = decode_aggregate_columns(_aggregate(types, results), types)
+    assert success.all()
+    assert [column.tolist() for column in columns] == [list(column) for column in zip(*results)]
+
+def test_decode_aggregate_columns_uint64():
+    columns, _ = decode_aggregate_columns(_aggregate(['uint64', 'int64'], [[2 ** 64 - 1, -(2 ** 63)]]), ['uint64', 'int64'])
+    assert columns[0].dtype == np.uint64
+    assert columns[0].tolist() == [2 ** 64 - 1]
+    assert columns[1].tolist() == [-(2 ** 63)]
+
+def test_decode_aggregate_columns_wrong_length_is_a_failure():
+    # a call that succeeded but returned something else, ie a proxy with a fallback, is not decoded
+    response = encode_abi(['(bool,bytes)[]'], [[(True, encode_abi(['uint256'], [1])), (True, b'')]])
+    columns, success = decode_aggregate_columns(response, ['uint256', 'uint256'])
+    assert success.tolist() == [False, False]
+    assert columns[0].tolist() == [0, 0]
+
+def test_decode_aggregate_columns_empty():
+    columns, success = decode_aggregate_columns(_aggregate(['uint256'], []), ['uint256'])
+    assert len(success) == len(columns[0]) == 0
+
+def test_function_codec_signed_and_large_outputs():
+    codec = FunctionCodec(_abi(['address', 'uint256'], ['int256', 'uint256', 'int8']))
+    assert codec.signature == 'fn(address,uint256)'
+    values = [-(2 ** 200), 2 ** 255 + 3, -128]
+    assert list(codec.decode_output(encode_abi(['int256', 'uint256', 'int8'], values))) == values
+    assert codec.decode_raw(encode_abi(['int256', 'uint256', 'int8'], values)) == tuple(values)
+
+def test_function_codec_single_output():
+    codec = FunctionCodec(_abi([], ['int128']))
+    assert codec.decode_output(encode_abi(['int128'], [-(2 ** 100)])) == -(2 ** 100)
+    assert codec.encode_input() == codec.selector
+
+def test_function_codec_encode_input():
+    codec = FunctionCodec(_abi(['address', 'uint256'], ['uint256']))
+    assert codec.encode_input(ADDRESS, 2 ** 70) == codec.selector + encode_abi(['address', 'uint256'], [ADDRESS, 2 ** 70]).hex()
+
+def test_static_output_types():
+    assert static_output_types('getReserves()((uint112,uint112,uint32))') == ['uint112', 'uint112', 'uint32']
+    assert static_output_types('slot0()(uint160,int24,uint16,uint16,uint16,uint8,bool)')[1] == 'int24'
@@ -0,0 +1,84 @@
+import pytest
+from y.exceptions import DeadlineExceeded
+from y.utils import call_cache, deadline, jsonrpc
+
+REQUESTS = [
+    {'jsonrpc': '2.0', 'id': 'a', 'method': 'eth_call', 'params': [{'to': '0x6B175474E89094C44Da98b954EedeAC495271d0F', 'data': '0x06fdde03'}, hex(block)]}
+    for block in range(12_000_000, 12_000_008)
+]
+
+
+def _result(request):
+    return {'jsonrpc': '2.0', 'id': request['id'], 'result': request['params'][1]}
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    old_store = call_cache.get_call_cache()
+    call_cache.set_call_cache(None)
+    monkeypatch.setattr(jsonrpc, '_endpoint', lambda: 'http://node')
+    monkeypatch.setattr(jsonrpc, '_batch_sizes', {})
+    monkeypatch.setattr(jsonrpc, 'JSONRPC_BATCH_MAX_REQUESTS', len(REQUESTS))
+    yield
+    call_cache.set_call_cache(old_store)
+
+
+def test_send_batch_splits_batches_that_are_too_large(endpoint, monkeypatch):
+    posted = []
+    def post(chunk):
+        posted.append(len(chunk))
+        if len(chunk) > 2:
+            raise ValueError({'code': -32600, 'message': 'batch limit 2 exceeded'})
+        return [{'jsonrpc': '2.0', 'id': i, 'result': request['params'][1]} for i, request in enumerate(chunk)]
+    monkeypatch.setattr(jsonrpc, '_post', post)
+    assert jsonrpc.send_batch(REQUESTS) == [_result(request) for request in REQUESTS]
+    assert posted == [8, 4, 2, 2, 4, 2, 2]
+    assert jsonrpc._batch_size() == 2, 'the next batch should start out at the size the provider took'
+    assert jsonrpc.send_batch(REQUESTS) == [_result(request) for request in REQUESTS]
+    assert posted[7:] == [2, 2, 2, 2]
+
+def test_too_large():
+    assert jsonrpc._too_large(ValueError({'code': -32600, 'message': 'batch too large'}))
+    assert jsonrpc._too_large(ValueError({'code': -32600, 'message': 'Batch size limit exceeded'}))
+    assert jsonrpc._too_large(ValueError('413 Client Error: Payload Too Large for url: http://node'))
+    assert not jsonrpc._too_large(ValueError({'code': -32005, 'message': 'rate limit exceeded for batch requests'})), 'a rate limit is not a reason to shrink the batch'
+    assert not jsonrpc._too_large(ValueError('500 Server Error: Internal Server Error'))
+
+def test_send_batch_falls_back_to_one_request_at_a_time(endpoint, monkeypatch):
+    sent = []
+    def post(chunk):
+        raise ValueError('500 Server Error: Internal Server Error')
+    def send_one(request):
+        sent.append(request)
+        return _result(request)
+    monkeypatch.setattr(jsonrpc, '_post', post)
+    monkeypatch.setattr(jsonrpc, '_send_one', send_one)
+    monkeypatch.setattr(jsonrpc.time, 'sleep', lambda seconds: None)
+    assert jsonrpc.send_batch(REQUESTS) == [_result(request) for request in REQUESTS]
+    assert sent == REQUESTS
+    assert jsonrpc._batch_size() == len(REQUESTS), 'a batch that failed for another reason should not shrink the limit'
+
+def test_send_batch_sends_dropped_requests_again_alone(endpoint, monkeypatch):
+    sent = []
+    def post(chunk):
+        # the provider drops every other request from the batch
+        return [{'jsonrpc': '2.0', 'id': i, 'result': request['params'][1]} for i, request in enumerate(chunk) if i % 2]
+    def send_one(request):
+        sent.append(request)
+        return _result(request)
+    monkeypatch.setattr(jsonrpc, '_post', post)
+    monkeypatch.setattr(jsonrpc, '_send_one', send_one)
+    assert jsonrpc.send_batch(REQUESTS) == [_result(request) for request in REQUESTS]
+    assert sent == REQUESTS[::2]
+
+def test_send_batch_retries_stop_at_the_deadline(endpoint, monkeypatch):
+    posted = []
+    def post(chunk):
+        posted.append(chunk)
+        raise ValueError('500 Server Error: Internal Server Error')
+    monkeypatch.setattr(jsonrpc, '_post', post)
+    monkeypatch.setattr(jsonrpc.time, 'sleep', lambda seconds: pytest.fail('we should not sleep past the deadline'))
+    with deadline.time_limit(0.5):
+        with pytest.raises(DeadlineExceeded):
+            jsonrpc.send_batch(REQUESTS)
+    assert len(posted) == 1
@@ -0,0 +1,89 @@
+import joblib
+import pytest
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from y.utils import kv_cache
+from y.utils.kv_cache import SQLiteMemory, migrate_joblib, packb, unpackb
+
+CALLS = []
+
+
+def _double(x, y=1):
+    CALLS.append((x, y))
+    return x * 2 * y
+
+def _contract_like(contract):
+    return str(contract)
+
+
+class _Address(str):
+    pass
+
+
+@pytest.fixture
+def memory(tmp_path):
+    CALLS.clear()
+    return SQLiteMemory(str(tmp_path / 'kv.sqlite'))
+
+
+@pytest.mark.parametrize('value', [
+    None,
+    True,
+    1.5,
+    'dai',
+    b'\x00\x01',
+    -(2 ** 63),
+    2 ** 64 - 1,
+    2 ** 256 - 1,
+    -(2 ** 255),
+    (1, 'a', (2, 3)),
+    [1, [2, (3,)]],
+    {'a': 1, 2: 'b'},
+    HexBytes('0x1234'),
+    AttributeDict({'number': 1, 'hash': HexBytes('0xab'), 'logs': [AttributeDict({'data': '0x'})]}),
+])
+def test_packb_round_trip(value):
+    unpacked = unpackb(packb(value))
+    assert unpacked == value
+    assert type(unpacked) is type(value)
+
+def test_packb_subclasses_come_back_as_the_builtin():
+    unpacked = unpackb(packb(_Address('0x6B175474E89094C44Da98b954EedeAC495271d0F')))
+    assert unpacked == '0x6B175474E89094C44Da98b954EedeAC495271d0F'
+    assert type(unpacked) is str
+
+def test_packb_unsupported():
+    with pytest.raises(TypeError):
+        packb(object())
+
+def test_cache_keys_fill_in_defaults(memory):
+    cached = memory.cache(_double)
+    assert cached(2) == cached(x=2) == cached(2, y=1) == 4
+    assert cached(2, 3) == 12
+    assert CALLS == [(2, 1), (2, 3)]
+
+def test_cache_drops_results_when_the_code_changes(memory, monkeypatch):
+    memory.cache(_double)(2)
+    monkeypatch.setattr(kv_cache, '_version', lambda func: 'changed')
+    memory.cache(_double)(2)
+    assert CALLS == [(2, 1), (2, 1)]
+
+def test_migrate_joblib(memory, tmp_path):
+    location = str(tmp_path / 'joblib cache')
+    old = joblib.Memory(location, verbose=0)
+    old.cache(_double)(2)
+    old.cache(_double)(x=3, y=2)
+    old.cache(_contract_like)(object())
+    CALLS.clear()
+
+    cached = memory.cache(_double)
+    memory.cache(_contract_like)
+    assert migrate_joblib(memory, location) == 2, "results whose arguments joblib didn't record as literals are skipped"
+    assert cached(2) == 4
+    assert cached(3, 2) == 12
+    assert CALLS == [], 'migrated results should be read from the new cache'
+    assert (tmp_path / 'joblib cache' / 'joblib').is_dir(), 'the joblib cache should be left as it was'
+
+def test_migrate_joblib_without_a_joblib_cache(memory, tmp_path):
+    memory.cache(_double)
+    assert migrate_joblib(memory, str(tmp_path / 'nothing here')) == 0
@@ -0,0 +1,54 @@
+import pytest
+from y.utils import lens
+from y.utils.lens import FAILED
+
+VAULT = '0xBA12222222228d8Ba445958a75a0704d566BF2C8'
+TOKENS = ['0x6B175474E89094C44Da98b954EedeAC495271d0F', '0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48']
+POOL_IDS = [bytes([i]) * 32 for i in range(3)]
+
+
+def _words(tokens, balances):
+    return [len(tokens)] + [word for token, balance in zip(tokens, balances) for word in (int(token, 16), balance)]
+
+
+@pytest.fixture
+def multicall(monkeypatch):
+    asked = []
+    def pool_tokens_with_multicall(vault, pool_ids, block):
+        asked.extend(pool_ids)
+        return [([TOKENS[0]], [pool_id[0]]) for pool_id in pool_ids]
+    monkeypatch.setattr(lens, '_pool_tokens_with_multicall', pool_tokens_with_multicall)
+    return asked
+
+
+def test_balancer_pool_tokens_refetches_failed_pools(monkeypatch, multicall):
+    packed = _words(TOKENS, [1, 2]) + [FAILED] + _words(TOKENS[:1], [3])
+    monkeypatch.setattr(lens.BALANCER_V2_POOL_TOKENS, 'call_in_chunks', lambda items, build_args, block=None: packed)
+    assert lens.balancer_v2_pool_tokens(VAULT, POOL_IDS) == [
+        (TOKENS, [1, 2]),
+        ([TOKENS[0]], [1]),
+        (TOKENS[:1], [3]),
+    ]
+    assert multicall == [POOL_IDS[1]], 'only the pool the lens could not read should go to the vault'
+
+def test_balancer_pool_tokens_without_the_lens(monkeypatch, multicall):
+    def call_in_chunks(items, build_args, block=None):
+        raise ValueError('state overrides are not supported')
+    monkeypatch.setattr(lens.BALANCER_V2_POOL_TOKENS, 'call_in_chunks', call_in_chunks)
+    assert lens.balancer_v2_pool_tokens(VAULT, POOL_IDS) == [([TOKENS[0]], [i]) for i in range(3)]
+    assert multicall == POOL_IDS
+
+def test_uniswap_v2_reserves_failed(monkeypatch):
+    packed = [(5 << 128) | 7, FAILED]
+    monkeypatch.setattr(lens.UNISWAP_V2_RESERVES, 'call_in_chunks', lambda items, build_args, block=None: packed)
+    assert lens.uniswap_v2_reserves(TOKENS) == [(5, 7), None]
+
+def test_lens_chunks(monkeypatch):
+    calls = []
+    def call(*args, block=None):
+        calls.append(args)
+        return list(args[0])
+    monkeypatch.setattr(lens.UNISWAP_V2_RESERVES, 'max_inputs', 2)
+    monkeypatch.setattr(lens.UNISWAP_V2_RESERVES, 'call', call)
+    assert lens.UNISWAP_V2_RESERVES.call_in_chunks([1, 2, 3, 4, 5], lambda chunk: (chunk,)) == [1, 2, 3, 4, 5]
+    assert sorted(calls) == [([1, 2],), ([3, 4],), ([5],)]
@@ -0,0 +1,80 @@
+import pytest
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from y.utils import log_store
+from y.utils.log_store import SQLiteLogStore
+
+FILTER = log_store.filter_key('0x6B175474E89094C44Da98b954EedeAC495271d0F', [HexBytes('0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef')])
+
+
+def _log(block, index=0):
+    return AttributeDict({'blockNumber': block, 'logIndex': index, 'data': '0x'})
+
+
+@pytest.fixture
+def store(tmp_path):
+    old_store = log_store.get_log_store()
+    store = SQLiteLogStore(str(tmp_path / 'logs.sqlite'))
+    log_store.set_log_store(store)
+    yield store
+    log_store.set_log_store(old_store)
+
+
+def test_add_merges_ranges(store):
+    store.add(FILTER, 100, 199, [])
+    store.add(FILTER, 300, 399, [])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(100, 199), (300, 399)]
+    # touching on one side
+    store.add(FILTER, 200, 249, [])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(100, 249), (300, 399)]
+    # overlapping both
+    store.add(FILTER, 150, 350, [])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(100, 399)]
+    # inside
+    store.add(FILTER, 120, 130, [])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(100, 399)]
+    # covering
+    store.add(FILTER, 0, 1_000, [])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(0, 1_000)]
+
+def test_add_keeps_filters_apart(store):
+    other = log_store.filter_key('0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48', [])
+    store.add(FILTER, 100, 199, [_log(150)])
+    store.add(other, 200, 299, [_log(250)])
+    assert store.get_ranges(FILTER, 0, 1_000) == [(100, 199)]
+    assert store.get_logs(FILTER, 0, 1_000) == [_log(150)]
+
+def test_get_logs_in_order(store):
+    store.add(FILTER, 100, 199, [_log(150, 3), _log(120), _log(150, 1)])
+    assert store.get_logs(FILTER, 0, 1_000) == [_log(120), _log(150, 1), _log(150, 3)]
+    assert store.get_logs(FILTER, 140, 1_000) == [_log(150, 1), _log(150, 3)]
+
+def test_lookup_gaps(store):
+    assert log_store.lookup(FILTER, 0, 999) == ([], [(0, 999)])
+    store.add(FILTER, 100, 199, [_log(150)])
+    store.add(FILTER, 300, 399, [_log(300), _log(399)])
+    assert log_store.lookup(FILTER, 0, 999) == ([_log(150), _log(300), _log(399)], [(0, 99), (200, 299), (400, 999)])
+    assert log_store.lookup(FILTER, 150, 350) == ([_log(150), _log(300)], [(200, 299)])
+    assert log_store.lookup(FILTER, 100, 199) == ([_log(150)], [])
+    assert log_store.lookup(FILTER, 199, 300) == ([_log(300)], [(200, 299)])
+
+def test_lookup_skips_logs_in_gaps(store):
+    # the logs are there but their range isn't, as if another process is partway through writing it
+    store.add(FILTER, 100, 199, [_log(150)])
+    store.execute('DELETE FROM log_ranges')
+    assert log_store.lookup(FILTER, 0, 999) == ([], [(0, 999)])
+
+def test_lookup_without_a_store(store):
+    log_store.set_log_store(None)
+    assert log_store.lookup(FILTER, 0, 999) == ([], [(0, 999)])
+
+def test_save_skips_blocks_that_are_not_final(store, monkeypatch):
+    monkeypatch.setattr(log_store, 'finalized_block', lambda: 250)
+    log_store.save(FILTER, 100, 300, [_log(150), _log(260)])
+    assert log_store.lookup(FILTER, 100, 300) == ([_log(150)], [(251, 300)])
+    log_store.save(FILTER, 260, 300, [_log(260)])
+    assert log_store.lookup(FILTER, 100, 300) == ([_log(150)], [(251, 300)])
+
+def test_filter_key():
+    assert log_store.filter_key(['0xB', '0xa'], []) == log_store.filter_key(['0xA', '0xb'], [])
+    assert log_store.filter_key('0xAB', []) == log_store.filter_key('0xab', [])
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+from brownie import chain, web3
+from eth_utils import encode_hex
+from y.contracts import Contract
+from y.networks import Network
+from y.utils import multicall
+from y.utils.multicall import ChunkLimits
+
+DAI = '0x6B175474E89094C44Da98b954EedeAC495271d0F'
+
+
+def _limits(max_calls=1_000, max_bytes=128_000, max_gas=40_000_000):
+    limits = ChunkLimits()
+    limits.max_calls, limits.max_bytes, limits.max_gas = max_calls, max_bytes, max_gas
+    return limits
+
+
+def test_chunk_by_calls():
+    assert _limits(max_calls=3).chunk(list(range(7)), lambda item: 4) == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_chunk_by_bytes():
+    sizes = {'a': 60, 'b': 60, 'c': 10, 'd': 100}
+    assert _limits(max_bytes=128).chunk(list(sizes), sizes.get) == [['a', 'b'], ['c', 'd']]
+
+def test_chunk_by_gas():
+    # each call is guessed at `GAS_PER_CALL` plus its calldata
+    gas = multicall._estimate_gas(4)
+    assert _limits(max_gas=gas * 2).chunk(list(range(5)), lambda item: 4) == [[0, 1], [2, 3], [4]]
+
+def test_chunk_item_over_the_limits_goes_alone():
+    assert _limits(max_bytes=10).chunk(['a', 'b'], lambda item: 100) == [['a'], ['b']]
+    assert _limits().chunk([], lambda item: 4) == []
+
+def test_shrink_halves_what_the_multicall_held():
+    limits = _limits()
+    limits.shrink(calls=100, calldata_bytes=4_000, gas=3_000_000)
+    assert (limits.max_calls, limits.max_bytes, limits.max_gas) == (50, 2_000, 1_500_000)
+    # a bigger multicall failing later never raises the limits
+    limits.shrink(calls=400, calldata_bytes=40_000, gas=30_000_000)
+    assert (limits.max_calls, limits.max_bytes, limits.max_gas) == (50, 2_000, 1_500_000)
+    limits.shrink(calls=1, calldata_bytes=1, gas=1)
+    assert (limits.max_calls, limits.max_bytes, limits.max_gas) == (1, 1, 1)
+
+def test_limits_grow_back_after_successes():
+    limits = _limits()
+    limits.shrink(calls=100, calldata_bytes=4_000, gas=3_000_000)
+    for _ in range(limits.grow_after - 1):
+        limits.succeeded()
+    assert limits.max_calls == 50
+    limits.succeeded()
+    assert (limits.max_calls, limits.max_bytes, limits.max_gas) == (56, 2_201, 1_650_001)
+
+def test_limits_grow_no_further_than_where_they_started():
+    limits = ChunkLimits()
+    limits.shrink(calls=multicall.MULTICALL_MAX_CALLS, calldata_bytes=multicall.MULTICALL_MAX_BYTES, gas=multicall.MULTICALL_MAX_GAS)
+    for _ in range(limits.grow_after * 20):
+        limits.succeeded()
+    assert (limits.max_calls, limits.max_bytes, limits.max_gas) == (multicall.MULTICALL_MAX_CALLS, multicall.MULTICALL_MAX_BYTES, multicall.MULTICALL_MAX_GAS)
+
+def test_a_failure_resets_the_successes():
+    limits = _limits()
+    for _ in range(limits.grow_after - 1):
+        limits.succeeded()
+    limits.shrink(calls=100, calldata_bytes=4_000, gas=3_000_000)
+    limits.succeeded()
+    assert limits.max_calls == 50
+
+def test_send_in_chunks_in_parallel(monkeypatch):
+    monkeypatch.setattr(multicall, 'chunk_limits', lambda: _limits(max_calls=2))
+    threads = set()
+    def send(chunk):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.1)
+        return [item * 10 for item in chunk]
+    start = time.perf_counter()
+    assert multicall._send_in_chunks(list(range(8)), send, lambda item: 4) == [[0, 10], [20, 30], [40, 50], [60, 70]]
+    assert len(threads) > 1
+    assert time.perf_counter() - start < 0.35, 'the chunks should be sent at the same time'
+
+def test_send_in_chunks_splits_chunks_that_are_too_large(monkeypatch):
+    limits = _limits(max_calls=4)
+    monkeypatch.setattr(multicall, 'chunk_limits', lambda: limits)
+    sent = []
+    def send(chunk):
+        sent.append(chunk)
+        if len(chunk) > 1:
+            raise ValueError('out of gas')
+        return {chunk[0]: chunk[0] * 10}
+    assert multicall._send_in_chunks(['a', 'b', 'c'], send, lambda item: 4) == [{'a': 'a' * 10, 'b': 'b' * 10, 'c': 'c' * 10}]
+    assert sent == [['a', 'b', 'c'], ['a'], ['b', 'c'], ['b'], ['c']]
+    assert limits.max_calls == 1
+
+def test_send_in_chunks_raises_other_errors(monkeypatch):
+    monkeypatch.setattr(multicall, 'chunk_limits', lambda: _limits())
+    def send(chunk):
+        raise ValueError('execution reverted')
+    with pytest.raises(ValueError):
+        multicall._send_in_chunks(['a', 'b'], send, lambda item: 4)
+
+def test_multicall3_before_deployment():
+    if not multicall.multicall3:
+        pytest.skip('multicall3 is not on this chain')
+    block = multicall.multicall3_deploy_block - 1
+    tx, state_override = multicall._aggregate_tx([(DAI, True, bytes.fromhex('18160ddd'))], block)
+    assert tx['to'] == multicall.MULTICALL3
+    assert state_override == {multicall.MULTICALL3: {'code': encode_hex(web3.eth.get_code(multicall.MULTICALL3))}}
+    assert multicall._aggregate_tx([(DAI, True, bytes.fromhex('18160ddd'))], block + 1)[1] is None
+    assert multicall._aggregate_tx([(DAI, True, bytes.fromhex('18160ddd'))], None)[1] is None
+    if chain.id == Network.Mainnet:
+        assert multicall.multicall_same_func_no_input([DAI], 'totalSupply()(uint)', block=block) == [Contract(DAI).totalSupply(block_identifier=block)]
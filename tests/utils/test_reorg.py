@@ -0,0 +1,139 @@
+import pytest
+from y.utils import reorg
+from y.utils.reorg import BlockHashes, reorg_cache
+
+
+class _Chain:
+    '''
+    A chain of fake headers that we can reorg.
+    '''
+
+    def __init__(self, height):
+        self.hashes = {}
+        self.fetched = []
+        self.extend(0, height)
+
+    def extend(self, start, end, fork=''):
+        for number in range(start, end + 1):
+            self.hashes[number] = f'0x{fork}{number}'
+        self.head = end
+
+    def fetch(self, block_identifiers):
+        self.fetched.extend(block_identifiers)
+        numbers = [self.head if block_identifier == 'latest' else int(block_identifier, 16) for block_identifier in block_identifiers]
+        return [(number, self.hashes[number], self.hashes.get(number - 1, '0x')) for number in numbers]
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = _Chain(1_000)
+    monkeypatch.setattr(reorg, '_fetch_headers', chain.fetch)
+    return chain
+
+
+def test_block_hashes_first_sync(chain):
+    hashes = BlockHashes(window=5, sync_interval=0)
+    assert [hashes.hash_of(number) for number in range(995, 1_002)] == [None, '0x996', '0x997', '0x998', '0x999', '0x1000', None]
+    assert hashes.head == 1_000
+
+def test_block_hashes_fetch_only_new_blocks(chain):
+    hashes = BlockHashes(window=5, sync_interval=0)
+    hashes.sync()
+    chain.fetched.clear()
+    chain.extend(1_001, 1_003)
+    hashes.sync()
+    assert chain.fetched == ['latest', hex(1_001), hex(1_002)]
+    assert hashes.hash_of(1_003) == '0x1003'
+    # blocks that left the window are still known
+    assert hashes.hash_of(996) == '0x996'
+    assert hashes.reorgs == 0
+
+def test_block_hashes_reorg(chain):
+    hashes = BlockHashes(window=5, sync_interval=0)
+    assert hashes.hash_of(999) == '0x999'
+    chain.extend(998, 1_001, fork='f')
+    assert [hashes.hash_of(number) for number in range(997, 1_002)] == ['0x997', '0xf998', '0xf999', '0xf1000', '0xf1001']
+    assert hashes.reorgs == 1
+
+def test_block_hashes_start_over_after_a_long_gap(chain):
+    hashes = BlockHashes(window=5, sync_interval=0)
+    hashes.sync()
+    chain.extend(1_001, 1_100)
+    chain.fetched.clear()
+    hashes.sync()
+    assert len(chain.fetched) == 5, 'we only need the blocks in the window'
+    assert hashes.hash_of(1_096) == '0x1096'
+
+def test_block_hashes_sync_interval(chain):
+    hashes = BlockHashes(window=5, sync_interval=60)
+    hashes.sync()
+    chain.extend(1_001, 1_001)
+    assert hashes.hash_of(1_001) is None, 'we should not sync again until the interval has passed'
+    hashes.sync(force=True)
+    assert hashes.hash_of(1_001) == '0x1001'
+
+def test_block_hashes_unknown_when_sync_fails(monkeypatch):
+    def fetch(block_identifiers):
+        raise ValueError('node is down')
+    monkeypatch.setattr(reorg, '_fetch_headers', fetch)
+    assert BlockHashes(window=5, sync_interval=0).hash_of(1_000) is None
+
+
+@pytest.fixture
+def near_head(monkeypatch):
+    hashes = {100: '0xaa'}
+    finalized = set()
+    monkeypatch.setattr(reorg, 'is_finalized', lambda block: block in finalized)
+    monkeypatch.setattr(reorg.block_hashes, 'hash_of', lambda block: hashes.get(block))
+    return hashes, finalized
+
+
+def _counted(maxsize=128):
+    calls = []
+    @reorg_cache(maxsize=maxsize)
+    def price(token, block=None):
+        calls.append((token, block))
+        return len(calls)
+    return price, calls
+
+def test_reorg_cache_near_head(near_head):
+    hashes, _ = near_head
+    price, calls = _counted()
+    assert price('dai', 100) == price('dai', block=100) == 1
+    hashes[100] = '0xbb'
+    assert price('dai', 100) == 2, 'a result for a reorged block should be recomputed'
+    assert price('dai', 100) == 2
+
+def test_reorg_cache_skips_blocks_without_a_hash(near_head):
+    price, calls = _counted()
+    price('dai', 101)
+    price('dai', 101)
+    price('dai')
+    price('dai')
+    assert len(calls) == 4
+
+def test_reorg_cache_promotes_final_blocks(near_head, monkeypatch):
+    hashes, finalized = near_head
+    price, calls = _counted()
+    price('dai', 100)
+    finalized.add(100)
+    assert price('dai', 100) == 1
+    monkeypatch.setattr(reorg.block_hashes, 'hash_of', lambda block: pytest.fail('a promoted result needs no hash'))
+    assert price('dai', 100) == 1
+    finalized.add(50)
+    assert price('dai', 50) == price('dai', 50) == 2
+
+def test_reorg_cache_maxsize(near_head):
+    _, finalized = near_head
+    finalized.update(range(10))
+    price, calls = _counted(maxsize=2)
+    for block in [1, 2, 1, 3, 1, 2]:
+        price('dai', block)
+    assert calls == [('dai', 1), ('dai', 2), ('dai', 3), ('dai', 2)]
+    price.cache_clear()
+    price('dai', 1)
+    assert len(calls) == 5
+
+def test_reorg_cache_needs_a_block_argument():
+    with pytest.raises(TypeError):
+        reorg_cache()(lambda token: token)
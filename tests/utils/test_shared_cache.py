@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+import pytest
+from y.utils import shared_cache
+from y.utils.shared_cache import CacheServer, SharedCache, UnixSocketCache
+
+
+class _DictCache(SharedCache):
+    def __init__(self):
+        self.values = {}
+        self.down = False
+
+    def get_many(self, keys):
+        if self.down:
+            raise ConnectionError('down')
+        return {key: self.values[key] for key in keys if key in self.values}
+
+    def set_many(self, values):
+        if self.down:
+            raise ConnectionError('down')
+        self.values.update(values)
+
+
+@pytest.fixture
+def cache():
+    old_cache = shared_cache.get_shared_cache()
+    cache = _DictCache()
+    shared_cache.set_shared_cache(cache)
+    yield cache
+    shared_cache.set_shared_cache(old_cache)
+
+
+def test_namespaces(cache):
+    shared_cache.save_many('calls', {b'a': b'1'})
+    shared_cache.save_many('prices', {b'a': b'2'})
+    assert shared_cache.lookup_many('calls', [b'a', b'b']) == {b'a': b'1'}
+    assert shared_cache.lookup_many('prices', [b'a']) == {b'a': b'2'}
+    assert all(key.startswith(b'ypricemagic:') for key in cache.values)
+
+def test_failures_never_raise(cache):
+    shared_cache.save_many('calls', {b'a': b'1'})
+    cache.down = True
+    assert shared_cache.lookup_many('calls', [b'a']) == {}
+    cache.down = False
+    assert shared_cache.lookup_many('calls', [b'a']) == {}, 'we should leave the cache alone for a while after it fails'
+    shared_cache.save_many('calls', {b'b': b'2'})
+    assert len(cache.values) == 1
+    shared_cache.set_shared_cache(cache)
+    assert shared_cache.lookup_many('calls', [b'a']) == {b'a': b'1'}
+
+def test_no_shared_cache(cache):
+    shared_cache.set_shared_cache(None)
+    shared_cache.save_many('calls', {b'a': b'1'})
+    assert shared_cache.lookup_many('calls', [b'a']) == {}
+
+
+def test_server_evicts_least_recently_used():
+    server = CacheServer('unused', max_mb=1)
+    server.max_bytes = 25
+    server._respond('set', [(b'a', b'1' * 9), (b'b', b'2' * 9)])
+    assert server._respond('get', [b'a']) == [b'1' * 9]
+    server._respond('set', [(b'c', b'3' * 9)])
+    assert server._respond('get', [b'a', b'b', b'c']) == [b'1' * 9, None, b'3' * 9]
+    # replacing a value counts its new size, not both
+    server._respond('set', [(b'c', b'4')])
+    assert server._respond('stats', None) == {'entries': 2, 'bytes': 12, 'hits': 3, 'misses': 1}
+    with pytest.raises(ValueError):
+        server._respond('delete', [b'a'])
+
+def test_unix_socket_round_trip(tmp_path):
+    path = str(tmp_path / 'c.sock')
+    threading.Thread(target=CacheServer(path).serve_forever, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, 'the cache server did not start'
+        time.sleep(0.01)
+
+    client = UnixSocketCache(path)
+    client.set_many({b'a': b'1', b'b': b'2' * 100_000})
+    assert client.get_many([b'a', b'b', b'c']) == {b'a': b'1', b'b': b'2' * 100_000}
+    # each thread gets its own connection
+    results = []
+    thread = threading.Thread(target=lambda: results.append(client.get_many([b'a'])))
+    thread.start()
+    thread.join()
+    assert results == [{b'a': b'1'}]
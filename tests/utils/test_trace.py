@@ -0,0 +1,34 @@
+from joblib.parallel import Parallel, delayed
+from y.utils import trace
+
+TOKEN = '0x6B175474E89094C44Da98b954EedeAC495271d0F'
+TX = {'to': TOKEN, 'data': '0x06fdde03'}
+
+
+def _request(block):
+    trace.record_request('eth_call', [TX, block], 0.1)
+
+
+def test_requests_from_workers_keep_the_pricing_stack():
+    def price(token, block=None):
+        Parallel(4, 'threading')(delayed(trace.propagate(_request))(hex(i)) for i in range(8))
+        return 1
+
+    with trace.trace() as t:
+        trace.source('test source', price, TOKEN, 123)
+    assert len(t.requests) == 8
+    for request in t.requests:
+        assert (request.token, request.source) == (TOKEN, 'test source')
+        assert request.path == ((TOKEN, 'test source'),)
+    assert [source.source for source in t.sources] == ['test source']
+
+def test_propagate_restores_the_worker_stack():
+    def nested(token, block=None):
+        return trace.propagate(trace._path)()
+
+    with trace.trace():
+        assert trace.source('outer', nested, TOKEN, None) == ((TOKEN, 'outer'),)
+        assert trace._path() == ()
+
+def test_propagate_without_a_trace():
+    assert trace.propagate(_request) is _request
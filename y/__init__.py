@@ -7,18 +7,22 @@ from y.constants import dai, usdc, wbtc, weth
 from y.contracts import Contract, has_method, has_methods
 from y.erc20 import decimals, totalSupply, totalSupplyReadable
 from y.exceptions import (CalldataPreparationError, CallReverted,
-                          ContractNotVerified, MessedUpBrownieContract,
-                          NetworkNotSpecified, NonStandardERC20,
-                          NotABalancerV2Pool, NotAUniswapV2Pool, PriceError,
-                          UnsupportedNetwork)
+                          ContractNotVerified, DeadlineExceeded,
+                          MessedUpBrownieContract, NetworkNotSpecified,
+                          NonStandardERC20, NotABalancerV2Pool,
+                          NotAUniswapV2Pool, PriceError, UnsupportedNetwork)
 from y.networks import Network
 from y.prices import magic
-from y.prices.magic import get_price, get_prices
+from y.prices.magic import (get_price, get_price_async, get_price_matrix,
+                            get_prices, get_prices_async, get_prices_at_blocks)
+from y.prices.watcher import PriceWatcher
+from y.utils.batch import batch
 from y.utils.multicall import fetch_multicall
 from y.utils.raw_calls import _balanceOf as balanceOf
 from y.utils.raw_calls import _balanceOfReadable as balanceOfReadable
 from y.utils.raw_calls import _symbol as symbol
 from y.utils.raw_calls import raw_call
+from y.utils.trace import trace
 
 __all__ = [
     ### you can reach the below functions, classes, and variables using ###
@@ -38,6 +42,11 @@ __all__ = [
     # prices
     'get_price',
     'get_prices',
+    'get_price_async',
+    'get_prices_async',
+    'get_prices_at_blocks',
+    'get_price_matrix',
+    'PriceWatcher',
 
     # constants
     'weth',
@@ -47,6 +56,7 @@ __all__ = [
 
     # multicall
     'fetch_multicall',
+    'batch',
 
     # raw calls
     'decimals',
@@ -59,6 +69,9 @@ __all__ = [
 
     # time
     'time',
+
+    # tracing
+    'trace',
 ]
 
 if not network.is_connected():
@@ -1,7 +1,7 @@
 
 import logging
 from functools import cached_property, lru_cache
-from typing import Any, Optional, Union
+from typing import Any, List, Optional, Union
 
 import brownie
 from brownie.exceptions import ContractNotFound
@@ -16,6 +16,7 @@ from y.exceptions import ContractNotVerified, MessedUpBrownieContract
 from y.prices import magic
 from y.typing import AnyAddressType, Block
 from y.utils.raw_calls import _name, _symbol
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -108,7 +109,7 @@ class ERC20(ContractBase):
         return 10 ** self._decimals(block=block)
 
     @log(logger)
-    @lru_cache
+    @reorg_cache()
     def total_supply(self, block: Optional[Block] = None) -> int:
         return totalSupply(self.address, block=block)
     
@@ -124,6 +125,14 @@ class ERC20(ContractBase):
             fail_to_None=return_None_on_failure
         )
 
+    @log(logger)
+    def prices_at_blocks(self, blocks: List[Block], return_None_on_failure: bool = False) -> List[Optional[UsdPrice]]:
+        return magic.get_prices_at_blocks(
+            self.address,
+            blocks,
+            fail_to_None=return_None_on_failure
+        )
+
 class WeiBalance:
     def __init__(
         self, balance: int,
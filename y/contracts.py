@@ -1,7 +1,9 @@
 import logging
 import threading
+from contextlib import contextmanager
 from functools import lru_cache
-from typing import Any, Callable, List, Optional, Union
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Tuple, Union)
 
 import brownie
 from brownie import chain, web3
@@ -9,6 +11,7 @@ from brownie.exceptions import CompilerError, ContractNotFound
 from brownie.typing import AccountsType
 from hexbytes import HexBytes
 from multicall import Call, Multicall
+from multicall.signature import Signature
 
 from y import convert
 from y.decorators import auto_retry, log
@@ -176,12 +179,14 @@ def has_method(address: Address, method: str, return_response: bool = False) ->
     `return_response=True` will return `response` in bytes if `response` else `False`
     '''
     address = convert.to_address(address)
-    try:
-        response = Call(address, [method], [['key', None]])()['key']
-    except Exception as e:
-        if call_reverted(e):
-            return False
-        raise
+    prefetched, response = _prefetched_response(address, method)
+    if not prefetched:
+        try:
+            response = Call(address, [method], [['key', None]])()['key']
+        except Exception as e:
+            if call_reverted(e):
+                return False
+            raise
     
     if response is None:
         return False
@@ -204,6 +209,13 @@ def has_methods(
     assert func in [all, any], '`func` must be either `any` or `all`'
 
     address = convert.to_address(address)
+    prefetched = [_prefetched_response(address, method) for method in methods]
+    if all(found for found, _ in prefetched):
+        return func([response is not None for _, response in prefetched])
+    if func == all and any(found and response is None for found, response in prefetched):
+        # one of the methods is missing, we don't need to call the others
+        return False
+
     calls = [Call(address, [method], [[method, None]]) for method in methods]
     try:
         response = Multicall(calls, require_success=False)().values()
@@ -216,6 +228,77 @@ def has_methods(
         return False if func == all else any(has_method(address, method) for method in methods)
 
 
+# `prefetch_methods` fills these with probe results, which `has_method` and `has_methods` use before calling the chain
+_prefetched: List[Dict[Tuple[Address, str], Any]] = []
+_prefetched_lock = threading.Lock()
+
+
+@contextmanager
+def prefetch_methods(probes: Iterable[Tuple[AnyAddressType, str]]) -> Iterator[Dict[Tuple[Address, str], Any]]:
+    '''
+    Calls each `(address, method)` in `probes` using as few multicalls as possible.
+    Inside the `with` block, `has_method` and `has_methods` answer these probes from the results instead of calling the chain.
+    Yields the results, with `None` for each probe that failed.
+
+    A call can fail inside a big multicall for reasons of its own, ie the multicall ran low on gas, and `has_method` caches
+    a missing method for good. So each probe that failed in a multicall is sent again on its own, all of them in one JSON-RPC batch,
+    and only counts as failed if it fails there too.
+    '''
+    results = {}
+    probes = list(dict.fromkeys((convert.to_address(address), method) for address, method in probes))
+    if probes:
+        # imported here to avoid a circular import
+        from y.utils.multicall import multicall_in_chunks
+        block = chain.height
+        calls = [Call(address, [method], [[(address, method), None]]) for address, method in probes]
+        try:
+            results.update(multicall_in_chunks(calls, block=block, require_success=False))
+            failed = [probe for probe in probes if results.get(probe) is None]
+            if failed:
+                results.update(zip(failed, _probe_alone(failed, block)))
+        except Exception as e:
+            logger.warning(f'unable to prefetch {len(calls)} probes. {e.__class__.__name__}: {e}')
+            # a probe that succeeded did so on its own merits, the rest are left for `has_method` and `has_methods`
+            results = {probe: response for probe, response in results.items() if response is not None}
+
+    with _prefetched_lock:
+        _prefetched.append(results)
+    try:
+        yield results
+    finally:
+        with _prefetched_lock:
+            _prefetched.remove(results)
+
+
+def _probe_alone(probes: List[Tuple[Address, str]], block: Block) -> List[Any]:
+    '''
+    Sends each `(address, method)` in `probes` as its own `eth_call`. Returns `None` for each probe that failed.
+    '''
+    # imported here to avoid a circular import
+    from y.utils import jsonrpc
+    signatures = [Signature(method) for _, method in probes]
+    jsonrpc_batch = [
+        {'jsonrpc': '2.0', 'id': i, 'method': 'eth_call', 'params': [{'to': address, 'data': HexBytes(signature.encode_data(None)).hex()}, hex(block)]}
+        for i, ((address, _), signature) in enumerate(zip(probes, signatures))
+    ]
+    results = []
+    for signature, response in zip(signatures, jsonrpc.send_batch(jsonrpc_batch)):
+        data = HexBytes(response.get('result') or b'')
+        try:
+            results.append(signature.decode_data(data)[0] if data else None)
+        except Exception:
+            # it returned something, but not what the method should return
+            results.append(None)
+    return results
+
+
+def _prefetched_response(address: Address, method: str) -> Tuple[bool, Any]:
+    for results in list(_prefetched):
+        if (address, method) in results:
+            return True, results[(address, method)]
+    return False, None
+
+
 @log(logger)
 def probe(
     address: AnyAddressType, 
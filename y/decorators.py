@@ -1,9 +1,11 @@
 
 import logging
+import threading
+from functools import wraps
 from random import randrange
 from sqlite3 import OperationalError
 from time import sleep
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Optional
 
 from requests.exceptions import HTTPError, ReadTimeout
 
@@ -101,6 +103,120 @@ def auto_retry(func):
                     raise
                 retry_logger.warning(f'{str(e)} [{i}]')
             i += 1
+            # don't sleep through a `get_price` deadline
+            from y.utils import deadline
+            deadline.check(f'retrying {func.__name__} after a {i * sleep_time}s sleep', seconds=i * sleep_time)
             sleep(i * sleep_time)
 
     return retry_wrap
+
+
+class _Flight:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+        # the leader ran out of its own time. its followers may have more, so they try again.
+        self.expired = False
+
+    def wait(self) -> Any:
+        '''
+        Waits for the leader, but no longer than the caller's own deadline allows.
+        '''
+        from y.utils import deadline
+        deadline.wait(self.done, self.name)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+# one lock for every `single_flight` function so we can detect waits that would deadlock
+_flights_lock = threading.Lock()
+# {thread ident: the flight that thread is waiting on}
+_waiting: Dict[int, _Flight] = {}
+
+
+def _would_deadlock(flight: _Flight) -> bool:
+    '''
+    Returns `True` if waiting on `flight` would make the current thread wait on itself.
+    This happens with recursive calls and with cycles like A -> B -> A across threads.
+    '''
+    me = threading.get_ident()
+    owner = flight.owner
+    while owner != me:
+        if owner not in _waiting:
+            return False
+        owner = _waiting[owner].owner
+    return True
+
+
+def single_flight(func: Callable) -> Callable:
+    '''
+    Decorates a function so concurrent calls with the same args share one in-flight computation.
+
+    The first caller does the work. Callers that arrive while it is running wait for its result, or its exception,
+    instead of starting the same work again. Once the call finishes, the next call with those args starts fresh,
+    so stack this on top of a cache.
+
+    Each caller keeps its own `y.utils.deadline` limit. A caller stops waiting when its own limit runs out,
+    and if the first caller runs out of time, the callers waiting on it try again themselves.
+
+    Calls with unhashable args, and calls that would wait on their own thread, just run `func` directly.
+    '''
+
+    in_flight: Dict[Any, _Flight] = {}
+
+    @wraps(func)
+    def single_flight_wrap(*args: Any, **kwargs: Any) -> Any:
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return func(*args, **kwargs)
+
+        while True:
+            with _flights_lock:
+                flight = in_flight.get(key)
+                if flight is None:
+                    flight = in_flight[key] = _Flight(func.__name__)
+                    leader = True
+                elif _would_deadlock(flight):
+                    flight, leader = None, False
+                else:
+                    _waiting[threading.get_ident()] = flight
+                    leader = False
+
+            if flight is None:
+                return func(*args, **kwargs)
+
+            if leader:
+                break
+
+            try:
+                result = flight.wait()
+            finally:
+                with _flights_lock:
+                    del _waiting[threading.get_ident()]
+            if not flight.expired:
+                return result
+            # the first follower back becomes the new leader, under its own deadline
+
+        from y.exceptions import DeadlineExceeded
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result
+        except DeadlineExceeded:
+            # a deadline only ever belongs to one caller, so we don't hand it to the others
+            flight.expired = True
+            raise
+        except BaseException as e:
+            flight.exception = e
+            raise
+        finally:
+            with _flights_lock:
+                del in_flight[key]
+            flight.done.set()
+
+    return single_flight_wrap
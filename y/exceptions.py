@@ -13,6 +13,12 @@ class NetworkNotSpecified(Exception):
 class PriceError(Exception):
     pass
 
+class DeadlineExceeded(PriceError):
+    def __init__(self, *args: object, limit: object = None) -> None:
+        super().__init__(*args)
+        # the `time_limit` that expired, see `y.utils.deadline`
+        self.limit = limit
+
 class UnsupportedNetwork(Exception):
     pass
 
@@ -99,6 +105,25 @@ def continue_if_call_reverted(e: Exception) -> None:
 def out_of_gas(e: Exception) -> bool:
     return 'out of gas' in str(e) 
 
+
+@log(logger)
+def call_too_large(e: Exception) -> bool:
+    '''
+    Returns `True` if `e` means a request was too big for the node, so the same calls might succeed in smaller batches.
+    '''
+    triggers = [
+        'too large',
+        'Too Large',
+        'execution aborted (timeout',
+        'out of gas',
+        'gas required exceeds',
+        'exceeds block gas limit',
+        'response size exceeded',
+        'Read timed out',
+        '413 Client Error',
+    ]
+    return any(trigger in str(e) for trigger in triggers)
+
 # Provider Exceptions:
 
 class NodeNotSynced(Exception):
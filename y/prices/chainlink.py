@@ -1,19 +1,22 @@
 import logging
 from functools import cached_property, lru_cache
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from brownie import ZERO_ADDRESS, chain
-from cachetools.func import ttl_cache
 from y import convert
 from y.classes.common import ERC20
 from y.classes.singleton import Singleton
 from y.contracts import Contract
 from y.datatypes import UsdPrice
-from y.decorators import log
+from y.decorators import log, single_flight
 from y.exceptions import UnsupportedNetwork
 from y.networks import Network
 from y.typing import Address, AnyAddressType, Block
 from y.utils.events import create_filter, decode_logs, get_logs_asap
+from y.utils.multicall import (batch_call_same_func_at_blocks,
+                               multicall_same_func_no_input)
+from y.utils.raw_calls import raw_call
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -138,6 +141,7 @@ class Chainlink(metaclass=Singleton):
             self.registry = Contract(registries[chain.id])
         
     @cached_property
+    @single_flight
     @log(logger)
     def feeds(self) -> Dict[ERC20, str]:
         if chain.id in registries:
@@ -167,12 +171,19 @@ class Chainlink(metaclass=Singleton):
     def get_feed(self, asset: Address) -> Contract:
         return Contract(self.feeds[convert.to_address(asset)])
 
+    @log(logger)
+    def aggregator(self, asset: AnyAddressType) -> Address:
+        '''
+        Returns the aggregator behind `asset`'s feed. The aggregator, not the feed, emits `AnswerUpdated`.
+        '''
+        return raw_call(self.feeds[convert.to_address(asset)], 'aggregator()', output='address')
+
     @log(logger)
     def __contains__(self, asset: AnyAddressType) -> bool:
         return convert.to_address(asset) in self.feeds
 
-    @ttl_cache(maxsize=None, ttl=600)
     @log(logger)
+    @reorg_cache(maxsize=10_000)
     def get_price(self, asset, block: Optional[Block] = None) -> UsdPrice:
         asset = convert.to_address(asset)
         if asset == ZERO_ADDRESS:
@@ -184,6 +195,26 @@ class Chainlink(metaclass=Singleton):
         except ValueError:
             return None
     
+    @log(logger)
+    def get_prices_at_blocks(self, asset: AnyAddressType, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        asset = convert.to_address(asset)
+        scale = self.feed_scale(asset)
+        answers = batch_call_same_func_at_blocks(self.feeds[asset], 'latestAnswer()(int256)', blocks, return_None_on_failure=True)
+        return [None if answer is None else UsdPrice(answer / scale) for answer in answers]
+
+    @log(logger)
+    def get_prices(self, assets: List[AnyAddressType], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+        '''
+        Prices many assets at `block`, reading all of their feeds in one multicall.
+        '''
+        assets = [convert.to_address(asset) for asset in assets]
+        feeds = list({self.feeds[asset] for asset in assets})
+        answers = dict(zip(feeds, multicall_same_func_no_input(feeds, 'latestAnswer()(int256)', block=block, return_None_on_failure=True)))
+        return [
+            None if answers[self.feeds[asset]] is None else UsdPrice(answers[self.feeds[asset]] / self.feed_scale(asset))
+            for asset in assets
+        ]
+    
     @lru_cache(maxsize=None)
     def feed_decimals(self, asset: AnyAddressType) -> int:
         asset = convert.to_address(asset)
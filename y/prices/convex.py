@@ -1,5 +1,5 @@
 
-from typing import Optional
+from typing import List, Optional
 
 from brownie.convert.datatypes import EthAddress
 from y.datatypes import UsdPrice
@@ -18,3 +18,9 @@ def is_convex_lp(token_address: EthAddress) -> bool:
 
 def get_price(token_address: EthAddress, block: Optional[Block] = None) -> UsdPrice:
     return magic.get_price(MAPPING[token_address],block)
+
+def get_prices_at_blocks(token_address: EthAddress, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+    return magic.get_prices_at_blocks(MAPPING[token_address], blocks, fail_to_None=True)
+
+def get_prices(token_addresses: List[EthAddress], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+    return magic.get_prices([MAPPING[token_address] for token_address in token_addresses], block, fail_to_None=True, silent=True)
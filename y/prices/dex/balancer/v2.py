@@ -14,8 +14,9 @@ from y.datatypes import UsdPrice, UsdValue
 from y.decorators import log
 from y.networks import Network
 from y.typing import Address, AnyAddressType, Block
+from y.utils import deadline
 from y.utils.events import decode_logs, get_logs_asap
-from y.utils.multicall import fetch_multicall
+from y.utils.lens import balancer_v2_pool_tokens
 from y.utils.raw_calls import raw_call
 
 logger = logging.getLogger(__name__)
@@ -65,15 +66,18 @@ class BalancerV2Vault(ContractBase):
         return {event['poolId'].hex():event['poolAddress'] for event in events}
     
     @lru_cache(maxsize=10)
-    def get_pool_info(self, poolids: Tuple[HexBytes,...], block: Optional[Block] = None) -> List[Tuple]:
-        return fetch_multicall(*[[self.contract,'getPoolTokens',poolId] for poolId in poolids], block=block)
+    def get_pool_info(self, poolids: Tuple[HexBytes,...], block: Optional[Block] = None) -> List[Optional[Tuple[List[Address], List[int]]]]:
+        '''
+        Returns `(tokens, balances)` for each pool in `poolids`, or `None` if the vault doesn't know the pool.
+        '''
+        return balancer_v2_pool_tokens(self.address, poolids, block=block)
 
     @log(logger)
     def deepest_pool_for(self, token_address: Address, block: Optional[Block] = None) -> Tuple[Optional[EthAddress],int]:
         pools = self.list_pools(block=block)
-        poolids = (poolid for poolid, pool in pools.items() if _is_standard_pool(pool))
+        poolids = tuple(poolid for poolid, pool in pools.items() if _is_standard_pool(pool))
         pools_info = self.get_pool_info(poolids, block=block)
-        pools_info = {self.list_pools(block=block)[poolid]: info for poolid, info in zip(poolids, pools_info) if str(info) != "((), (), 0)"}
+        pools_info = {pools[poolid]: info for poolid, info in zip(poolids, pools_info) if info and info[0]}
         
         deepest_pool = {'pool': None, 'balance': 0}
         for pool, info in pools_info.items():
@@ -168,6 +172,8 @@ def _is_standard_pool(pool: EthAddress) -> bool:
     Returns `False` if `build_name(pool) in ['ConvergentCurvePool','MetaStablePool']`, else `True`
     '''
     
+    deadline.check(f'checking balancer v2 pool {pool}')
+
     # With `return_None_on_failure=True`, if `build_name(pool)` fails,
     # we can't know for sure that its a standard pool, but... it probably is.
     return build_name(pool, return_None_on_failure=True) not in ['ConvergentCurvePool','MetaStablePool']
@@ -1,18 +1,18 @@
 
 import logging
-from typing import Optional
+from typing import Any, List, Optional
 
-from brownie import ZERO_ADDRESS, chain, multicall, web3
+from brownie import ZERO_ADDRESS, chain
 from y.constants import weth
 from y.contracts import Contract
 from y.datatypes import UsdPrice
 from y.decorators import log
 from y import convert
 from y.prices import magic
-from y.typing import Block, AnyAddressType
+from y.typing import Address, AnyAddressType, Block
 from y.utils.cache import memory
-from y.utils.multicall import multicall2
-from y.utils.raw_calls import _decimals, _totalSupplyReadable
+from y.utils.multicall import eth_balance_call, fetch_multicall
+from y.utils.raw_calls import _decimals
 
 logger = logging.getLogger(__name__)
 
@@ -38,47 +38,33 @@ def is_mooniswap_pool(token: AnyAddressType) -> bool:
 def get_pool_price(token: AnyAddressType, block: Optional[Block] = None) -> UsdPrice:
     address = convert.to_address(token)
     token = Contract(address)
-    if block >= 12336033 and chain.id == 1:
-        with multicall(address=multicall2.address, block_identifier = block):
-            token0_address = token.token0()
-            token1_address = token.token1()
-            totalSupply = _totalSupplyReadable(address,block)
-            if token0_address == ZERO_ADDRESS:
-                token1 = Contract(token1_address)
-                bal0 = web3.eth.get_balance(token.address) / 10 ** 18
-                bal1 = token1.balanceOf(token) / 10 ** _decimals(token1_address,block)
-            elif token1_address == ZERO_ADDRESS:
-                token0 = Contract(token0_address)
-                bal0 = token0.balanceOf(token) / 10 ** _decimals(token0_address,block)
-                bal1 = web3.eth.get_balance(token.address) / 10 ** 18
-            else:
-                token0, token1 = Contract(token0_address), Contract(token1_address)
-                bal0 = token0.balanceOf(token) / 10 ** _decimals(token0_address,block)
-                bal1 = token1.balanceOf(token) / 10 ** _decimals(token1_address,block)
-    else:
-        token0_address = token.token0(block_identifier = block)
-        token1_address = token.token1(block_identifier = block)
-        totalSupply = _totalSupplyReadable(address,block)
-        if token0_address == ZERO_ADDRESS:
-            token1 = Contract(token1_address)
-            bal0 = web3.eth.get_balance(token.address, block_identifier = block) / 10 ** 18
-            bal1 = token1.balanceOf(token, block_identifier = block) / 10 ** _decimals(token1_address,block)
-        elif token1_address == ZERO_ADDRESS:
-            token0 = Contract(token0_address)
-            bal0 = token0.balanceOf(token, block_identifier = block) / 10 ** _decimals(token0_address,block)
-            bal1 = web3.eth.get_balance(token.address, block_identifier = block) / 10 ** 18
-        else:
-            token0, token1 = Contract(token0_address), Contract(token1_address)
-            bal0 = token0.balanceOf(token,block_identifier = block) / 10 ** _decimals(token0_address,block)
-            bal1 = token1.balanceOf(token,block_identifier = block) / 10 ** _decimals(token1_address,block)
+    token0_address, token1_address = fetch_multicall([token, 'token0'], [token, 'token1'], block=block, require_success=True)
+    # native balances are read through the multicall contract, so both reserves and the supply come back in one call
+    bal0, bal1, totalSupply = fetch_multicall(
+        _balance_call(token0_address, address),
+        _balance_call(token1_address, address),
+        [token, 'totalSupply'],
+        block=block,
+        require_success=True,
+    )
+    bal0 /= 10 ** _reserve_decimals(token0_address, block)
+    bal1 /= 10 ** _reserve_decimals(token1_address, block)
+    totalSupply /= 10 ** _decimals(address, block)
 
-    if token0_address == ZERO_ADDRESS:
-        token0 = gas_coin
-    if token1_address == ZERO_ADDRESS:
-        token1 = gas_coin
+    token0 = gas_coin if token0_address == ZERO_ADDRESS else Contract(token0_address)
+    token1 = gas_coin if token1_address == ZERO_ADDRESS else Contract(token1_address)
     val0 = bal0 * magic.get_price(token0.address, block)
     val1 = bal1 * magic.get_price(token1.address, block)
     totalVal = val0 + val1
     price = totalVal / totalSupply
     return price
-    
+
+
+def _balance_call(reserve_address: Address, pool: Address) -> List[Any]:
+    if reserve_address == ZERO_ADDRESS:
+        return eth_balance_call(pool)
+    return [Contract(reserve_address), 'balanceOf', pool]
+
+
+def _reserve_decimals(reserve_address: Address, block: Optional[Block]) -> int:
+    return 18 if reserve_address == ZERO_ADDRESS else _decimals(reserve_address, block)
@@ -1,20 +1,25 @@
 import logging
-from typing import Dict, Optional
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
 from brownie import chain
-from cachetools.func import ttl_cache
+from joblib.parallel import Parallel, delayed
 from y import convert
+from y.classes.common import ERC20
 from y.datatypes import UsdPrice
 from y.decorators import log
-from y.exceptions import contract_not_verified
+from y.exceptions import CantFindSwapPath, contract_not_verified
 from y.networks import Network
 from y.prices.dex.uniswap.v1 import UniswapV1
 from y.prices.dex.uniswap.v2 import (NotAUniswapV2Pool, UniswapPoolV2,
-                                     UniswapRouterV2)
+                                     UniswapRouterV2, get_pool_prices)
 from y.prices.dex.uniswap.v2_forks import UNISWAPS
 from y.typing import Address, AnyAddressType, Block
+from y.utils import trace
+from y.utils.lens import uniswap_v2_reserves
 from y.utils.logging import gh_issue_request
-from y.utils.multicall import multicall_same_func_no_input
+from y.utils.multicall import batch_call_same_func_at_blocks
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -50,13 +55,21 @@ class UniswapMultiplexer:
         return self.v1.get_price(token_address, block)
     
     @log(logger)
-    @ttl_cache(ttl=600)
+    @reorg_cache()
     def lp_price(self, token_address: AnyAddressType, block: Optional[Block] = None) -> UsdPrice:
         """ Get Uniswap/Sushiswap LP token price. """
         return UniswapPoolV2(token_address).get_price(block=block)
     
     @log(logger)
-    @ttl_cache(ttl=36000)
+    def lp_prices_at_blocks(self, token_address: AnyAddressType, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        return UniswapPoolV2(token_address).get_prices_at_blocks(blocks)
+
+    @log(logger)
+    def lp_prices(self, token_addresses: List[AnyAddressType], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+        return get_pool_prices([UniswapPoolV2(token_address) for token_address in token_addresses], block=block)
+    
+    @log(logger)
+    @reorg_cache()
     def get_price(self, token_in: AnyAddressType, block: Optional[Block] = None, protocol: Optional[str] = None) -> Optional[UsdPrice]:
         """
         Calculate a price based on Uniswap Router quote for selling one `token_in`.
@@ -79,6 +92,39 @@ class UniswapMultiplexer:
         
         return None
     
+    @log(logger)
+    def get_prices_at_blocks(self, token_in: AnyAddressType, blocks: List[Block], dop: int = 4) -> List[Optional[UsdPrice]]:
+        """
+        Quotes `token_in` at each block in `blocks`.
+        The router and swap path are chosen at each block from the liquidity at that block,
+        then the blocks that share a route are quoted together in one JSON-RPC batch.
+        Blocks where we find no route or the quote fails return `None`.
+        """
+        token_in = convert.to_address(token_in)
+        routes = Parallel(dop, 'threading')(delayed(trace.propagate(self._route))(token_in, block) for block in blocks)
+        blocks_by_route = defaultdict(list)
+        for block, route in zip(blocks, routes):
+            if route is not None:
+                blocks_by_route[route].append(block)
+
+        method = 'getAmountsOut(uint,address[])(uint[])'
+        prices = {}
+        for (router, path), route_blocks in blocks_by_route.items():
+            quotes = batch_call_same_func_at_blocks(router.address, method, route_blocks, inputs=[ERC20(token_in).scale, list(path)], return_None_on_failure=True)
+            scale_out = ERC20(path[-1]).scale
+            fees = 0.997 ** (len(path) - 1)
+            prices.update((block, UsdPrice(quote[-1] / scale_out / fees)) for block, quote in zip(route_blocks, quotes) if quote and quote[-1])
+        return [prices.get(block) for block in blocks]
+
+    def _route(self, token_in: Address, block: Block) -> Optional[Tuple[UniswapRouterV2, Tuple[Address, ...]]]:
+        router = self.deepest_router(token_in, block=block)
+        if router is None:
+            return None
+        try:
+            return router, tuple(router.get_path_to_stables(token_in, block))
+        except CantFindSwapPath:
+            return None
+
 
     @log(logger)
     def deepest_router(self, token_in: AnyAddressType, block: Optional[Block] = None) -> Optional[UniswapRouterV2]:
@@ -97,7 +143,7 @@ class UniswapMultiplexer:
         token_in = convert.to_address(token_in)
 
         pools_to_routers = {pool: router for router in self.routers.values() for pool in router.pools_for_token(token_in)}
-        reserves = multicall_same_func_no_input(pools_to_routers, 'getReserves()((uint112,uint112,uint32))', block=block, return_None_on_failure=True)
+        reserves = uniswap_v2_reserves(pools_to_routers, block=block)
         routers_by_depth = {}
         for router, pool, reserves in zip(pools_to_routers.values(), pools_to_routers.keys(), reserves):
             if reserves is None:
@@ -1,20 +1,19 @@
 
 import logging
 from collections import defaultdict
-from functools import cached_property, lru_cache
+from functools import cached_property
 from typing import Any, Dict, List, Optional, Tuple
 
 import brownie
 from brownie import chain
 from brownie.exceptions import EventLookupError, VirtualMachineError
-from cachetools.func import ttl_cache
 from multicall import Call, Multicall
 from y import convert
 from y.classes.common import ERC20, ContractBase, WeiBalance
 from y.constants import STABLECOINS, WRAPPED_GAS_COIN, sushi, usdc, weth
 from y.contracts import Contract
 from y.datatypes import UsdPrice
-from y.decorators import continue_on_revert, log
+from y.decorators import continue_on_revert, log, single_flight
 from y.exceptions import (CantFindSwapPath, ContractNotVerified,
                           MessedUpBrownieContract, NonStandardERC20,
                           NotAUniswapV2Pool, call_reverted)
@@ -25,10 +24,12 @@ from y.prices.dex.uniswap.v2_forks import (ROUTER_TO_FACTORY,
                                            ROUTER_TO_PROTOCOL, special_paths)
 from y.typing import Address, AddressOrContract, AnyAddressType, Block
 from y.utils.events import decode_logs, get_logs_asap
+from y.utils.lens import uniswap_v2_reserves
 from y.utils.multicall import (
-    fetch_multicall, multicall_same_func_no_input,
+    batch_call_same_func_at_blocks, fetch_multicall, multicall_in_chunks,
     multicall_same_func_same_contract_different_inputs)
 from y.utils.raw_calls import raw_call
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
@@ -38,6 +39,21 @@ Path = List[AddressOrContract]
 Reserves = Tuple[int,int,int]
 
 
+def _sum_vals(vals: List[Optional[float]]) -> Optional[float]:
+    '''
+    Sums the usd value of both sides of a pool.
+    If we can only value one side, we assume the other side is worth the same.
+    '''
+    if not vals[0] or not vals[1]:
+        if vals[0] is not None and not vals[1]:
+            vals[1] = vals[0]
+        if vals[1] is not None and not vals[0]:
+            vals[0] = vals[1]
+
+    if vals[0] is not None and vals[1] is not None:
+        return sum(vals)
+
+
 class UniswapPoolV2(ERC20):
     def __init__(self, address: AnyAddressType) -> None:
         super().__init__(address)
@@ -93,6 +109,25 @@ class UniswapPoolV2(ERC20):
         reserves = Call(self.address, ['getReserves()((uint112,uint112,uint32))'], block_id=block)()
         return (WeiBalance(reserve, token, block=block) for reserve, token in zip(reserves, self.tokens))
 
+    @log(logger)
+    def get_prices_at_blocks(self, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        reserves = batch_call_same_func_at_blocks(self.address, 'getReserves()((uint112,uint112,uint32))', blocks, return_None_on_failure=True)
+        supplies = batch_call_same_func_at_blocks(self.address, 'totalSupply()(uint)', blocks, return_None_on_failure=True)
+        token_prices = zip(*[token.prices_at_blocks(blocks, return_None_on_failure=True) for token in self.tokens])
+
+        prices = []
+        for block_reserves, supply, block_prices in zip(reserves, supplies, token_prices):
+            if block_reserves is None or not supply:
+                prices.append(None)
+                continue
+            vals = [
+                None if price is None else reserve / token.scale * price
+                for reserve, token, price in zip(block_reserves, self.tokens, block_prices)
+            ]
+            tvl = _sum_vals(vals)
+            prices.append(None if tvl is None else UsdPrice(tvl / (supply / self.scale)))
+        return prices
+    
     @log(logger)
     def tvl(self, block: Optional[Block] = None) -> Optional[float]:
         prices = [token.price(block=block, return_None_on_failure=True) for token in self.tokens]
@@ -100,15 +135,7 @@ class UniswapPoolV2(ERC20):
             None if price is None else reserve.readable * price
             for reserve, price in zip(self.reserves(block=block), prices)
         ]
-        
-        if not vals[0] or not vals[1]:
-            if vals[0] is not None and not vals[1]:
-                vals[1] = vals[0]
-            if vals[1] is not None and not vals[0]:
-                vals[0] = vals[1]
-
-        if vals[0] is not None and vals[1] is not None:
-            return sum(vals)
+        return _sum_vals(vals)
 
     @log(logger)
     def get_pool_details(self, block: Optional[Block] = None) -> Tuple[Optional[ERC20], Optional[ERC20], Optional[int], Optional[Reserves]]:
@@ -134,6 +161,37 @@ class UniswapPoolV2(ERC20):
         return token0, token1, supply, reserves
 
 
+@log(logger)
+def get_pool_prices(pools: List[UniswapPoolV2], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+    '''
+    Prices many pools at `block`. Reserves and supplies for every pool are fetched in one multicall
+    and the prices of all of their tokens are fetched together with `magic.get_prices`.
+    '''
+    calls = [
+        Call(pool.address, [method], [[(pool.address, method), None]])
+        for pool in pools
+        for method in ('getReserves()((uint112,uint112,uint32))', 'totalSupply()(uint)')
+    ]
+    responses = multicall_in_chunks(calls, block=block, require_success=False)
+    tokens = list({token.address for pool in pools for token in pool.tokens})
+    token_prices = dict(zip(tokens, magic.get_prices(tokens, block, fail_to_None=True, silent=True)))
+
+    prices = []
+    for pool in pools:
+        reserves = responses[(pool.address, 'getReserves()((uint112,uint112,uint32))')]
+        supply = responses[(pool.address, 'totalSupply()(uint)')]
+        if reserves is None or not supply:
+            prices.append(None)
+            continue
+        vals = [
+            None if token_prices[token.address] is None else reserve / token.scale * token_prices[token.address]
+            for reserve, token in zip(reserves, pool.tokens)
+        ]
+        tvl = _sum_vals(vals)
+        prices.append(None if tvl is None else UsdPrice(tvl / (supply / pool.scale)))
+    return prices
+
+
 class UniswapRouterV2(ContractBase):
     def __init__(self, router_address: AnyAddressType, *args: Any, **kwargs: Any) -> None:
         super().__init__(router_address, *args, **kwargs)
@@ -151,8 +209,8 @@ class UniswapRouterV2(ContractBase):
         return f"<UniswapV2Router {self.label} '{self.address}'>"
 
 
-    @ttl_cache(ttl=36000)
     @log(logger)
+    @reorg_cache()
     def get_price(
         self,
         token_in: Address,
@@ -260,6 +318,7 @@ class UniswapRouterV2(ContractBase):
     
 
     @cached_property
+    @single_flight
     def pools(self) -> Dict[Address,Dict[Address,Address]]:
         logger.info(f'Fetching pools for {self.label} on {Network.printable()}. If this is your first time using ypricemagic, this can take a while. Please wait patiently...')
         PairCreated = ['0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9']
@@ -287,9 +346,9 @@ class UniswapRouterV2(ContractBase):
             pools_your_node_couldnt_get = multicall_same_func_same_contract_different_inputs(
                 self.factory, 'allPairs(uint256)(address)', inputs=[i for i in pools_your_node_couldnt_get])
             calls = [Call(pool, ['token0()(address)'], [[pool,None]]) for pool in pools_your_node_couldnt_get]
-            token0s = Multicall(calls)().values()
+            token0s = multicall_in_chunks(calls).values()
             calls = [Call(pool, ['token1()(address)'], [[pool,None]]) for pool in pools_your_node_couldnt_get]
-            token1s = Multicall(calls)().values()
+            token1s = multicall_in_chunks(calls).values()
             pools_your_node_couldnt_get = {
                 convert.to_address(pool): {
                     'token0':convert.to_address(token0),
@@ -304,6 +363,7 @@ class UniswapRouterV2(ContractBase):
 
 
     @cached_property
+    @single_flight
     def pool_mapping(self) -> Dict[Address,Dict[Address,Address]]:
         pool_mapping = defaultdict(dict)
         for pool, tokens in self.pools.items():
@@ -314,6 +374,17 @@ class UniswapRouterV2(ContractBase):
         return pool_mapping
 
 
+    def pools_on_path(self, path: Path) -> List[Address]:
+        '''
+        Returns the pool used for each hop along `path`.
+        '''
+        return [
+            pool
+            for token_in, token_out in zip(path, path[1:])
+            for pool, paired_with in self.pools_for_token(convert.to_address(token_in)).items()
+            if paired_with == convert.to_address(token_out)
+        ]
+
     def pools_for_token(self, token_address: Address) -> Dict[Address,Address]:
         try: 
             return self.pool_mapping[token_address]
@@ -321,7 +392,7 @@ class UniswapRouterV2(ContractBase):
             return {}
 
     @log(logger)
-    @lru_cache(maxsize=500)
+    @reorg_cache(maxsize=500)
     def deepest_pool(self, token_address: AnyAddressType, block: Optional[Block] = None, _ignore_pools: Tuple[Address,...] = ()) -> Address:
         token_address = convert.to_address(token_address)
         if token_address == WRAPPED_GAS_COIN or token_address in STABLECOINS:
@@ -329,7 +400,7 @@ class UniswapRouterV2(ContractBase):
         pools = self.pools_for_token(token_address)
 
         try:
-            reserves = multicall_same_func_no_input(pools, 'getReserves()((uint112,uint112,uint32))', block=block, return_None_on_failure=True)
+            reserves = uniswap_v2_reserves(pools, block=block)
         except Exception as e:
             if call_reverted(e):
                 return None
@@ -351,11 +422,11 @@ class UniswapRouterV2(ContractBase):
 
 
     @log(logger)
-    @lru_cache(maxsize=500)
+    @reorg_cache(maxsize=500)
     def deepest_stable_pool(self, token_address: AnyAddressType, block: Optional[Block] = None) -> Dict[str, str]:
         token_address = convert.to_address(token_address)
         pools = {pool: paired_with for pool, paired_with in self.pools_for_token(token_address).items() if paired_with in STABLECOINS}
-        reserves = multicall_same_func_no_input(pools.keys(), 'getReserves()((uint112,uint112,uint32))', block=block)
+        reserves = uniswap_v2_reserves(pools.keys(), block=block)
 
         deepest_stable_pool = None
         deepest_stable_pool_balance = 0
@@ -373,7 +444,7 @@ class UniswapRouterV2(ContractBase):
 
 
     @log(logger)
-    @lru_cache(maxsize=500)
+    @reorg_cache(maxsize=500)
     def get_path_to_stables(self, token: AnyAddressType, block: Optional[Block] = None, _loop_count: int = 0, _ignore_pools: Tuple[Address,...] = ()) -> Path:
         if _loop_count > 10:
             raise CantFindSwapPath
@@ -1,8 +1,8 @@
 import math
 from itertools import cycle
-from typing import Optional
+from typing import List, Optional
 
-from brownie import chain
+from brownie import ZERO_ADDRESS, chain
 from eth_abi.packed import encode_abi_packed
 from y.classes.common import ERC20
 from y.classes.singleton import Singleton
@@ -12,7 +12,7 @@ from y.datatypes import UsdPrice
 from y.exceptions import UnsupportedNetwork
 from y.networks import Network
 from y.typing import Address, Block
-from y.utils.multicall import fetch_multicall
+from y.utils.multicall import batch_call_same_func_at_blocks, fetch_multicall
 
 # https://github.com/Uniswap/uniswap-v3-periphery/blob/main/deploys.md
 UNISWAP_V3_FACTORY = '0x1F98431c8aD98523631AE4a59f267346ea31F984'
@@ -60,14 +60,7 @@ class UniswapV3(metaclass=Singleton):
         if block and block < contract_creation_block(UNISWAP_V3_QUOTER):
             return None
 
-        paths = []
-        if token != weth:
-            paths += [
-                [token, fee, weth.address, self.fee_tiers[0], usdc.address] for fee in self.fee_tiers
-            ]
-
-        paths += [[token, fee, usdc.address] for fee in self.fee_tiers]
-
+        paths = self._paths(token)
         results = fetch_multicall(
             *[
                 [self.quoter, 'quoteExactInput', self.encode_path(path), ERC20(token).scale]
@@ -75,7 +68,34 @@ class UniswapV3(metaclass=Singleton):
             ],
             block=block,
         )
+        return self._best_price(paths, results)
+
+    def get_prices_at_blocks(self, token: Address, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        '''
+        Same as `get_price` at each block in `blocks`, with one JSON-RPC batch for each path we quote.
+        '''
+        start = contract_creation_block(UNISWAP_V3_QUOTER)
+        live = [block for block in blocks if block >= start]
+        paths = self._paths(token)
+        quotes = [
+            batch_call_same_func_at_blocks(
+                self.quoter.address, 'quoteExactInput(bytes,uint256)(uint256)', live, inputs=[self.encode_path(path), ERC20(token).scale], return_None_on_failure=True
+            )
+            for path in paths
+        ]
+        prices = {block: self._best_price(paths, results) for block, results in zip(live, zip(*quotes))}
+        return [prices.get(block) for block in blocks]
 
+    def _paths(self, token: Address) -> List[list]:
+        paths = []
+        if token != weth:
+            paths += [
+                [token, fee, weth.address, self.fee_tiers[0], usdc.address] for fee in self.fee_tiers
+            ]
+        paths += [[token, fee, usdc.address] for fee in self.fee_tiers]
+        return paths
+
+    def _best_price(self, paths: List[list], results: List[Optional[int]]) -> Optional[UsdPrice]:
         outputs = [
             amount / self.undo_fees(path) / 1e6
             for amount, path in zip(results, paths)
@@ -83,6 +103,17 @@ class UniswapV3(metaclass=Singleton):
         ]
         return UsdPrice(max(outputs)) if outputs else None
 
+    def get_pools(self, token: Address) -> List[Address]:
+        '''
+        Returns every pool `get_price` could quote `token` through.
+        '''
+        pairs = [(token, usdc.address, fee) for fee in self.fee_tiers]
+        if token != weth:
+            pairs += [(token, weth.address, fee) for fee in self.fee_tiers]
+            pairs.append((weth.address, usdc.address, self.fee_tiers[0]))
+        pools = fetch_multicall(*[[self.factory, 'getPool', token0, token1, fee] for token0, token1, fee in pairs])
+        return [pool for pool in pools if pool and pool != ZERO_ADDRESS]
+
 
 uniswap_v3 = None
 try:
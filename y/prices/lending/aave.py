@@ -10,6 +10,7 @@ from y.classes.singleton import Singleton
 from y.datatypes import UsdPrice
 from y.decorators import log
 from y.networks import Network
+from y.prices import magic
 from y.typing import AddressOrContract, AnyAddressType, Block
 from y.utils.multicall import fetch_multicall
 from y.utils.raw_calls import raw_call
@@ -142,5 +143,13 @@ class AaveRegistry(metaclass = Singleton):
     def get_price(self, token_address: AddressOrContract, block: Optional[Block] = None) -> UsdPrice:
         return self.underlying(token_address).price(block)
 
+    @log(logger)
+    def get_prices_at_blocks(self, token_address: AddressOrContract, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        return self.underlying(token_address).prices_at_blocks(blocks, return_None_on_failure=True)
+
+    @log(logger)
+    def get_prices(self, token_addresses: List[AddressOrContract], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+        return magic.get_prices([self.underlying(token_address).address for token_address in token_addresses], block, fail_to_None=True, silent=True)
+
 
 aave = AaveRegistry()
@@ -1,6 +1,6 @@
 import logging
 from functools import cached_property, lru_cache
-from typing import Any, Optional, Set
+from typing import Any, List, Optional, Set
 
 from brownie import chain, convert
 from multicall import Call
@@ -11,8 +11,11 @@ from y.contracts import has_methods
 from y.datatypes import UsdPrice
 from y.decorators import log
 from y.networks import Network
+from y.prices import magic
 from y.typing import AddressOrContract, AnyAddressType, Block
 from y.utils.logging import gh_issue_request
+from y.utils.multicall import (batch_call_same_func_at_blocks,
+                               multicall_same_func_no_input)
 from y.utils.raw_calls import raw_call
 
 logger = logging.getLogger(__name__)
@@ -63,6 +66,18 @@ class CToken(ERC20):
     def get_price(self, block: Optional[Block] = None) -> UsdPrice:
         return UsdPrice(self.underlying_per_ctoken(block=block) * self.underlying.price(block=block))
     
+    @log(logger)
+    def get_prices_at_blocks(self, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        method = 'exchangeRateCurrent()(uint)'
+        exchange_rates = batch_call_same_func_at_blocks(self.address, method, blocks, return_None_on_failure=True)
+        underlying_prices = self.underlying.prices_at_blocks(blocks, return_None_on_failure=True)
+        scale = 10 ** (self.decimals - self.underlying.decimals)
+        return [
+            None if exchange_rate is None or price is None
+            else UsdPrice(exchange_rate / 1e18 * scale * price)
+            for exchange_rate, price in zip(exchange_rates, underlying_prices)
+        ]
+    
     @cached_property
     @log(logger)
     def underlying(self) -> ERC20:
@@ -143,6 +158,26 @@ class Compound(metaclass = Singleton):
     def get_price(self, token_address: AnyAddressType, block: Optional[Block] = None) -> UsdPrice:
         return CToken(token_address).get_price(block=block)
 
+    @log(logger)
+    def get_prices_at_blocks(self, token_address: AnyAddressType, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        return CToken(token_address).get_prices_at_blocks(blocks)
+
+    @log(logger)
+    def get_prices(self, token_addresses: List[AnyAddressType], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+        '''
+        Prices many cTokens at `block`, fetching all of their exchange rates in one multicall.
+        '''
+        ctokens = [CToken(token_address) for token_address in token_addresses]
+        method = 'exchangeRateCurrent()(uint)'
+        addresses = list({ctoken.address for ctoken in ctokens})
+        exchange_rates = dict(zip(addresses, multicall_same_func_no_input(addresses, method, block=block, return_None_on_failure=True)))
+        underlying_prices = magic.get_prices([ctoken.underlying.address for ctoken in ctokens], block, fail_to_None=True, silent=True)
+        return [
+            None if exchange_rates[ctoken.address] is None or price is None
+            else UsdPrice(exchange_rates[ctoken.address] / 1e18 * 10 ** (ctoken.decimals - ctoken.underlying.decimals) * price)
+            for ctoken, price in zip(ctokens, underlying_prices)
+        ]
+
     @log(logger)
     def __contains__(self, token_address: AddressOrContract) -> bool:
         return self.is_compound_market(token_address)
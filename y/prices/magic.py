@@ -1,7 +1,9 @@
 import logging
-from functools import lru_cache
-from typing import Iterable, List, Optional
+from collections import defaultdict
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Set
 
+import numpy as np
 from brownie import chain
 from brownie.exceptions import ContractNotFound
 from joblib.parallel import Parallel, delayed
@@ -9,8 +11,8 @@ from tqdm import tqdm
 from y import convert
 from y.constants import WRAPPED_GAS_COIN
 from y.datatypes import UsdPrice
-from y.decorators import log
-from y.exceptions import NonStandardERC20, PriceError
+from y.decorators import log, single_flight
+from y.exceptions import DeadlineExceeded, NonStandardERC20, PriceError
 from y.networks import Network
 from y.prices import convex, one_to_one, popsicle, yearn
 from y.prices.chainlink import chainlink
@@ -26,11 +28,14 @@ from y.prices.lending.compound import compound
 from y.prices.stable_swap import belt, froyo, mstablefeederpool, saddle
 from y.prices.stable_swap.curve import curve
 from y.prices.synthetix import synthetix
+from y.prices.utils import dag, price_store
 from y.prices.tokenized_fund import basketdao, gelato, piedao, tokensets
 from y.prices.utils.buckets import check_bucket
 from y.prices.utils.sense_check import _sense_check
 from y.typing import AnyAddressType, Block
+from y.utils import aio, deadline, trace
 from y.utils.raw_calls import _symbol
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +44,8 @@ def get_price(
     token_address: AnyAddressType,
     block: Optional[Block] = None, 
     fail_to_None: bool = False, 
-    silent: bool = False
+    silent: bool = False,
+    timeout: Optional[float] = None
     ) -> Optional[UsdPrice]:
     '''
     Don't pass an int like `123` into `token_address` please, that's just silly.
@@ -52,16 +58,44 @@ def get_price(
     - If `silent == False`, ypricemagic will not log any error
     - If `fail_to_None == True`, ypricemagic will return `None`
     - If `fail_to_None == False`, ypricemagic will raise a PriceError
+
+    Prices at finalized blocks are kept in an on-disk store and are returned from there without any rpc calls.
+    See `y.prices.utils.price_store` for details.
+
+    If you pass a `timeout`, in seconds, any pricing source we reach after the deadline is skipped and we fail with the reason:
+    - if `fail_to_None == True`, ypricemagic will return `None`
+    - if `fail_to_None == False`, ypricemagic will raise a `DeadlineExceeded`, which is a `PriceError`
     '''
     block = block or chain.height
     token_address = convert.to_address(token_address)
 
-    try:
-        return _get_price(token_address, block, fail_to_None=fail_to_None, silent=silent)
-    except (ContractNotFound, NonStandardERC20, RecursionError):
-        if fail_to_None:
-            return None
-        raise PriceError(f'could not fetch price for {_symbol(token_address)} {token_address} on {Network.printable()}')
+    price = price_store.lookup(token_address, block)
+    if price is not None:
+        return UsdPrice(price)
+
+    price = dag.lookup(token_address, block)
+    if price is not None:
+        return price
+
+    with deadline.time_limit(timeout) as limit:
+        try:
+            price = _get_price(token_address, block, fail_to_None=fail_to_None, silent=silent)
+        except (ContractNotFound, NonStandardERC20, RecursionError):
+            if fail_to_None:
+                return None
+            raise PriceError(f'could not fetch price for {_symbol(token_address)} {token_address} on {Network.printable()}')
+        except DeadlineExceeded as e:
+            # if the deadline belongs to a caller further up the stack, let them handle it
+            if limit is None or e.limit is not limit:
+                raise
+            if not silent:
+                logger.warning(f'failed to get price for {token_address} on {Network.printable()} within {timeout}s: {e}')
+            if fail_to_None:
+                return None
+            raise
+
+    price_store.save(token_address, block, price)
+    return price
 
 
 def get_prices(
@@ -69,7 +103,8 @@ def get_prices(
     block: Optional[Block] = None,
     fail_to_None: bool = False,
     silent: bool = False,
-    dop: int = 4
+    dop: int = 4,
+    timeout: Optional[float] = None
     ) -> List[Optional[float]]:
     '''
     In every case:
@@ -79,15 +114,156 @@ def get_prices(
     When `get_prices` is unable to find a price:
     - if `fail_to_None == True`, ypricemagic will return `None` for that token
     - if `fail_to_None == False`, ypricemagic will raise a PriceError and prevent you from receiving prices for your other tokens
+
+    If you pass a `timeout`, in seconds, it covers the whole batch. Once it runs out:
+    - if `fail_to_None == True`, ypricemagic will return `None` for every token it hasn't priced yet
+    - if `fail_to_None == False`, ypricemagic will raise a `DeadlineExceeded`
+
+    Prices are fetched in two phases:
+    - first, every token is sorted into its bucket and wrappers are expanded into their underlyings, see `y.prices.utils.dag`
+    - then, one level of the resulting DAG at a time, each bucket with a batch implementation prices all of its tokens at once
+    Any token we can't price this way falls back to `get_price`.
+    '''
+    block = block or chain.height
+    token_addresses = [convert.to_address(token_address) for token_address in token_addresses]
+    requested = list(dict.fromkeys(token_addresses))
+
+    # if we're already evaluating a DAG at this block, ie a batch hook is fetching the prices of its underlyings, use its results
+    prices = {token: price for token, price in dag.lookup_many(requested, block).items() if price is not None or fail_to_None}
+    for token in requested:
+        if token not in prices:
+            stored = price_store.lookup(token, block)
+            if stored is not None:
+                prices[token] = UsdPrice(stored)
+
+    unpriced = [token for token in requested if token not in prices]
+    if unpriced:
+        pricing_dag = dag.PricingDAG(block, dop=dop)
+        with deadline.time_limit(timeout) as limit:
+            try:
+                pricing_dag.expand(unpriced)
+                pricing_dag.evaluate(
+                    partial(_get_prices_in_bulk, block=block, buckets=pricing_dag.buckets, requested=set(unpriced), fail_to_None=fail_to_None, silent=silent, dop=dop)
+                )
+            except DeadlineExceeded as e:
+                # if the deadline belongs to a caller further up the stack, let them handle it
+                if limit is None or e.limit is not limit:
+                    raise
+                if not silent:
+                    logger.warning(f'failed to get prices for {len(unpriced)} tokens on {Network.printable()} within {timeout}s: {e}')
+                if not fail_to_None:
+                    raise
+        prices.update((token, pricing_dag.prices.get(token)) for token in unpriced)
+
+    return [prices[token] for token in token_addresses]
+
+
+async def get_price_async(
+    token_address: AnyAddressType,
+    block: Optional[Block] = None,
+    fail_to_None: bool = False,
+    silent: bool = False,
+    timeout: Optional[float] = None
+    ) -> Optional[UsdPrice]:
+    '''
+    Asyncio version of `get_price`. Arguments and failure handling are the same as `get_price`.
+
+    The pricing cascade runs on ypricemagic's own executor, never the event loop's default executor,
+    and the number of jobs in flight is bounded by the semaphore in `y.utils.aio`.
+    You can raise the limit with $YPRICEMAGIC_CONCURRENCY or `y.utils.aio.set_concurrency`.
     '''
+    return await aio.run_in_executor(get_price, token_address, block, fail_to_None=fail_to_None, silent=silent, timeout=timeout)
 
-    return Parallel(dop, 'threading')(
-        delayed(get_price)(token_address, block, fail_to_None=fail_to_None, silent=silent)
-        for token_address in (token_addresses if silent else tqdm(token_addresses))
+
+async def get_prices_async(
+    token_addresses: Iterable[AnyAddressType],
+    block: Optional[Block] = None,
+    fail_to_None: bool = False,
+    silent: bool = False,
+    dop: int = 4,
+    timeout: Optional[float] = None
+    ) -> List[Optional[UsdPrice]]:
+    '''
+    Asyncio version of `get_prices`. Arguments and failure handling are the same as `get_prices`.
+    The whole batch is one job on ypricemagic's executor, so it is classified and priced in bulk just like `get_prices`.
+    '''
+    return await aio.run_in_executor(
+        get_prices, list(token_addresses), block, fail_to_None=fail_to_None, silent=silent, dop=dop, timeout=timeout
     )
 
 
-@lru_cache(maxsize=None)
+def get_prices_at_blocks(
+    token_address: AnyAddressType,
+    blocks: Iterable[Block],
+    fail_to_None: bool = False,
+    silent: bool = False,
+    dop: int = 4
+    ) -> List[Optional[UsdPrice]]:
+    '''
+    Fetches prices for one token at many blocks.
+
+    The token's bucket, pools and metadata are only worked out once. For supported buckets,
+    the state that changes from block to block is fetched for all `blocks` using JSON-RPC batches.
+    Any block we can't price this way falls back to `get_price`.
+
+    `fail_to_None` and `silent` work the same way they do for `get_price`.
+    '''
+    token_address = convert.to_address(token_address)
+    blocks = [block or chain.height for block in blocks]
+
+    stored = price_store.lookup_many(token_address, blocks)
+    unstored = [block for block in blocks if block not in stored]
+    if unstored:
+        unstored_prices = _exit_early_for_known_tokens_at_blocks(token_address, unstored)
+        if unstored_prices is not None:
+            price_store.save_many(token_address, zip(unstored, unstored_prices))
+            stored.update((block, price) for block, price in zip(unstored, unstored_prices) if price is not None)
+    prices = [None if stored.get(block) is None else UsdPrice(stored[block]) for block in blocks]
+
+    missing = [i for i, price in enumerate(prices) if price is None]
+    if missing:
+        fallback = Parallel(dop, 'threading')(
+            delayed(trace.propagate(get_price))(token_address, blocks[i], fail_to_None=fail_to_None, silent=silent)
+            for i in missing
+        )
+        for i, price in zip(missing, fallback):
+            prices[i] = price
+
+    found = [price for price in prices if price]
+    if found:
+        _sense_check(token_address, max(found))
+    return prices
+
+
+def get_price_matrix(
+    token_addresses: Iterable[AnyAddressType],
+    blocks: Iterable[Block],
+    silent: bool = False,
+    dop: int = 4
+    ) -> np.ndarray:
+    '''
+    Returns a 2-D float64 array of prices with one row per token and one column per block.
+    Any price we are unable to fetch will be `nan`.
+
+    Work is grouped by block so the calls for all tokens at a block can share multicalls.
+    We stream over `blocks`, so only one block's results are held as python objects at a time.
+
+    - if `silent == True`, tqdm will not be used
+    - if `silent == False`, tqdm will be used
+    '''
+    token_addresses = [convert.to_address(token_address) for token_address in token_addresses]
+    blocks = list(blocks)
+
+    matrix = np.full((len(token_addresses), len(blocks)), np.nan, dtype=np.float64)
+    for i, block in enumerate(blocks if silent else tqdm(blocks)):
+        prices = get_prices(token_addresses, block, fail_to_None=True, silent=True, dop=dop)
+        matrix[:, i] = np.fromiter((np.nan if price is None else price for price in prices), dtype=np.float64, count=len(prices))
+        del prices
+    return matrix
+
+
+@single_flight
+@reorg_cache(maxsize=None)
 def _get_price(
     token: AnyAddressType, 
     block: Block, 
@@ -104,22 +280,26 @@ def _get_price(
     logger.debug(f"Block: {block or 'latest'}") 
     logger.debug(f"Network: {Network.printable()}")
 
-    price = _exit_early_for_known_tokens(token, block=block)
+    price = trace.source('bucket', _exit_early_for_known_tokens, token, block)
     if price is not None:
         return price
 
     if price is None and curve:
-        price = curve.get_price_for_underlying(token, block=block)
+        deadline.check(f'curve for {token_string}')
+        price = trace.source('curve', curve.get_price_for_underlying, token, block)
     
     if price is None and uniswap_v3:
-        price = uniswap_v3.get_price(token, block=block)
+        deadline.check(f'uniswap v3 for {token_string}')
+        price = trace.source('uniswap v3', uniswap_v3.get_price, token, block)
 
     if price is None:
-        price = uniswap_multiplexer.get_price(token, block=block)
+        deadline.check(f'uniswap v2 for {token_string}')
+        price = trace.source('uniswap v2', uniswap_multiplexer.get_price, token, block)
 
     # If price is 0, we can at least try to see if balancer gives us a price. If not, its probably a shitcoin.
     if price is None or price == 0:
-        new_price = balancer_multiplexer.get_price(token, block=block)
+        deadline.check(f'balancer for {token_string}')
+        new_price = trace.source('balancer', balancer_multiplexer.get_price, token, block)
         if new_price:
             price = new_price
 
@@ -137,6 +317,8 @@ def _exit_early_for_known_tokens(
     ) -> Optional[UsdPrice]:
 
     bucket = check_bucket(token_address)
+    trace.record_bucket(token_address, bucket)
+    deadline.check(f'{bucket} for {token_address}')
 
     price = None
 
@@ -178,6 +360,128 @@ def _exit_early_for_known_tokens(
 
     return price
 
+
+@log(logger)
+def _exit_early_for_known_tokens_at_blocks(
+    token_address: str,
+    blocks: List[Block]
+    ) -> Optional[List[Optional[UsdPrice]]]:
+    '''
+    Returns `None` if there is no series implementation for the token's bucket.
+    Otherwise returns one price per block, with `None` for any block we couldn't price.
+    '''
+
+    bucket = check_bucket(token_address)
+
+    prices = None
+
+    if bucket == 'atoken':                  prices = aave.get_prices_at_blocks(token_address, blocks)
+    elif bucket == 'chainlink feed':        prices = chainlink.get_prices_at_blocks(token_address, blocks)
+    elif bucket == 'compound':              prices = compound.get_prices_at_blocks(token_address, blocks)
+
+    elif bucket == 'convex':                prices = convex.get_prices_at_blocks(token_address, blocks)
+    elif bucket == 'one to one':            prices = one_to_one.get_prices_at_blocks(token_address, blocks)
+    elif bucket == 'stable usd':            prices = [UsdPrice(1) for _ in blocks]
+
+    elif bucket == 'uni or uni-like lp':    prices = uniswap_multiplexer.lp_prices_at_blocks(token_address, blocks)
+    elif bucket == 'wrapped gas coin':      prices = get_prices_at_blocks(WRAPPED_GAS_COIN, blocks, fail_to_None=True)
+    elif bucket == 'yearn or yearn-like':   prices = yearn.get_prices_at_blocks(token_address, blocks)
+
+    # with no bucket, `_get_price` would try curve, then uniswap v3, then uniswap v2.
+    # we can't price curve coins in bulk, but we can do the same as `_get_price` for everything else.
+    elif bucket is None and not (curve and token_address in curve.coin_to_pools):
+        prices = _uniswap_prices_at_blocks(token_address, blocks)
+
+    return prices
+
+
+
+def _uniswap_prices_at_blocks(token_address: str, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+    '''
+    Quotes `token_address` on uniswap v3 at each block, then on the uniswap v2 routers at each block v3 couldn't price.
+    '''
+    prices = uniswap_v3.get_prices_at_blocks(token_address, blocks) if uniswap_v3 else [None for _ in blocks]
+    missing = [i for i, price in enumerate(prices) if price is None]
+    if missing:
+        for i, price in zip(missing, uniswap_multiplexer.get_prices_at_blocks(token_address, [blocks[i] for i in missing])):
+            prices[i] = price
+    return prices
+
+
+def _get_prices_in_bulk(
+    token_addresses: List[str],
+    block: Block,
+    buckets: Dict[str, Optional[str]],
+    requested: Set[str],
+    fail_to_None: bool = False,
+    silent: bool = False,
+    dop: int = 4
+    ) -> List[Optional[UsdPrice]]:
+    '''
+    Prices `token_addresses`, whose `buckets` we already know, using the batch hooks where we can.
+    The failure handling for tokens in `requested` follows `fail_to_None` and `silent`.
+    We're only pricing any other token because something in `requested` depends on it, so those fail silently to `None`.
+    '''
+    prices = {token: None for token in token_addresses}
+    tokens_by_bucket = defaultdict(list)
+    for token in token_addresses:
+        tokens_by_bucket[buckets[token]].append(token)
+
+    for bucket, tokens in tokens_by_bucket.items():
+        try:
+            bucket_prices = trace.source(f'bulk {bucket}', partial(_exit_early_for_known_tokens_in_bulk, bucket), tokens, block)
+        except Exception as e:
+            logger.debug(f'unable to price {bucket} tokens in bulk, falling back to `get_price`. {e.__class__.__name__}: {e}')
+            continue
+        if bucket_prices is None:
+            continue
+        for token, price in zip(tokens, bucket_prices):
+            if price is not None:
+                _sense_check(token, price)
+                price_store.save(token, block, price)
+                prices[token] = UsdPrice(price)
+
+    missing = [token for token, price in prices.items() if price is None]
+    fallback = Parallel(dop, 'threading')(
+        delayed(deadline.propagate(trace.propagate(get_price)))(
+            token,
+            block,
+            fail_to_None=fail_to_None if token in requested else True,
+            silent=silent if token in requested else True,
+        )
+        for token in (missing if silent else tqdm(missing))
+    )
+    prices.update(zip(missing, fallback))
+    return [prices[token] for token in token_addresses]
+
+
+@log(logger)
+def _exit_early_for_known_tokens_in_bulk(
+    bucket: Optional[str],
+    token_addresses: List[str],
+    block: Block
+    ) -> Optional[List[Optional[UsdPrice]]]:
+    '''
+    Returns `None` if there is no batch implementation for `bucket`.
+    Otherwise returns one price per token, with `None` for any token we couldn't price.
+    '''
+
+    prices = None
+
+    if bucket == 'atoken':                  prices = aave.get_prices(token_addresses, block)
+    elif bucket == 'chainlink feed':        prices = chainlink.get_prices(token_addresses, block)
+    elif bucket == 'compound':              prices = compound.get_prices(token_addresses, block)
+
+    elif bucket == 'convex':                prices = convex.get_prices(token_addresses, block)
+    elif bucket == 'one to one':            prices = one_to_one.get_prices(token_addresses, block)
+    elif bucket == 'stable usd':            prices = [UsdPrice(1) for _ in token_addresses]
+
+    elif bucket == 'uni or uni-like lp':    prices = uniswap_multiplexer.lp_prices(token_addresses, block)
+    elif bucket == 'wrapped gas coin':      prices = [get_price(WRAPPED_GAS_COIN, block, fail_to_None=True)] * len(token_addresses)
+    elif bucket == 'yearn or yearn-like':   prices = yearn.get_prices(token_addresses, block)
+
+    return prices
+
          
 def _fail_appropriately(
     token_string: str, 
@@ -13,9 +13,10 @@ from y.classes.singleton import Singleton
 from y.constants import dai
 from y.contracts import Contract
 from y.datatypes import UsdPrice, UsdValue
-from y.decorators import log
-from y.exceptions import (ContractNotVerified, MessedUpBrownieContract,
-                          PriceError, UnsupportedNetwork, call_reverted)
+from y.decorators import log, single_flight
+from y.exceptions import (ContractNotVerified, DeadlineExceeded,
+                          MessedUpBrownieContract, PriceError,
+                          UnsupportedNetwork, call_reverted)
 from y.networks import Network
 from y.prices import magic
 from y.typing import Address, AddressOrContract, AnyAddressType, Block
@@ -24,6 +25,7 @@ from y.utils.middleware import ensure_middleware
 from y.utils.multicall import (
     fetch_multicall, multicall_same_func_same_contract_different_inputs)
 from y.utils.raw_calls import raw_call
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -176,7 +178,7 @@ class CurvePool(ERC20): # this shouldn't be ERC20 but works for inheritance for
         return [ERC20(coin) for coin in coins if coin != ZERO_ADDRESS]
     
     @log(logger)
-    @lru_cache
+    @reorg_cache()
     def get_balances(self, block: Optional[Block] = None) -> Dict[ERC20, int]:
         """
         Get {token: balance} of liquidity in the pool.
@@ -432,7 +434,7 @@ class CurveRegistry(metaclass=Singleton):
         return self.get_pool(token) is not None
     
     @log(logger)
-    @ttl_cache(maxsize=None, ttl=600)
+    @reorg_cache(maxsize=10_000)
     def get_price(self, token: Address, block: Optional[Block] = None) -> Optional[float]:
         tvl = self.get_pool(token).get_tvl(block=block)
         if tvl is None:
@@ -496,6 +498,8 @@ class CurveRegistry(metaclass=Singleton):
                 return None
             try:
                 return dy.value_usd()
+            except DeadlineExceeded:
+                raise
             except (PriceError,RecursionError): # TODO handle this case better
                 return None
         else:
@@ -504,6 +508,7 @@ class CurveRegistry(metaclass=Singleton):
 
 
     @cached_property
+    @single_flight
     def coin_to_pools(self) -> Dict[str, List[CurvePool]]:
         mapping = defaultdict(set)
         pools = {CurvePool(pool) for pools in self.metapools_by_factory.values() for pool in pools}
@@ -4,14 +4,14 @@ from typing import Optional
 from brownie.convert.datatypes import EthAddress
 from multicall import Call
 from y.classes.common import ERC20, WeiBalance
+from y.contracts import has_method
 from y.datatypes import UsdPrice
 from y.typing import Block
 
 
 def is_basketdao_index(address: EthAddress) -> bool:
     try:
-        Call(address, 'getAssetsAndBalances()(address[],uint[])')()
-        return True
+        return has_method(address, 'getAssetsAndBalances()(address[],uint[])')
     except:
         return False
 
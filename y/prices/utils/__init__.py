@@ -1,2 +1,2 @@
-from y.prices.utils.buckets import check_bucket
+from y.prices.utils.buckets import check_bucket, check_buckets
 from y.prices.utils.sense_check import _sense_check
@@ -0,0 +1,241 @@
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from brownie import chain
+from y.typing import Address
+from y.utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+"""
+An on-disk store for the bucket `check_bucket` chose for each token.
+
+Once a token fits a bucket it stays there, so we only need to classify each token once per chain.
+Tokens that don't fit any bucket are stored too, as `None`, since they are the most expensive to classify.
+They can still get a bucket later, ie when a chainlink feed or a curve pool is added for them,
+so we only trust a `None` for $YPRICEMAGIC_UNCLASSIFIED_TTL seconds (default: 1 day) and then classify the token again.
+We also keep the bucket for each code hash that `y.prices.utils.fingerprint` has learned,
+and how far `y.prices.utils.registry_index` has read each registry.
+
+The default store is a sqlite db at $YPRICEMAGIC_BUCKET_STORE_PATH (default: cache/buckets.sqlite).
+You can plug in your own store, or disable the store entirely, with `set_bucket_store`.
+"""
+
+BUCKET_STORE_PATH = os.environ.get('YPRICEMAGIC_BUCKET_STORE_PATH', 'cache/buckets.sqlite')
+
+# bump this whenever `check_bucket` changes, buckets stored with a different version are ignored
+BUCKETS_VERSION = 2
+
+UNCLASSIFIED_TTL = int(os.environ.get('YPRICEMAGIC_UNCLASSIFIED_TTL', 86_400))
+
+# sqlite limits the number of host parameters in a single statement
+_MAX_PARAMS = 900
+
+
+class BucketStore:
+    '''
+    Base class for bucket stores. Subclass this and pass an instance to `set_bucket_store` to use your own backend.
+    Implementations must be thread-safe.
+    '''
+
+    def get_many(self, tokens: Iterable[Address]) -> Dict[Address, Optional[str]]:
+        '''
+        Returns the stored bucket for each token in `tokens` that has one. Tokens that aren't stored are left out,
+        and so are tokens stored as `None` more than `UNCLASSIFIED_TTL` seconds ago.
+        '''
+        raise NotImplementedError
+
+    def set_many(self, buckets: Dict[Address, Optional[str]]) -> None:
+        raise NotImplementedError
+
+    def get_code_buckets(self, code_hashes: Iterable[str]) -> Dict[str, str]:
+        return {}
+
+    def set_code_buckets(self, buckets: Dict[str, str]) -> None:
+        pass
+
+    def get_cursor(self, registry: str) -> int:
+        return 0
+
+    def set_cursor(self, registry: str, position: int) -> None:
+        pass
+
+
+class SQLiteBucketStore(BucketStore, SQLiteStore):
+    schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS buckets (
+            chainid INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            bucket TEXT,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (chainid, token)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS unclassified (
+            chainid INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            checked_at INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (chainid, token)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS code_buckets (
+            chainid INTEGER NOT NULL,
+            code_hash TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (chainid, code_hash)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS registry_cursors (
+            chainid INTEGER NOT NULL,
+            registry TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (chainid, registry)
+        )
+        ''',
+    )
+
+    def __init__(self, path: str = BUCKET_STORE_PATH) -> None:
+        SQLiteStore.__init__(self, path)
+        self.chainid = chain.id
+
+    def get_many(self, tokens: Iterable[Address]) -> Dict[Address, Optional[str]]:
+        tokens = list(dict.fromkeys(tokens))
+        buckets = {}
+        for i in range(0, len(tokens), _MAX_PARAMS):
+            chunk = tokens[i:i+_MAX_PARAMS]
+            params = ",".join("?" * len(chunk))
+            # `None`s in `buckets` were stored before they expired, we ignore them
+            buckets.update(self.execute(
+                f'SELECT token, bucket FROM buckets WHERE chainid = ? AND version = ? AND bucket IS NOT NULL AND token IN ({params})',
+                (self.chainid, BUCKETS_VERSION, *chunk),
+            ))
+            buckets.update((token, None) for token, in self.execute(
+                f'SELECT token FROM unclassified WHERE chainid = ? AND version = ? AND checked_at >= ? AND token IN ({params})',
+                (self.chainid, BUCKETS_VERSION, int(time.time()) - UNCLASSIFIED_TTL, *chunk),
+            ))
+        return buckets
+
+    def set_many(self, buckets: Dict[Address, Optional[str]]) -> None:
+        if not buckets:
+            return
+        checked_at = int(time.time())
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO buckets (chainid, token, bucket, version) VALUES (?, ?, ?, ?)',
+                ((self.chainid, token, bucket, BUCKETS_VERSION) for token, bucket in buckets.items() if bucket is not None),
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO unclassified (chainid, token, checked_at, version) VALUES (?, ?, ?, ?)',
+                ((self.chainid, token, checked_at, BUCKETS_VERSION) for token, bucket in buckets.items() if bucket is None),
+            )
+            conn.executemany(
+                'DELETE FROM unclassified WHERE chainid = ? AND token = ?',
+                ((self.chainid, token) for token, bucket in buckets.items() if bucket is not None),
+            )
+
+    def get_code_buckets(self, code_hashes: Iterable[str]) -> Dict[str, str]:
+        code_hashes = list(dict.fromkeys(code_hashes))
+        buckets = {}
+        for i in range(0, len(code_hashes), _MAX_PARAMS):
+            chunk = code_hashes[i:i+_MAX_PARAMS]
+            rows = self.execute(
+                f'SELECT code_hash, bucket FROM code_buckets WHERE chainid = ? AND version = ? AND code_hash IN ({",".join("?" * len(chunk))})',
+                (self.chainid, BUCKETS_VERSION, *chunk),
+            )
+            buckets.update(rows)
+        return buckets
+
+    def set_code_buckets(self, buckets: Dict[str, str]) -> None:
+        if not buckets:
+            return
+        self.executemany(
+            'INSERT OR REPLACE INTO code_buckets (chainid, code_hash, bucket, version) VALUES (?, ?, ?, ?)',
+            ((self.chainid, code_hash, bucket, BUCKETS_VERSION) for code_hash, bucket in buckets.items()),
+        )
+
+    def get_cursor(self, registry: str) -> int:
+        rows = self.execute(
+            'SELECT position FROM registry_cursors WHERE chainid = ? AND registry = ? AND version = ?',
+            (self.chainid, registry, BUCKETS_VERSION),
+        )
+        return rows[0][0] if rows else 0
+
+    def set_cursor(self, registry: str, position: int) -> None:
+        self.execute(
+            'INSERT OR REPLACE INTO registry_cursors (chainid, registry, position, version) VALUES (?, ?, ?, ?)',
+            (self.chainid, registry, position, BUCKETS_VERSION),
+        )
+
+
+def _default_bucket_store() -> Optional[BucketStore]:
+    try:
+        return SQLiteBucketStore()
+    except Exception as e:
+        logger.warning(f'unable to open the bucket store at {BUCKET_STORE_PATH}, continuing without it. {e.__class__.__name__}: {e}')
+        return None
+
+_bucket_store: Optional[BucketStore] = _default_bucket_store()
+
+
+def get_bucket_store() -> Optional[BucketStore]:
+    return _bucket_store
+
+
+def set_bucket_store(bucket_store: Optional[BucketStore]) -> None:
+    '''
+    Replaces the store `check_bucket` reads from and writes to. Pass `None` to disable the store.
+    '''
+    global _bucket_store
+    _bucket_store = bucket_store
+
+
+def lookup_many(tokens: Iterable[Address]) -> Dict[Address, Optional[str]]:
+    store = get_bucket_store()
+    return {} if store is None else store.get_many(tokens)
+
+
+def save(token: Address, bucket: Optional[str]) -> None:
+    store = get_bucket_store()
+    if store is None:
+        return
+    store.set_many({token: bucket})
+
+
+def lookup_code_buckets(code_hashes: Iterable[str]) -> Dict[str, str]:
+    store = get_bucket_store()
+    return {} if store is None else store.get_code_buckets(code_hashes)
+
+
+def save_code_bucket(code_hash: str, bucket: str) -> None:
+    store = get_bucket_store()
+    if store is None:
+        return
+    store.set_code_buckets({code_hash: bucket})
+
+
+def save_many(buckets: Dict[Address, Optional[str]]) -> None:
+    store = get_bucket_store()
+    if store is None:
+        return
+    store.set_many(buckets)
+
+
+def lookup_cursor(registry: str) -> int:
+    store = get_bucket_store()
+    return 0 if store is None else store.get_cursor(registry)
+
+
+def save_cursor(registry: str, position: int) -> None:
+    store = get_bucket_store()
+    if store is None:
+        return
+    store.set_cursor(registry, position)
@@ -1,9 +1,14 @@
 import logging
-from functools import lru_cache
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from joblib.parallel import Parallel, delayed
 from y import convert
 from y.constants import STABLECOINS
-from y.decorators import log
+from y.contracts import prefetch_methods
+from y.decorators import log, single_flight
 from y.prices import convex, one_to_one, popsicle, yearn
 from y.prices.chainlink import chainlink
 from y.prices.dex import mooniswap
@@ -19,18 +24,181 @@ from y.prices.stable_swap import (belt, ellipsis, froyo, mstablefeederpool,
 from y.prices.stable_swap.curve import curve
 from y.prices.synthetix import synthetix
 from y.prices.tokenized_fund import basketdao, gelato, piedao, tokensets
-from y.typing import AnyAddressType
+from y.prices.utils import bucket_store, fingerprint
+from y.typing import Address, AnyAddressType
 
 logger = logging.getLogger(__name__)
 
+# every method without inputs that `check_bucket` probes with `has_method` or `has_methods`
+PROBES = [
+    # balancer
+    'getCurrentTokens()(address[])', 'getTotalDenormalizedWeight()(uint)', 'totalSupply()(uint)',
+    'getPoolId()(bytes32)', 'getPausedState()((bool,uint,uint))', 'getSwapFeePercentage()(uint)',
+    # yearn
+    'pricePerShare()(uint)', 'getPricePerShare()(uint)', 'getPricePerFullShare()(uint)', 'getSharesToUnderlying()(uint)',
+    'exchangeRate()(uint)', 'underlying()(address)',
+    # gelato
+    'gelatoBalance0()(uint)', 'gelatoBalance1()(uint)',
+    # piedao
+    'getCap()(uint)',
+    # token sets
+    'getComponents()(address[])', 'naturalUnit()(uint)', 'getModules()(address[])', 'getPositions()(address[])',
+    # ellipsis
+    'lpStaker()(address)', 'minter()(address)',
+    # mstable
+    'getPrice()((uint,uint))', 'mAsset()(address)',
+    # saddle
+    'swap()(address)',
+    # basketdao
+    'getAssetsAndBalances()(address[],uint[])',
+    # popsicle
+    'token0()(address)', 'token1()(address)', 'usersAmounts()((uint,uint))',
+    # compound
+    'isCToken()(bool)', 'comptroller()(address)',
+    # synthetix
+    'target()(address)', 'currencyKey()(bytes32)',
+]
+
+# saddle probes these on the pool returned by `swap()`
+SADDLE_POOL_PROBES = ['getVirtualPrice()(uint)', 'getA()(uint)', 'getAPrecise()(uint)']
+
+# {token: (bucket, when we checked it)}. like the bucket store, we check tokens without a bucket again once they expire.
+_checked: Dict[Address, Tuple[Optional[str], float]] = {}
+_checked_lock = threading.Lock()
+
+
+@log(logger)
+def check_buckets(token_addresses: Iterable[AnyAddressType], dop: int = 4) -> List[Optional[str]]:
+    '''
+    Returns the bucket for each token in `token_addresses`, in the same order.
+    Tokens we've already classified come from the bucket store. The rest are probed together, see `prefetch`.
+    '''
+    token_addresses = [convert.to_address(token) for token in token_addresses]
+    buckets = bucket_store.lookup_many(token_addresses)
+    unknown = [token for token in dict.fromkeys(token_addresses) if token not in buckets]
+    if unknown:
+        with prefetch(unknown):
+            buckets.update(zip(unknown, Parallel(dop, 'threading')(delayed(check_bucket)(token) for token in unknown)))
+    return [buckets[token] for token in token_addresses]
+
+
+@contextmanager
+def prefetch(token_addresses: Iterable[Address]) -> Iterator[None]:
+    '''
+    Sends every `has_method` probe that `check_bucket` could make for `token_addresses` in a few multicalls,
+    so classifying the tokens inside the `with` block takes far fewer calls. Tokens with a bucket in the bucket store are skipped.
+    '''
+    token_addresses = list(token_addresses)
+    stored = bucket_store.lookup_many(token_addresses)
+    token_addresses = [token for token in token_addresses if stored.get(token) is None]
+    # fetches the code for every token in one batch, so `check_bucket` can look up the bucket we've learned for each token's code
+    fingerprint.fingerprints(token_addresses)
+    with prefetch_methods((token, method) for token in token_addresses for method in PROBES) as results:
+        saddle_pools = {results[(token, 'swap()(address)')] for token in token_addresses if results.get((token, 'swap()(address)'))}
+        with prefetch_methods((pool, method) for pool in saddle_pools for method in SADDLE_POOL_PROBES):
+            yield
+
+
 @log(logger)
-@lru_cache(maxsize=None)
+@single_flight
 def check_bucket(
     token_address: AnyAddressType
-    ) -> str:
+    ) -> Optional[str]:
 
     token_address = convert.to_address(token_address)
+    with _checked_lock:
+        checked = _checked.get(token_address)
+    if checked is not None and checked[0] is not None:
+        return checked[0]
+
+    # a token we couldn't classify may have been indexed since, see `y.prices.utils.registry_index`
+    stored = bucket_store.lookup_many([token_address])
+    if token_address in stored:
+        bucket = stored[token_address]
+    elif checked is not None and time.time() - checked[1] < bucket_store.UNCLASSIFIED_TTL:
+        return None
+    else:
+        bucket = _check_bucket(token_address)
+        bucket_store.save(token_address, bucket)
+        fingerprint.learn(token_address, bucket)
+    with _checked_lock:
+        _checked[token_address] = (bucket, time.time())
+    return bucket
+
+
+# the checks `check_bucket` makes after `_check_bucket_by_address` and the fingerprint that only need calls.
+# `prefetch` sends every call they make, see `PROBES`.
+CALL_CHECKS: List[Tuple[str, Callable[[Address], bool]]] = [
+    ('balancer pool',           balancer_multiplexer.is_balancer_pool),
+    ('yearn or yearn-like',     yearn.is_yearn_vault),
+    ('ib token',                ib.is_ib_token),
+
+    ('gelato',                  gelato.is_gelato_pool),
+    ('piedao lp',               piedao.is_pie),
+    ('token set',               tokensets.is_token_set),
+
+    ('ellipsis lp',             ellipsis.is_eps_rewards_pool),
+    ('mstable feeder pool',     mstablefeederpool.is_mstable_feeder_pool),
+    ('saddle',                  saddle.is_saddle_lp),
+
+    ('basketdao',               basketdao.is_basketdao_index),
+    ('popsicle',                popsicle.is_popsicle_lp),
+]
+
+# the checks after those, which need contract initializations or registries.
+# uniswap pools come before generic amms since `is_generic_amm` fetches each contract from the block explorer.
+CONTRACT_CHECKS: List[Tuple[str, Callable[[Address], bool]]] = [
+    ('uni or uni-like lp',      uniswap_multiplexer.is_uniswap_pool),
+    ('generic amm',             lambda token_address: token_address in generic_amm),
+    ('mooniswap lp',            mooniswap.is_mooniswap_pool),
+    ('compound',                lambda token_address: token_address in compound),
+    ('curve lp',                lambda token_address: token_address in curve),
+    ('chainlink feed',          lambda token_address: token_address in chainlink),
+    ('synthetix',               lambda token_address: token_address in synthetix),
+]
 
+# a token goes in the bucket of the first check it passes
+BUCKET_CHECKS = CALL_CHECKS + CONTRACT_CHECKS
+
+
+def check_listed_bucket(token_address: Address, listed: str) -> str:
+    '''
+    Returns the bucket for `token_address`, which a registry of `listed` tokens lists, using only calls `prefetch` has made.
+    A token that passes none of `CALL_CHECKS` goes in `listed`. We don't make the `CONTRACT_CHECKS`,
+    the listing already tells us which of them the token passes.
+    '''
+    bucket = fingerprint.known_bucket(token_address)
+    return (
+        _check_bucket_by_address(token_address)
+        or (bucket if bucket in fingerprint.LEARNABLE_BUCKETS else None)
+        or _first_bucket(token_address, CALL_CHECKS)
+        or listed
+    )
+
+
+def _check_bucket(token_address: Address) -> Optional[str]:
+    bucket = _check_bucket_by_address(token_address)
+    if bucket:
+        return bucket
+
+    # if `prefetch` fetched the token's code, tokens that share code with a token we've classified skip most checks
+    bucket = fingerprint.known_bucket(token_address)
+    if bucket in fingerprint.LEARNABLE_BUCKETS:
+        return bucket
+    if bucket in fingerprint.TEMPLATE_BUCKETS and _first_bucket(token_address, [check for check in BUCKET_CHECKS if check[0] == bucket]):
+        return bucket
+
+    return _first_bucket(token_address, BUCKET_CHECKS)
+
+
+def _first_bucket(token_address: Address, checks: List[Tuple[str, Callable[[Address], bool]]]) -> Optional[str]:
+    for bucket, check in checks:
+        if check(token_address):
+            return bucket
+    return None
+
+
+def _check_bucket_by_address(token_address: Address) -> Optional[str]:
     # these require neither calls to the chain nor contract initialization
     if token_address == "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE":       return 'wrapped gas coin'
     elif token_address in STABLECOINS:                                      return 'stable usd'
@@ -43,30 +211,3 @@ def check_bucket(
     elif froyo.is_froyo(token_address):                                     return 'froyo'
     elif aave.is_atoken(token_address):                                     return 'atoken'
     elif convex.is_convex_lp(token_address):                                return 'convex'
-
-    # these just require calls
-    elif balancer_multiplexer.is_balancer_pool(token_address):              return 'balancer pool'
-    elif yearn.is_yearn_vault(token_address):                               return 'yearn or yearn-like'
-    elif ib.is_ib_token(token_address):                                     return 'ib token'
-
-    elif gelato.is_gelato_pool(token_address):                              return 'gelato'
-    elif piedao.is_pie(token_address):                                      return 'piedao lp'
-    elif tokensets.is_token_set(token_address):                             return 'token set'
-
-    elif ellipsis.is_eps_rewards_pool(token_address):                       return 'ellipsis lp'
-    elif mstablefeederpool.is_mstable_feeder_pool(token_address):           return 'mstable feeder pool'
-    elif saddle.is_saddle_lp(token_address):                                return 'saddle'
-
-    elif basketdao.is_basketdao_index(token_address):                       return 'basketdao'
-    elif popsicle.is_popsicle_lp(token_address):                            return 'popsicle'
-
-    # these just require contract initialization
-    elif token_address in generic_amm:                                      return 'generic amm'
-
-    # these require both calls and contract initializations
-    elif uniswap_multiplexer.is_uniswap_pool(token_address):                return 'uni or uni-like lp'
-    elif mooniswap.is_mooniswap_pool(token_address):                        return 'mooniswap lp'
-    elif token_address in compound:                                         return 'compound'
-    elif token_address in curve:                                            return 'curve lp'
-    elif token_address in chainlink:                                        return 'chainlink feed'
-    elif token_address in synthetix:                                        return 'synthetix'
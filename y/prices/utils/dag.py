@@ -0,0 +1,164 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import (Callable, Dict, FrozenSet, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+from brownie.exceptions import ContractNotFound
+from joblib.parallel import Parallel, delayed
+from y import convert
+from y.constants import WRAPPED_GAS_COIN
+from y.datatypes import UsdPrice
+from y.exceptions import NonStandardERC20
+from y.prices import convex, one_to_one
+from y.prices.dex.uniswap.v2 import UniswapPoolV2
+from y.prices.lending.aave import aave
+from y.prices.lending.compound import CToken
+from y.prices.stable_swap.curve import curve
+from y.prices.utils.buckets import check_bucket, prefetch
+from y.prices.yearn import YearnInspiredVault
+from y.typing import Address, Block
+from y.utils import deadline, trace
+
+logger = logging.getLogger(__name__)
+
+"""
+A per-batch pricing DAG.
+
+Wrapper tokens (LPs, vaults, atokens, ctokens...) get their prices from the prices of their underlyings.
+When we price a batch, we first expand every wrapper into its underlyings until we reach tokens that aren't wrappers.
+Then we price the tokens one level at a time, starting with the leaves, so a token shared by many wrappers in the batch
+is only priced once. While a DAG is being evaluated, `get_price` and `get_prices` read prices it has already found
+instead of working them out again.
+"""
+
+# `check_bucket` never returns this, we use it for tokens that we couldn't classify
+UNKNOWN = 'unknown'
+
+_active_dags: List['PricingDAG'] = []
+_active_dags_lock = threading.Lock()
+
+
+class PricingDAG:
+    def __init__(self, block: Block, dop: int = 4) -> None:
+        self.block = block
+        self.dop = dop
+        self.buckets: Dict[Address, Optional[str]] = {}
+        self.underlyings: Dict[Address, List[Address]] = {}
+        self.prices: Dict[Address, Optional[UsdPrice]] = {}
+
+    def __repr__(self) -> str:
+        return f"<PricingDAG block={self.block} tokens={len(self.buckets)}>"
+
+    def expand(self, token_addresses: Iterable[Address]) -> None:
+        '''
+        Adds `token_addresses` and all of their underlyings, recursively, to the DAG.
+        Each layer of the expansion is classified in parallel, with its probes prefetched in bulk.
+        '''
+        frontier = [token for token in dict.fromkeys(token_addresses) if token not in self.buckets]
+        while frontier:
+            with prefetch(frontier):
+                results = Parallel(self.dop, 'threading')(delayed(deadline.propagate(trace.propagate(_expand)))(token) for token in frontier)
+            for token, (bucket, underlyings) in zip(frontier, results):
+                self.buckets[token] = bucket
+                self.underlyings[token] = underlyings
+            frontier = list(dict.fromkeys(
+                underlying
+                for token in frontier
+                for underlying in self.underlyings[token]
+                if underlying not in self.buckets
+            ))
+
+    @property
+    def levels(self) -> List[List[Address]]:
+        '''
+        Tokens grouped by how far they are from the leaves. Every token's underlyings are in an earlier level.
+        '''
+        depths: Dict[Address, int] = {}
+
+        def depth(token: Address, path: FrozenSet[Address]) -> int:
+            if token not in depths:
+                # skip any underlying that would take us around a cycle
+                underlyings = [underlying for underlying in self.underlyings.get(token, []) if underlying not in path]
+                path = path | {token}
+                depths[token] = 1 + max(depth(underlying, path) for underlying in underlyings) if underlyings else 0
+            return depths[token]
+
+        for token in self.buckets:
+            depth(token, frozenset())
+        levels: List[List[Address]] = [[] for _ in range(max(depths.values(), default=-1) + 1)]
+        for token, d in depths.items():
+            levels[d].append(token)
+        return levels
+
+    def evaluate(self, price_level: Callable[[List[Address]], List[Optional[UsdPrice]]]) -> Dict[Address, Optional[UsdPrice]]:
+        '''
+        Prices the DAG from the leaves up. `price_level` prices all of the tokens in one level at once.
+        '''
+        with self._active():
+            for level in self.levels:
+                self.prices.update(zip(level, price_level(level)))
+        return self.prices
+
+    @contextmanager
+    def _active(self) -> Iterator[None]:
+        with _active_dags_lock:
+            _active_dags.append(self)
+        try:
+            yield
+        finally:
+            with _active_dags_lock:
+                _active_dags.remove(self)
+
+
+def lookup(token: Address, block: Block) -> Optional[UsdPrice]:
+    '''
+    Returns the price of `token` at `block` if a DAG being evaluated has already found it.
+    '''
+    for dag in list(_active_dags):
+        if dag.block == block and dag.prices.get(token) is not None:
+            return dag.prices[token]
+    return None
+
+
+def lookup_many(token_addresses: Iterable[Address], block: Block) -> Dict[Address, Optional[UsdPrice]]:
+    '''
+    Returns every token in `token_addresses` that a DAG being evaluated at `block` has already attempted to price,
+    including `None` for those we were unable to price.
+    '''
+    prices = {}
+    for dag in list(_active_dags):
+        if dag.block != block:
+            continue
+        for token in token_addresses:
+            if token in dag.prices and prices.get(token) is None:
+                prices[token] = dag.prices[token]
+    return prices
+
+
+def _expand(token: Address) -> Tuple[str, List[Address]]:
+    try:
+        bucket = check_bucket(token)
+    except (ContractNotFound, NonStandardERC20, RecursionError):
+        # `get_price` will handle these appropriately
+        return UNKNOWN, []
+    trace.record_bucket(token, bucket)
+    try:
+        underlyings = [convert.to_address(underlying) for underlying in _underlyings(token, bucket)]
+    except Exception as e:
+        # we'll treat the token as a leaf, the pricing code for its bucket will find whatever it needs
+        logger.debug(f'unable to find the underlyings for {bucket} {token}. {e.__class__.__name__}: {e}')
+        underlyings = []
+    return bucket, [underlying for underlying in underlyings if underlying != token]
+
+
+def _underlyings(token: Address, bucket: Optional[str]) -> List[Address]:
+    if bucket == 'atoken':                  return [aave.underlying(token).address]
+    elif bucket == 'compound':              return [CToken(token).underlying.address]
+    elif bucket == 'convex':                return [convex.MAPPING[token]]
+    elif bucket == 'curve lp':              return [coin.address for coin in curve.get_pool(token).get_coins]
+    elif bucket == 'one to one':            return [one_to_one.MAPPING[token]]
+    elif bucket == 'uni or uni-like lp':    return [coin.address for coin in UniswapPoolV2(token).tokens]
+    elif bucket == 'wrapped gas coin':      return [WRAPPED_GAS_COIN]
+    elif bucket == 'yearn or yearn-like':   return [YearnInspiredVault(token).underlying.address]
+    return []
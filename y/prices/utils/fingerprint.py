@@ -0,0 +1,141 @@
+import logging
+import re
+import threading
+from typing import Dict, Iterable, Optional
+
+from brownie import chain
+from eth_utils import encode_hex, keccak
+from hexbytes import HexBytes
+from y import convert
+from y.prices.utils import bucket_store
+from y.typing import Address, AnyAddressType
+from y.utils import jsonrpc
+
+logger = logging.getLogger(__name__)
+
+"""
+Bucket classification from a contract's runtime bytecode.
+
+Contracts with the same code hash behave the same, so once we've classified one token we remember the bucket for its code.
+Every other token deployed from the same template then skips the checks that come before its bucket:
+- for `LEARNABLE_BUCKETS`, which follow from the code alone, we make no checks at all
+- for `TEMPLATE_BUCKETS`, ie yearn vaults, uniswap pairs, ctokens and curve lp tokens, the code tells us which check to make,
+  but passing it also depends on state or on a registry. So we make that one check, and all of them if it fails.
+
+We only ever use the code to say which bucket a token is in. We never use it to say a token doesn't have a method:
+a dispatcher doesn't have to push each selector on its own, ie vyper's selector tables don't, and a missing method would
+be cached for good by `has_method`. Matching selectors can't skip the checks before a bucket either, since a check we skip
+could pass. A learned template can, the token it was learned from failed them with the same code.
+
+Code is only fetched in bulk, by `fingerprints`, which `y.prices.utils.buckets.prefetch` calls for every token it classifies.
+We never fetch one token's code just to look it up.
+
+Code that can DELEGATECALL, ie a proxy, can run code that isn't its own, so we learn nothing from it.
+EIP-1167 minimal proxies are the exception, their implementation is part of their code and can never change.
+"""
+
+# buckets that `check_bucket` decides from nothing but the contract's code
+LEARNABLE_BUCKETS = {
+    'balancer pool',
+    'basketdao',
+    'ellipsis lp',
+    'gelato',
+    'ib token',
+    'mstable feeder pool',
+    'piedao lp',
+    'popsicle',
+    'token set',
+}
+
+# buckets whose template we can learn, but whose check depends on state or a registry as well as the code,
+# ie a uniswap pair with no supply or a ctoken from a comptroller we don't know about
+TEMPLATE_BUCKETS = {
+    'compound',
+    'curve lp',
+    'uni or uni-like lp',
+    'yearn or yearn-like',
+}
+
+DELEGATECALL = 0xf4
+PUSH1, PUSH32 = 0x60, 0x7f
+MINIMAL_PROXY = re.compile(r'^0x363d3d373d3d3d363d73[0-9a-f]{40}5af43d82803e903d91602b57fd5bf3$')
+
+
+class Fingerprint:
+    def __init__(self, code: bytes) -> None:
+        code = bytes(code)
+        self.code_hash = encode_hex(keccak(code))
+        self.is_minimal_proxy = bool(MINIMAL_PROXY.match(encode_hex(code)))
+        self.delegates = _can_delegatecall(code)
+
+    def __repr__(self) -> str:
+        return f"<Fingerprint {self.code_hash} delegates={self.delegates}>"
+
+    @property
+    def learnable(self) -> bool:
+        return not self.delegates or self.is_minimal_proxy
+
+
+# fingerprints are small, so we keep one per address for the life of the process
+_fingerprints: Dict[Address, Fingerprint] = {}
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprints(addresses: Iterable[AnyAddressType]) -> Dict[Address, Fingerprint]:
+    '''
+    Returns the fingerprint for each address in `addresses`, fetching the code we don't have yet in one JSON-RPC batch.
+    '''
+    addresses = list(dict.fromkeys(convert.to_address(address) for address in addresses))
+    missing = [address for address in addresses if address not in _fingerprints]
+    # we ask for the code at a block number rather than 'latest' so the cache middleware lets these through in one batch
+    block = hex(chain.height)
+    jsonrpc_batch = [
+        {'jsonrpc': '2.0', 'id': i, 'method': 'eth_getCode', 'params': [address, block]}
+        for i, address in enumerate(missing)
+    ]
+    for address, response in zip(missing, jsonrpc.send_batch(jsonrpc_batch)):
+        if 'error' in response:
+            logger.debug(f'unable to fetch the code for {address}. {response["error"]}')
+            continue
+        fp = Fingerprint(HexBytes(response['result']))
+        with _fingerprints_lock:
+            _fingerprints[address] = fp
+    return {address: _fingerprints[address] for address in addresses if address in _fingerprints}
+
+
+def known_bucket(address: AnyAddressType) -> Optional[str]:
+    '''
+    Returns the bucket we've learned for `address`'s code, if any. The bucket is in either `LEARNABLE_BUCKETS`
+    or `TEMPLATE_BUCKETS`, in which case `address` still has to pass that bucket's check.
+    Returns `None` if we haven't fetched `address`'s code, see `fingerprints`.
+    '''
+    fp = _fingerprints.get(convert.to_address(address))
+    if fp is None or not fp.learnable:
+        return None
+    bucket = bucket_store.lookup_code_buckets([fp.code_hash]).get(fp.code_hash)
+    # a bucket we no longer learn may have been stored before we stopped learning it
+    return bucket if bucket in LEARNABLE_BUCKETS | TEMPLATE_BUCKETS else None
+
+
+def learn(address: AnyAddressType, bucket: Optional[str]) -> None:
+    '''
+    Remembers `bucket` for `address`'s code, if we've fetched the code and the bucket can be learned.
+    '''
+    if bucket not in LEARNABLE_BUCKETS | TEMPLATE_BUCKETS:
+        return
+    fp = _fingerprints.get(convert.to_address(address))
+    if fp is not None and fp.learnable:
+        bucket_store.save_code_bucket(fp.code_hash, bucket)
+
+
+def _can_delegatecall(code: bytes) -> bool:
+    i = 0
+    while i < len(code):
+        opcode = code[i]
+        if PUSH1 <= opcode <= PUSH32:
+            # skip the pushed bytes, they aren't opcodes
+            i += opcode - PUSH1 + 1
+        elif opcode == DELEGATECALL:
+            return True
+        i += 1
+    return False
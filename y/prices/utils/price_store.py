@@ -0,0 +1,186 @@
+import logging
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from brownie import chain
+from y.typing import Address, Block
+from y.utils import shared_cache
+from y.utils.cache import is_finalized
+from y.utils.kv_cache import packb, unpackb
+from y.utils.reorg import block_hashes
+from y.utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+"""
+An on-disk store for prices at finalized blocks.
+
+Prices at a finalized block can never change, so once we've worked one out we keep it forever (or until it is evicted).
+Only prices at blocks at least `y.utils.cache.CONFIRMATIONS` below the chain head are written.
+Lookups never touch the rpc.
+
+The default store is a sqlite db at $YPRICEMAGIC_PRICE_STORE_PATH (default: cache/prices.sqlite)
+which holds at most $YPRICEMAGIC_PRICE_STORE_MAX_MB megabytes (default: 512).
+You can plug in your own store, or disable the store entirely, with `set_price_store`.
+
+If a cache shared between processes is set up, see `y.utils.shared_cache`, we check it after our own store and write every price to it too.
+Prices at blocks that aren't final yet go to the shared cache keyed by the block's hash, so other workers pricing the head can use them.
+"""
+
+PRICE_STORE_PATH = os.environ.get('YPRICEMAGIC_PRICE_STORE_PATH', 'cache/prices.sqlite')
+PRICE_STORE_MAX_MB = int(os.environ.get('YPRICEMAGIC_PRICE_STORE_MAX_MB', 512))
+
+# sqlite limits the number of host parameters in a single statement
+_MAX_PARAMS = 900
+
+
+class PriceStore:
+    '''
+    Base class for price stores. Subclass this and pass an instance to `set_price_store` to use your own backend.
+    Implementations must be thread-safe.
+    '''
+
+    def get(self, token: Address, block: Block) -> Optional[float]:
+        raise NotImplementedError
+
+    def set(self, token: Address, block: Block, price: float) -> None:
+        raise NotImplementedError
+
+    def get_many(self, token: Address, blocks: Iterable[Block]) -> Dict[Block, float]:
+        prices = {block: self.get(token, block) for block in blocks}
+        return {block: price for block, price in prices.items() if price is not None}
+
+    def set_many(self, token: Address, prices: Dict[Block, float]) -> None:
+        for block, price in prices.items():
+            self.set(token, block, price)
+
+
+class SQLitePriceStore(PriceStore, SQLiteStore):
+    schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS prices (
+            chainid INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            block INTEGER NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (chainid, token, block)
+        )
+        ''',
+    )
+
+    # we check the size of the db once every `evict_interval` writes
+    evict_interval = 1_000
+    # when the db is too big, we drop this fraction of the oldest entries
+    evict_fraction = 0.1
+
+    def __init__(self, path: str = PRICE_STORE_PATH, max_mb: int = PRICE_STORE_MAX_MB) -> None:
+        SQLiteStore.__init__(self, path)
+        self.chainid = chain.id
+        self.max_bytes = max_mb * 1024 * 1024
+        self._writes = 0
+
+    def get(self, token: Address, block: Block) -> Optional[float]:
+        rows = self.execute(
+            'SELECT price FROM prices WHERE chainid = ? AND token = ? AND block = ?',
+            (self.chainid, token, block),
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, token: Address, block: Block, price: float) -> None:
+        self.set_many(token, {block: price})
+
+    def get_many(self, token: Address, blocks: Iterable[Block]) -> Dict[Block, float]:
+        blocks = list(blocks)
+        prices = {}
+        for i in range(0, len(blocks), _MAX_PARAMS):
+            chunk = blocks[i:i+_MAX_PARAMS]
+            rows = self.execute(
+                f'SELECT block, price FROM prices WHERE chainid = ? AND token = ? AND block IN ({",".join("?" * len(chunk))})',
+                (self.chainid, token, *chunk),
+            )
+            prices.update(rows)
+        return prices
+
+    def set_many(self, token: Address, prices: Dict[Block, float]) -> None:
+        if not prices:
+            return
+        self.executemany(
+            'INSERT OR REPLACE INTO prices (chainid, token, block, price) VALUES (?, ?, ?, ?)',
+            ((self.chainid, token, block, float(price)) for block, price in prices.items()),
+        )
+        self._writes += len(prices)
+        if self._writes >= self.evict_interval:
+            self._writes = 0
+            self._evict()
+
+    def _evict(self) -> None:
+        size = self.size()
+        if size <= self.max_bytes:
+            return
+        count = self.execute('SELECT COUNT(*) FROM prices')[0][0]
+        to_delete = max(int(count * self.evict_fraction), 1)
+        logger.info(f'{self} is {size} bytes, evicting the oldest {to_delete} prices')
+        self.execute('DELETE FROM prices WHERE rowid IN (SELECT rowid FROM prices ORDER BY rowid LIMIT ?)', (to_delete,))
+
+
+def _default_price_store() -> Optional[PriceStore]:
+    try:
+        return SQLitePriceStore()
+    except Exception as e:
+        logger.warning(f'unable to open the price store at {PRICE_STORE_PATH}, continuing without it. {e.__class__.__name__}: {e}')
+        return None
+
+_price_store: Optional[PriceStore] = _default_price_store()
+
+
+def get_price_store() -> Optional[PriceStore]:
+    return _price_store
+
+
+def set_price_store(price_store: Optional[PriceStore]) -> None:
+    '''
+    Replaces the store `get_price` reads from and writes to. Pass `None` to disable the store.
+    '''
+    global _price_store
+    _price_store = price_store
+
+
+def lookup(token: Address, block: Block) -> Optional[float]:
+    return lookup_many(token, [block]).get(block)
+
+
+def lookup_many(token: Address, blocks: Iterable[Block]) -> Dict[Block, float]:
+    store = get_price_store()
+    blocks = list(blocks)
+    prices = {} if store is None else store.get_many(token, blocks)
+    missing = [block for block in blocks if block not in prices]
+    if missing and shared_cache.get_shared_cache() is not None:
+        keys = {_shared_key(token, block): block for block in missing}
+        keys.pop(None, None)
+        shared = shared_cache.lookup_many('prices', keys)
+        prices.update((keys[key], unpackb(value)) for key, value in shared.items())
+    return prices
+
+
+def save(token: Address, block: Block, price: Optional[float]) -> None:
+    save_many(token, [(block, price)])
+
+
+def save_many(token: Address, prices: Iterable[Tuple[Block, Optional[float]]]) -> None:
+    '''
+    Writes prices to the store, skipping any that are missing or not yet final, and to the shared cache, if any.
+    '''
+    prices = [(block, price) for block, price in prices if price is not None]
+    store = get_price_store()
+    if store is not None:
+        store.set_many(token, {block: price for block, price in prices if is_finalized(block)})
+    if prices and shared_cache.get_shared_cache() is not None:
+        shared = {_shared_key(token, block): packb(float(price)) for block, price in prices}
+        shared.pop(None, None)
+        shared_cache.save_many('prices', shared)
+
+
+def _shared_key(token: Address, block: Block) -> Optional[bytes]:
+    # a block in the reorg window can still be replaced, so we key prices at it by its hash instead
+    block_id = block if is_finalized(block) else block_hashes.hash_of(block)
+    return None if block_id is None else f'{token}:{block_id}'.encode()
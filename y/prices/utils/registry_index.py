@@ -0,0 +1,144 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from brownie import ZERO_ADDRESS
+from joblib.parallel import Parallel, delayed
+from y import convert
+from y.prices.chainlink import chainlink
+from y.prices.dex.uniswap import uniswap_multiplexer
+from y.prices.lending.aave import aave
+from y.prices.lending.compound import compound
+from y.prices.stable_swap.curve import curve
+from y.prices.synthetix import synthetix
+from y.prices.utils import bucket_store
+from y.prices.utils.buckets import check_listed_bucket, prefetch
+from y.typing import Address
+from y.utils.multicall import (multicall_same_func_no_input,
+                               multicall_same_func_same_contract_different_inputs)
+from y.utils.raw_calls import raw_call
+
+logger = logging.getLogger(__name__)
+
+"""
+A token -> bucket index built from the registries ypricemagic already loads.
+
+Most of the tokens we'll ever price are listed somewhere: aave markets list their atokens, comptrollers list their ctokens,
+curve, chainlink and synthetix list their lp tokens, feeds and synths, and each uniswap factory lists its pairs.
+`update` walks all of them and writes every listed token into the bucket store, so `check_bucket` finds them
+with one lookup instead of probing them.
+
+A token listed by a registry can still pass one of the checks `check_bucket` makes before it gets to that registry,
+ie a token chainlink has a feed for can also be a yearn-like vault. So before we write a token we make the checks that only need calls,
+with their probes sent together in a few multicalls, see `y.prices.utils.buckets.check_listed_bucket`.
+We never make the checks that need contract initializations, the listing answers those. Indexing hundreds of thousands
+of uniswap pairs doesn't fetch a single one from the block explorer.
+
+Whether a uniswap pair is 'uni or uni-like lp' also depends on its state: a pair nobody has added liquidity to has no supply,
+and `check_bucket` doesn't count it as a pool. We leave those pairs out rather than store a bucket that could be wrong.
+
+Only tokens that aren't in the store yet, or that are stored without a bucket, are written, and each uniswap factory
+is read from the last pair we indexed, so calling `update` again only classifies what is new.
+Call it whenever you want to pick up new markets, pools and pairs.
+"""
+
+# we read this many uniswap pairs per multicall
+PAIRS_PER_MULTICALL = 1_000
+
+_update_lock = threading.Lock()
+
+
+def update(dop: int = 4) -> int:
+    '''
+    Writes every token listed by a known registry that doesn't have a bucket in the bucket store yet.
+    Returns the number of tokens written.
+    '''
+    with _update_lock:
+        pairs, cursors = _new_uniswap_pairs()
+        # in the order `check_bucket` tries them
+        sources: List[Tuple[str, Callable[[], List[Address]]]] = [
+            ('atoken',              _atokens),
+            ('uni or uni-like lp',  lambda: pairs),
+            ('compound',            _ctokens),
+            ('curve lp',            _curve_lp_tokens),
+            ('chainlink feed',      _chainlink_assets),
+            ('synthetix',           _synths),
+        ]
+
+        buckets: Dict[Address, str] = {}
+        for bucket, source in sources:
+            try:
+                tokens = source()
+            except Exception as e:
+                logger.warning(f'unable to index {bucket} tokens. {e.__class__.__name__}: {e}')
+                continue
+            for token in tokens:
+                buckets.setdefault(convert.to_address(token), bucket)
+
+        stored = bucket_store.lookup_many(buckets)
+        # a token stored without a bucket was stored before a registry listed it
+        tokens = [token for token in buckets if stored.get(token) is None]
+        with prefetch(tokens):
+            new = dict(zip(tokens, Parallel(dop, 'threading')(delayed(check_listed_bucket)(token, buckets[token]) for token in tokens)))
+        bucket_store.save_many(new)
+        for registry, position in cursors.items():
+            bucket_store.save_cursor(registry, position)
+
+        logger.info(f'indexed {len(new)} new tokens from {len(sources)} registries')
+        return len(new)
+
+
+def _atokens() -> List[Address]:
+    return [atoken.address for pool in aave.pools for atoken in pool.atokens]
+
+
+def _ctokens() -> List[Address]:
+    return [ctoken.address for troller in compound.trollers.values() for ctoken in troller.markets]
+
+
+def _curve_lp_tokens() -> List[Address]:
+    if not curve:
+        return []
+    # factory pools are their own lp tokens
+    factory_pools = {pool for pools in curve.metapools_by_factory.values() for pool in pools}
+    registry_pools = list(curve.pools - factory_pools)
+    lp_tokens = multicall_same_func_same_contract_different_inputs(
+        curve.registry, 'get_lp_token(address)(address)', inputs=registry_pools, return_None_on_failure=True
+    ) if registry_pools else []
+    return list(factory_pools) + [lp_token for lp_token in lp_tokens if lp_token and lp_token != ZERO_ADDRESS]
+
+
+def _chainlink_assets() -> List[Address]:
+    if not chainlink:
+        return []
+    return [asset.address for asset in chainlink.feeds]
+
+
+def _synths() -> List[Address]:
+    if not synthetix:
+        return []
+    # `synths` are the targets, the tokens people hold are their proxies
+    proxies = multicall_same_func_no_input(synthetix.synths, 'proxy()(address)', return_None_on_failure=True)
+    return list(synthetix.synths) + [proxy for proxy in proxies if proxy and proxy != ZERO_ADDRESS]
+
+
+def _new_uniswap_pairs() -> Tuple[List[Address], Dict[str, int]]:
+    '''
+    Returns the pairs with a supply that each uniswap factory has created since the last update, and the cursor to save for each factory.
+    '''
+    pairs, cursors = [], {}
+    for router in uniswap_multiplexer.routers.values():
+        registry = f'uniswap factory {router.factory}'
+        start = bucket_store.lookup_cursor(registry)
+        try:
+            end = raw_call(router.factory, 'allPairsLength()', output='int')
+            for i in range(start, end, PAIRS_PER_MULTICALL):
+                inputs = list(range(i, min(i + PAIRS_PER_MULTICALL, end)))
+                new_pairs = multicall_same_func_same_contract_different_inputs(router.factory, 'allPairs(uint256)(address)', inputs=inputs)
+                supplies = multicall_same_func_no_input(new_pairs, 'totalSupply()(uint)', return_None_on_failure=True)
+                pairs.extend(pair for pair, supply in zip(new_pairs, supplies) if supply)
+        except Exception as e:
+            logger.warning(f'unable to index the pairs for {registry}. {e.__class__.__name__}: {e}')
+            continue
+        cursors[registry] = end
+    return pairs, cursors
@@ -0,0 +1,244 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from brownie import chain, web3
+from eth_utils import encode_hex, event_signature_to_log_topic
+from joblib.parallel import Parallel, delayed
+from y import convert
+from y.datatypes import UsdPrice
+from y.exceptions import CantFindSwapPath
+from y.prices import magic
+from y.prices.chainlink import chainlink
+from y.prices.dex.uniswap import uniswap_multiplexer
+from y.prices.dex.uniswap.v3 import uniswap_v3
+from y.prices.stable_swap.curve import curve
+from y.prices.utils import dag
+from y.typing import Address, AnyAddressType, Block
+
+logger = logging.getLogger(__name__)
+
+# logs that mean a price we depend on may have changed
+TOPICS = [
+    'Sync(uint112,uint112)',                                        # uniswap v2 and forks
+    'Swap(address,uint256,uint256,uint256,uint256,address)',        # uniswap v2 and forks
+    'Swap(address,address,int256,int256,uint160,uint128,int24)',    # uniswap v3
+    'AnswerUpdated(int256,uint256,uint256)',                        # chainlink aggregators
+]
+TOPICS = [encode_hex(event_signature_to_log_topic(signature)) for signature in TOPICS]
+
+# we ask for the logs of this many addresses per eth_getLogs call
+ADDRESSES_PER_REQUEST = 500
+
+
+class PriceWatcher:
+    '''
+    Keeps the prices of a set of tokens up to date as new blocks arrive.
+
+    For each token we work out which pools and oracles its price comes from.
+    Each new block costs a few eth_getLogs calls, and a token is only repriced when one of those contracts emitted
+    `Sync`, `Swap` or `AnswerUpdated`. If we can't tell where a token's price comes from, ie for vaults and ctokens
+    whose share price moves every block, it is repriced every `unknown_interval` blocks.
+
+        with PriceWatcher(tokens, on_update=print) as watcher:
+            ...
+            watcher.get(token)
+
+    New blocks come from a block filter, or from polling `chain.height` if the node won't give us one.
+    You can also drive the watcher yourself by calling `update`.
+    '''
+
+    def __init__(
+        self,
+        tokens: Iterable[AnyAddressType] = (),
+        on_update: Optional[Callable[[Address, Optional[UsdPrice], Block], Any]] = None,
+        poll_interval: float = 1,
+        refresh_interval: int = 1_000,
+        unknown_interval: int = 1
+        ) -> None:
+
+        self.on_update = on_update
+        self.poll_interval = poll_interval
+        self.unknown_interval = unknown_interval
+        # we work out every token's dependencies again after this many blocks in case the deepest pools have changed
+        self.refresh_interval = refresh_interval
+
+        self.prices: Dict[Address, Optional[UsdPrice]] = {}
+        # the block we last priced each token at
+        self._priced_at: Dict[Address, Block] = {}
+        self.block: Optional[Block] = None
+        self._dependencies: Dict[Address, Optional[Set[Address]]] = {}
+        self._new_tokens: Set[Address] = set()
+        self._refreshed_at: Optional[Block] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        for token in tokens:
+            self.watch(token)
+
+    def __repr__(self) -> str:
+        return f"<PriceWatcher tokens={len(self._dependencies) + len(self._new_tokens)} block={self.block}>"
+
+    def __enter__(self) -> 'PriceWatcher':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def watch(self, token: AnyAddressType) -> None:
+        '''
+        Adds `token` to the watch list. It will be priced on the next update.
+        '''
+        with self._lock:
+            self._new_tokens.add(convert.to_address(token))
+
+    def unwatch(self, token: AnyAddressType) -> None:
+        token = convert.to_address(token)
+        with self._lock:
+            self._new_tokens.discard(token)
+            self._dependencies.pop(token, None)
+            self.prices.pop(token, None)
+            self._priced_at.pop(token, None)
+
+    def get(self, token: AnyAddressType) -> Optional[UsdPrice]:
+        return self.prices.get(convert.to_address(token))
+
+    def start(self) -> 'PriceWatcher':
+        '''
+        Starts watching for new blocks in a background thread.
+        '''
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='PriceWatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def update(self, block: Optional[Block] = None) -> Dict[Address, Optional[UsdPrice]]:
+        '''
+        Brings every watched token up to date as of `block`. Returns the prices that were recomputed.
+        '''
+        block = block or chain.height
+        if self.block is not None and block <= self.block:
+            return {}
+
+        with self._lock:
+            new_tokens, self._new_tokens = self._new_tokens, set()
+        if self._refreshed_at is None or block - self._refreshed_at >= self.refresh_interval:
+            new_tokens |= set(self._dependencies)
+            self._refreshed_at = block
+        self._resolve_dependencies(new_tokens, block)
+
+        if self.block is None:
+            stale = list(self._dependencies)
+        else:
+            emitters = self._emitters(self.block + 1, block)
+            stale = [
+                token for token, dependencies in self._dependencies.items()
+                if token in new_tokens
+                or (dependencies is None and block - self._priced_at.get(token, 0) >= self.unknown_interval)
+                or (dependencies and dependencies & emitters)
+            ]
+
+        prices = dict(zip(stale, magic.get_prices(stale, block, fail_to_None=True, silent=True)))
+        with self._lock:
+            # a token might have been unwatched while we were pricing it
+            prices = {token: price for token, price in prices.items() if token in self._dependencies}
+            self.prices.update(prices)
+            self._priced_at.update((token, block) for token in prices)
+            self.block = block
+
+        if self.on_update:
+            for token, price in prices.items():
+                self.on_update(token, price, block)
+        logger.debug(f'{self} repriced {len(prices)} tokens')
+        return prices
+
+    def _resolve_dependencies(self, tokens: Iterable[Address], block: Block) -> None:
+        tokens = list(tokens)
+        resolved = Parallel(4, 'threading')(delayed(dependencies)(token, block) for token in tokens)
+        with self._lock:
+            self._dependencies.update(zip(tokens, resolved))
+
+    def _emitters(self, from_block: Block, to_block: Block) -> Set[Address]:
+        '''
+        Returns every contract we depend on that emitted one of `TOPICS` between `from_block` and `to_block`, inclusive.
+        '''
+        addresses = sorted({address for deps in self._dependencies.values() if deps for address in deps})
+        emitters = set()
+        for i in range(0, len(addresses), ADDRESSES_PER_REQUEST):
+            logs = web3.eth.get_logs({
+                'address': addresses[i:i+ADDRESSES_PER_REQUEST],
+                'topics': [TOPICS],
+                'fromBlock': from_block,
+                'toBlock': to_block,
+            })
+            emitters.update(convert.to_address(log['address']) for log in logs)
+        return emitters
+
+    def _run(self) -> None:
+        new_heads = self._new_heads()
+        while not self._stopped.is_set():
+            try:
+                if new_heads is None:
+                    if chain.height != self.block:
+                        self.update()
+                elif new_heads.get_new_entries() or self.block is None:
+                    self.update()
+            except Exception as e:
+                logger.warning(f'{self} failed to update, will try again. {e.__class__.__name__}: {e}')
+                new_heads = self._new_heads()
+            self._stopped.wait(self.poll_interval)
+
+    def _new_heads(self) -> Any:
+        try:
+            return web3.eth.filter('latest')
+        except Exception as e:
+            logger.info(f'unable to create a block filter, falling back to polling. {e.__class__.__name__}: {e}')
+            return None
+
+
+def dependencies(token: AnyAddressType, block: Optional[Block] = None) -> Optional[Set[Address]]:
+    '''
+    Returns the contracts whose `TOPICS` logs can change the price of `token`, or `None` if we can't tell.
+    '''
+    pricing_dag = dag.PricingDAG(block or chain.height)
+    pricing_dag.expand([convert.to_address(token)])
+    deps = set()
+    for node, bucket in pricing_dag.buckets.items():
+        try:
+            node_deps = _direct_dependencies(node, bucket)
+        except Exception as e:
+            logger.debug(f'unable to find the dependencies of {bucket} {node}. {e.__class__.__name__}: {e}')
+            return None
+        if node_deps is None:
+            return None
+        deps |= node_deps
+    return deps
+
+
+def _direct_dependencies(token: Address, bucket: Optional[str]) -> Optional[Set[Address]]:
+    # these are priced entirely from their underlyings, which are part of the DAG
+    if bucket in ['atoken', 'convex', 'one to one', 'stable usd', 'wrapped gas coin']:
+        return set()
+    elif bucket == 'chainlink feed':
+        return {chainlink.aggregator(token)}
+    elif bucket == 'uni or uni-like lp':
+        return {token}
+    # with no bucket, `_get_price` tries curve, then uniswap v3, then uniswap v2. we don't watch curve pools.
+    elif bucket is None and not (curve and token in curve.coin_to_pools):
+        pools = set(uniswap_v3.get_pools(token)) if uniswap_v3 else set()
+        router = uniswap_multiplexer.deepest_router(token)
+        if router is not None:
+            try:
+                pools |= set(router.pools_on_path(router.get_path_to_stables(token)))
+            except CantFindSwapPath:
+                pass
+        return pools or None
+    return None
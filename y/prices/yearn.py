@@ -1,6 +1,7 @@
 import logging
-from functools import cached_property, lru_cache
-from typing import Any, Optional
+from collections import defaultdict
+from functools import cached_property
+from typing import Any, List, Optional
 
 from brownie import chain
 from y import Network
@@ -10,9 +11,13 @@ from y.datatypes import UsdPrice
 from y.decorators import log
 from y.exceptions import (CantFetchParam, ContractNotVerified,
                           MessedUpBrownieContract)
+from y.prices import magic
 from y.typing import AnyAddressType, Block
 from y.utils.cache import memory
+from y.utils.multicall import (batch_call_same_func_at_blocks,
+                               multicall_same_func_no_input)
 from y.utils.raw_calls import raw_call
+from y.utils.reorg import reorg_cache
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +70,39 @@ def is_yearn_vault(token: AnyAddressType) -> bool:
 def get_price(token: AnyAddressType, block: Optional[Block] = None) -> UsdPrice:
     return YearnInspiredVault(token).price(block=block)
 
+@log(logger)
+def get_prices_at_blocks(token: AnyAddressType, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+    return YearnInspiredVault(token).prices_at_blocks(blocks)
+
+@log(logger)
+def get_prices(tokens: List[AnyAddressType], block: Optional[Block] = None) -> List[Optional[UsdPrice]]:
+    '''
+    Prices many vaults at `block`. Vaults are grouped by their share price method and each group is fetched with one multicall.
+    '''
+    vaults = [YearnInspiredVault(token) for token in tokens]
+    groups = defaultdict(set)
+    for vault in vaults:
+        try:
+            method = vault.share_price_method
+        except AssertionError:
+            # `probe` found more than one share price method, we'll leave this one for `get_price`
+            continue
+        if method:
+            groups[method].add(vault.address)
+
+    share_prices = {}
+    for method, addresses in groups.items():
+        addresses = list(addresses)
+        responses = multicall_same_func_no_input(addresses, method, block=block, return_None_on_failure=True)
+        share_prices.update(zip(addresses, responses))
+
+    underlying_prices = magic.get_prices([vault.underlying.address for vault in vaults], block, fail_to_None=True, silent=True)
+    return [
+        None if share_prices.get(vault.address) is None or price is None
+        else UsdPrice(share_prices[vault.address] / vault.share_price_scale * price)
+        for vault, price in zip(vaults, underlying_prices)
+    ]
+
 class YearnInspiredVault(ERC20):
     # v1 vaults use getPricePerFullShare scaled to 18 decimals
     # v2 vaults use pricePerShare scaled to underlying token decimals
@@ -105,8 +143,19 @@ class YearnInspiredVault(ERC20):
         if underlying: return ERC20(underlying)
         else: raise CantFetchParam(f'underlying for {self.__repr__()}')
 
+    @cached_property
+    @log(logger)
+    def share_price_method(self) -> Optional[str]:
+        probed = probe(self.address, share_price_methods, return_method=True)
+        return None if probed is None else probed[0]
+
+    @property
+    def share_price_scale(self) -> float:
+        # v1 vaults use getPricePerFullShare scaled to 18 decimals
+        return 1e18 if self.share_price_method == 'getPricePerFullShare()(uint)' else self.underlying.scale
+
     @log(logger)
-    @lru_cache
+    @reorg_cache()
     def share_price(self, block: Optional[Block] = None) -> Optional[float]:
         method, share_price = probe(self.address, share_price_methods, block=block, return_method=True)
 
@@ -132,6 +181,19 @@ class YearnInspiredVault(ERC20):
             raise CantFetchParam(f'share_price for {self.__repr__()}')
     
     @log(logger)
-    @lru_cache
+    @reorg_cache()
     def price(self, block: Optional[Block] = None) -> UsdPrice:
         return UsdPrice(self.share_price(block=block) * self.underlying.price(block=block))
+
+    @log(logger)
+    def prices_at_blocks(self, blocks: List[Block]) -> List[Optional[UsdPrice]]:
+        if self.share_price_method is None:
+            return [None for _ in blocks]
+        share_prices = batch_call_same_func_at_blocks(self.address, self.share_price_method, blocks, return_None_on_failure=True)
+        scale = self.share_price_scale
+        underlying_prices = self.underlying.prices_at_blocks(blocks, return_None_on_failure=True)
+        return [
+            None if share_price is None or price is None
+            else UsdPrice(share_price / scale * price)
+            for share_price, price in zip(share_prices, underlying_prices)
+        ]
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+from weakref import WeakKeyDictionary
+
+logger = logging.getLogger(__name__)
+
+"""
+Helpers for ypricemagic's asyncio api.
+
+The pricing cascade is synchronous, so the asyncio api runs it on ypricemagic's own executor rather than the event loop's default one.
+The number of pricing jobs we keep in flight at once is bounded by one semaphore per event loop.
+You can set the limit with $YPRICEMAGIC_CONCURRENCY or with `set_concurrency`.
+"""
+
+CONCURRENCY = int(os.environ.get('YPRICEMAGIC_CONCURRENCY', 128))
+
+# we use our own executor so we never starve the event loop's default executor
+executor = ThreadPoolExecutor(CONCURRENCY, thread_name_prefix='ypricemagic')
+
+_semaphores: 'WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = WeakKeyDictionary()
+
+
+def set_concurrency(concurrency: int) -> None:
+    global CONCURRENCY, executor
+    assert concurrency > 0, '`concurrency` must be greater than 0'
+    CONCURRENCY = concurrency
+    _semaphores.clear()
+    old_executor, executor = executor, ThreadPoolExecutor(CONCURRENCY, thread_name_prefix='ypricemagic')
+    old_executor.shutdown(wait=False)
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def run_in_executor(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    '''
+    Runs blocking `func` on ypricemagic's executor without blocking the event loop.
+    '''
+    async with get_semaphore():
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
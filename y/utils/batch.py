@@ -0,0 +1,188 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from eth_abi import decode_abi, encode_abi
+from eth_utils import encode_hex
+from eth_utils import function_signature_to_4byte_selector as fourbyte
+from hexbytes import HexBytes
+from y.typing import Block
+
+logger = logging.getLogger(__name__)
+
+"""
+Transparent batching of `eth_call` requests.
+
+While a batch is open, the web3 middleware holds on to every plain `eth_call` for a short window and sends all of the calls
+for the same block as one `tryAggregate` on multicall2. Each caller blocks until the aggregate returns and then gets its own
+result, just as if it had sent the call itself. A call that fails inside the aggregate may only have run out of gas,
+so it is sent again on its own and its caller gets the node's own answer. Calls made through `raw_call`, `multicall.Call` and brownie
+contracts are all batched, from any thread.
+
+    with y.batch(block):
+        prices = y.get_prices(tokens, block)
+
+Batching only helps when calls are made concurrently, ie from the worker threads that `get_prices` uses.
+A thread making calls one after another waits for each batch before it can add its next call.
+Set `YPRICEMAGIC_BATCH_WINDOW` to a number of seconds to batch every call, without `y.batch`.
+
+Calls in a batch are made by multicall2, so `msg.sender` is the multicall2 contract rather than the zero address.
+"""
+
+# when set, every `eth_call` is batched using this window, in seconds
+BATCH_WINDOW = float(os.environ.get('YPRICEMAGIC_BATCH_WINDOW', 0))
+# we send a batch early once it holds this many calls
+BATCH_MAX_CALLS = int(os.environ.get('YPRICEMAGIC_BATCH_MAX_CALLS', 500))
+
+TRY_AGGREGATE = encode_hex(fourbyte('tryAggregate(bool,(address,bytes)[])'))
+# calls that are already multicalls are sent as they are
+AGGREGATES = [
+    'aggregate((address,bytes)[])',
+    'tryAggregate(bool,(address,bytes)[])',
+    'tryBlockAndAggregate(bool,(address,bytes)[])',
+    'blockAndAggregate((address,bytes)[])',
+    # multicall3
+    'aggregate3((address,bool,bytes)[])',
+    'aggregate3Value((address,bool,uint256,bytes)[])',
+]
+AGGREGATES = [encode_hex(fourbyte(signature)) for signature in AGGREGATES]
+
+# calls that failed inside an aggregate are sent again on their own from these threads, so they don't hold up the batch
+_retry_executor = ThreadPoolExecutor(16, thread_name_prefix='ypricemagic batch retry')
+
+_windows: List[Tuple[Optional[str], float]] = []
+_windows_lock = threading.Lock()
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.calls: List[Tuple[Dict[str, Any], Future]] = []
+        self.full = threading.Event()
+
+
+class Scheduler:
+    def __init__(self, max_calls: int = BATCH_MAX_CALLS) -> None:
+        self.max_calls = max_calls
+        self._pending: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, make_request: Callable, tx: Dict[str, Any], block_id: str, window: float) -> Dict[str, Any]:
+        '''
+        Adds `tx` to the open batch for `block_id` and returns its response once the batch has been sent.
+        The first call in a batch waits up to `window` seconds for more calls and then sends the batch.
+        '''
+        future: Future = Future()
+        with self._lock:
+            batch = self._pending.get(block_id)
+            leader = batch is None
+            if leader:
+                batch = self._pending[block_id] = _Batch()
+            batch.calls.append((tx, future))
+            if len(batch.calls) >= self.max_calls:
+                del self._pending[block_id]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(window)
+            with self._lock:
+                if self._pending.get(block_id) is batch:
+                    del self._pending[block_id]
+            _send(make_request, batch.calls, block_id)
+        return future.result()
+
+
+_scheduler = Scheduler()
+
+
+@contextmanager
+def batch(block: Optional[Block] = None, window: float = 0.01) -> Iterator[None]:
+    '''
+    Batches the `eth_call` requests made inside the `with` block, from any thread.
+    If `block` is given, only calls made at `block` are batched. See the module docstring for details.
+    '''
+    entry = (_block_identifier(block), window)
+    with _windows_lock:
+        _windows.append(entry)
+    try:
+        yield
+    finally:
+        with _windows_lock:
+            _windows.remove(entry)
+
+
+def should_batch(method: str, params: Any) -> bool:
+    return method == 'eth_call' and _window(params) > 0
+
+
+def submit(make_request: Callable, params: Any) -> Dict[str, Any]:
+    tx, block_id = params
+    return _scheduler.submit(make_request, tx, block_id, _window(params))
+
+
+def _window(params: Any) -> float:
+    # we can only batch plain calls, anything with a sender, value, gas or state override goes straight to the node
+    if len(params) != 2 or not isinstance(params[0], dict) or set(params[0]) - {'to', 'data'}:
+        return 0
+    if encode_hex(HexBytes(params[0].get('data', b'')))[:10] in AGGREGATES:
+        return 0
+    block_id = params[1]
+    windows = [window for block, window in list(_windows) if block is None or block == block_id]
+    return max(windows, default=BATCH_WINDOW)
+
+
+def _send(make_request: Callable, calls: List[Tuple[Dict[str, Any], Future]], block_id: str) -> None:
+    if len(calls) == 1:
+        tx, future = calls[0]
+        _send_one(make_request, tx, block_id, future)
+        return
+
+    try:
+        results = _try_aggregate(make_request, [tx for tx, _ in calls], block_id)
+    except Exception as e:
+        # if the aggregate fails as a whole, ie it ran out of gas, each call gets another chance on its own
+        logger.debug(f'batch of {len(calls)} calls at {block_id} failed, sending them one by one. {e.__class__.__name__}: {e}')
+        for tx, future in calls:
+            _send_one(make_request, tx, block_id, future)
+        return
+
+    for (tx, future), (success, data) in zip(calls, results):
+        if success:
+            future.set_result({'jsonrpc': '2.0', 'id': 0, 'result': encode_hex(data)})
+        else:
+            # it may have failed only because the aggregate ran low on gas. a revert we made up here would be
+            # cached as the call's answer, see `y.utils.call_cache`, so we let the node tell us whether it really reverts.
+            _retry_executor.submit(_send_one, make_request, tx, block_id, future)
+
+
+def _send_one(make_request: Callable, tx: Dict[str, Any], block_id: str, future: Future) -> None:
+    try:
+        future.set_result(make_request('eth_call', [tx, block_id]))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def _try_aggregate(make_request: Callable, txs: List[Dict[str, Any]], block_id: str) -> List[Tuple[bool, bytes]]:
+    # imported here to avoid a circular import, `y.utils.multicall` makes calls through this middleware when it is imported
+    from y.utils.multicall import multicall2, multicall_deploy_block
+
+    data = TRY_AGGREGATE + encode_hex(encode_abi(['bool', '(address,bytes)[]'], [False, [(tx['to'], HexBytes(tx['data'])) for tx in txs]]))[2:]
+    params = [{'to': multicall2.address, 'data': data}, block_id]
+    if block_id.startswith('0x') and int(block_id, 16) < multicall_deploy_block:
+        # use state override to resurrect the contract prior to deployment
+        params.append({multicall2.address: {'code': f'0x{multicall2.bytecode}'}})
+
+    response = make_request('eth_call', params)
+    if 'error' in response:
+        raise ValueError(response['error'])
+    return decode_abi(['(bool,bytes)[]'], HexBytes(response['result']))[0]
+
+
+def _block_identifier(block: Optional[Block]) -> Optional[str]:
+    if block is None:
+        return None
+    if isinstance(block, int):
+        return hex(block)
+    return block
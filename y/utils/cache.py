@@ -1,10 +1,48 @@
+import os
+from typing import Optional
+
 from brownie import chain
-from joblib import Memory
+from cachetools.func import ttl_cache
 from y.decorators import auto_retry
+from y.typing import Block
+from y.utils.kv_cache import SQLiteMemory, migrate_joblib
+
+# every cached function's results are kept in one sqlite db, see `y.utils.kv_cache`
+CACHE_PATH = os.environ.get('YPRICEMAGIC_CACHE_PATH', 'cache/{chainid}.sqlite')
+
+# blocks at least this far below the chain head are considered final and safe to cache on disk
+CONFIRMATIONS = int(os.environ.get('YPRICEMAGIC_CONFIRMATIONS', 64))
 
 
 @auto_retry
-def _memory():
-    return Memory(f"cache/{chain.id}", verbose=0)
+def _memory() -> SQLiteMemory:
+    return SQLiteMemory(CACHE_PATH.format(chainid=chain.id))
 
 memory = _memory()
+
+
+def migrate_joblib_cache(location: Optional[str] = None) -> int:
+    '''
+    Copies the results in the joblib cache that older versions of ypricemagic kept at `cache/{chain.id}` into `memory`.
+    Returns the number of results copied. See `y.utils.kv_cache.migrate_joblib`.
+    '''
+    # imported here so every function cached with `memory` is registered first
+    import y
+    return migrate_joblib(memory, location or f"cache/{chain.id}")
+
+
+@ttl_cache(ttl=10)
+def _chain_height() -> int:
+    # A stale height is only ever lower than the real one, so it can only make `is_finalized` more conservative.
+    return chain.height
+
+
+def finalized_block() -> Block:
+    '''
+    Returns the newest block that `is_finalized`.
+    '''
+    return _chain_height() - CONFIRMATIONS
+
+
+def is_finalized(block: Block) -> bool:
+    return block <= finalized_block()
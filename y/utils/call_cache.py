@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from brownie import chain
+from eth_utils import encode_hex
+from hexbytes import HexBytes
+from y.exceptions import call_reverted
+from y.utils import shared_cache
+from y.utils.cache import is_finalized
+from y.utils.kv_cache import packb, unpackb
+from y.utils.reorg import block_hashes
+from y.utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+"""
+An on-disk cache for `eth_call` responses at explicit blocks.
+
+A call at a block at least `y.utils.cache.CONFIRMATIONS` below the chain head always returns the same thing,
+so we keep its response keyed by a hash of the call's `to`, `data` and block (and `from` and state override, if any).
+Reverts are kept too, since probing for methods that don't exist is a big part of pricing a new token.
+Calls at a block that isn't final yet are keyed by the block's hash, see `y.utils.reorg`, so a reorged block never
+matches the calls cached for the block it replaced. Calls at 'latest' are never cached.
+
+The cache sits in the web3 middleware and in `y.utils.jsonrpc`, so every call made through brownie, `multicall`
+or a JSON-RPC batch is covered. Re-running a backfill that crashed sends almost no calls to the node.
+
+The default cache is a sqlite db at $YPRICEMAGIC_CALL_CACHE_PATH (default: cache/calls.sqlite)
+which holds at most $YPRICEMAGIC_CALL_CACHE_MAX_MB megabytes (default: 1024).
+You can plug in your own cache, or disable it entirely, with `set_call_cache`.
+If a cache shared between processes is set up, see `y.utils.shared_cache`, we check it after our own cache and write every response to it too.
+"""
+
+CALL_CACHE_PATH = os.environ.get('YPRICEMAGIC_CALL_CACHE_PATH', 'cache/calls.sqlite')
+CALL_CACHE_MAX_MB = int(os.environ.get('YPRICEMAGIC_CALL_CACHE_MAX_MB', 1024))
+
+# sqlite limits the number of host parameters in a single statement
+_MAX_PARAMS = 900
+
+# a call with any other field, ie gas or value, might not return the same thing twice
+_CACHEABLE_FIELDS = {'to', 'data', 'from'}
+
+
+class CallCache:
+    '''
+    Base class for call caches. Subclass this and pass an instance to `set_call_cache` to use your own backend.
+    Responses are dicts with either a `result` or an `error`. Implementations must be thread-safe.
+    '''
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, Dict[str, Any]]:
+        '''
+        Returns the stored response for each key in `keys` that has one. Keys that aren't stored are left out.
+        '''
+        raise NotImplementedError
+
+    def set_many(self, responses: Dict[bytes, Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def count(self, hits: int, misses: int) -> None:
+        with self._counters_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+class SQLiteCallCache(CallCache, SQLiteStore):
+    schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS calls (
+            chainid INTEGER NOT NULL,
+            key BLOB NOT NULL,
+            response TEXT NOT NULL,
+            PRIMARY KEY (chainid, key)
+        )
+        ''',
+    )
+
+    # we check the size of the db once every `evict_interval` writes
+    evict_interval = 10_000
+    # when the db is too big, we drop this fraction of the oldest entries
+    evict_fraction = 0.1
+
+    def __init__(self, path: str = CALL_CACHE_PATH, max_mb: int = CALL_CACHE_MAX_MB) -> None:
+        CallCache.__init__(self)
+        SQLiteStore.__init__(self, path)
+        self.chainid = chain.id
+        self.max_bytes = max_mb * 1024 * 1024
+        self._writes = 0
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, Dict[str, Any]]:
+        keys = list(dict.fromkeys(keys))
+        responses = {}
+        for i in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[i:i+_MAX_PARAMS]
+            rows = self.execute(
+                f'SELECT key, response FROM calls WHERE chainid = ? AND key IN ({",".join("?" * len(chunk))})',
+                (self.chainid, *chunk),
+            )
+            responses.update((key, json.loads(response)) for key, response in rows)
+        return responses
+
+    def set_many(self, responses: Dict[bytes, Dict[str, Any]]) -> None:
+        if not responses:
+            return
+        self.executemany(
+            'INSERT OR REPLACE INTO calls (chainid, key, response) VALUES (?, ?, ?)',
+            ((self.chainid, key, json.dumps(response)) for key, response in responses.items()),
+        )
+        self._writes += len(responses)
+        if self._writes >= self.evict_interval:
+            self._writes = 0
+            self._evict()
+
+    def _evict(self) -> None:
+        size = self.size()
+        if size <= self.max_bytes:
+            return
+        count = self.execute('SELECT COUNT(*) FROM calls')[0][0]
+        to_delete = max(int(count * self.evict_fraction), 1)
+        logger.info(f'{self} is {size} bytes, evicting the oldest {to_delete} calls')
+        self.execute('DELETE FROM calls WHERE rowid IN (SELECT rowid FROM calls ORDER BY rowid LIMIT ?)', (to_delete,))
+
+
+def _default_call_cache() -> Optional[CallCache]:
+    try:
+        return SQLiteCallCache()
+    except Exception as e:
+        logger.warning(f'unable to open the call cache at {CALL_CACHE_PATH}, continuing without it. {e.__class__.__name__}: {e}')
+        return None
+
+_call_cache: Optional[CallCache] = _default_call_cache()
+
+
+def get_call_cache() -> Optional[CallCache]:
+    return _call_cache
+
+
+def set_call_cache(call_cache: Optional[CallCache]) -> None:
+    '''
+    Replaces the cache the middleware reads `eth_call` responses from and writes them to. Pass `None` to disable the cache.
+    '''
+    global _call_cache
+    _call_cache = call_cache
+
+
+def stats() -> Dict[str, Any]:
+    '''
+    Returns the hits and misses of the call cache since the process started.
+    '''
+    store = get_call_cache()
+    return {'hits': 0, 'misses': 0, 'hit_rate': 0.0} if store is None else store.stats()
+
+
+def cache_key(method: str, params: Any) -> Optional[bytes]:
+    '''
+    Returns the key for the response to this request, or `None` if the response can't be cached.
+    '''
+    if method != 'eth_call' or (get_call_cache() is None and shared_cache.get_shared_cache() is None):
+        return None
+    if not 2 <= len(params) <= 3 or not isinstance(params[0], dict) or set(params[0]) - _CACHEABLE_FIELDS:
+        return None
+    block = _block_number(params[1])
+    if block is None:
+        return None
+    if not is_finalized(block):
+        # a block in the reorg window can still be replaced, so we key calls at it by its hash instead
+        block = block_hashes.hash_of(block)
+        if block is None:
+            return None
+    tx = {field: encode_hex(HexBytes(value)) if field == 'data' else str(value).lower() for field, value in params[0].items()}
+    content = [tx, block, *params[2:]]
+    return hashlib.blake2b(json.dumps(content, sort_keys=True, default=encode_hex).encode(), digest_size=20).digest()
+
+
+def lookup_many(keys: Iterable[bytes]) -> Dict[bytes, Dict[str, Any]]:
+    '''
+    Returns the cached response for each key that has one, and counts the hits and misses.
+    '''
+    store = get_call_cache()
+    keys = list(keys)
+    responses = {} if store is None else store.get_many(keys)
+    missing = [key for key in keys if key not in responses]
+    if missing:
+        responses.update((key, unpackb(value)) for key, value in shared_cache.lookup_many('calls', missing).items())
+    if store is not None:
+        store.count(hits=len(responses), misses=len(keys) - len(responses))
+    return responses
+
+
+def lookup(key: bytes) -> Optional[Dict[str, Any]]:
+    return lookup_many([key]).get(key)
+
+
+def save_many(responses: Dict[bytes, Dict[str, Any]]) -> None:
+    '''
+    Writes responses to the cache, skipping any error that isn't a revert, ie a timeout or a rate limit.
+    '''
+    responses = {
+        key: {'error': response['error']} if 'error' in response else {'result': response['result']}
+        for key, response in responses.items()
+        if 'result' in response or ('error' in response and call_reverted(ValueError(response['error'])))
+    }
+    store = get_call_cache()
+    if store is not None:
+        store.set_many(responses)
+    shared_cache.save_many('calls', {key: packb(response) for key, response in responses.items()})
+
+
+def save(key: bytes, response: Dict[str, Any]) -> None:
+    save_many({key: response})
+
+
+def _block_number(block_identifier: Any) -> Optional[int]:
+    if isinstance(block_identifier, int):
+        return block_identifier
+    # a block hash is 66 characters long, a block number at most 18
+    if isinstance(block_identifier, str) and block_identifier.startswith('0x') and len(block_identifier) <= 18:
+        return int(block_identifier, 16)
+    # 'latest', 'pending', block hashes, etc.
+    return None
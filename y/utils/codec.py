@@ -0,0 +1,195 @@
+import binascii
+import json
+import logging
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from brownie.convert.datatypes import EthAddress, ReturnValue, Wei
+from brownie.convert.normalize import format_input, format_output
+from brownie.convert.utils import get_type_strings
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.encoding import TupleEncoder
+from eth_abi.registry import registry
+from eth_utils import encode_hex
+from eth_utils import function_signature_to_4byte_selector as fourbyte
+from hexbytes import HexBytes
+
+logger = logging.getLogger(__name__)
+
+"""
+Precompiled ABI codecs for contract calls.
+
+Calling `contract.fn.encode_input` and `contract.fn.decode_output` looks up the method, resolves overloads,
+parses the ABI types and builds an eth_abi encoder or decoder every time. For a multicall with thousands of calls
+that work costs about as much as the call itself. A `FunctionCodec` does it once per function ABI,
+so encoding and decoding a call is a single pass through eth_abi.
+
+Encoded inputs and decoded outputs are the same as brownie's.
+
+`decode_aggregate_columns` goes further for large multicalls of one function with static outputs.
+It decodes the whole aggregate response into one numpy array per output, without building a python object per call.
+"""
+
+# brownie's formatting for single values of these types, skipping the checks that can't fail on decoded values
+_SCALAR_FORMATTERS: Dict[str, Callable[[Any], Any]] = {
+    'address': EthAddress,
+    'bool': bool,
+    **{f'uint{bits}': Wei for bits in range(8, 257, 8)},
+    **{f'int{bits}': Wei for bits in range(8, 257, 8)},
+}
+
+
+class FunctionCodec:
+    '''
+    Encodes inputs for, and decodes outputs from, a single contract function.
+    '''
+
+    def __init__(self, abi: Dict[str, Any]) -> None:
+        self.abi = abi
+        self.name = abi['name']
+        self.input_types = get_type_strings(abi['inputs'])
+        self.output_types = get_type_strings(abi['outputs'])
+        self.signature = f"{self.name}({','.join(self.input_types)})"
+        self.selector = encode_hex(fourbyte(self.signature))
+        self._encoder = TupleEncoder(encoders=[registry.get_encoder(type_str) for type_str in self.input_types])
+        self._decoder = TupleDecoder(decoders=[registry.get_decoder(type_str) for type_str in self.output_types])
+        # `None` if any output needs brownie's full formatting
+        self._formatters: Optional[List[Callable[[Any], Any]]] = None
+        if all(type_str in _SCALAR_FORMATTERS for type_str in self.output_types):
+            self._formatters = [_SCALAR_FORMATTERS[type_str] for type_str in self.output_types]
+
+    def __repr__(self) -> str:
+        return f"<FunctionCodec {self.signature}>"
+
+    def encode_input(self, *args: Any) -> str:
+        if not self.input_types:
+            if args:
+                raise TypeError(f"{self.name} requires no arguments")
+            return self.selector
+        try:
+            data = self._encoder(args)
+        except Exception:
+            # the inputs need converting first, ie contracts passed as addresses or strings passed as ints
+            data = self._encoder(format_input(self.abi, args))
+        return self.selector + data.hex()
+
+    def decode_output(self, data: bytes) -> Any:
+        '''
+        Same as brownie's `decode_output`. Returns a single value if the function has one output.
+        '''
+        values = self.decode_raw(data)
+        if self._formatters is None:
+            result = format_output(self.abi, values)
+        elif len(values) == 1:
+            return self._formatters[0](values[0])
+        else:
+            result = ReturnValue([formatter(value) for formatter, value in zip(self._formatters, values)], self.abi['outputs'])
+        return result[0] if len(result) == 1 else result
+
+    def decode_raw(self, data: bytes) -> Tuple[Any, ...]:
+        '''
+        Decodes `data` with eth_abi only, without brownie's formatting.
+        '''
+        return self._decoder(ContextFramesBytesIO(HexBytes(data)))
+
+
+_codecs: Dict[Tuple[str, str, int], FunctionCodec] = {}
+_codecs_lock = threading.Lock()
+
+
+def codec(contract: Any, fn_name: str, n_inputs: int) -> FunctionCodec:
+    '''
+    Returns the codec for the function `fn_name` on `contract` that takes `n_inputs` inputs,
+    resolving overloads the same way brownie does.
+    '''
+    key = (str(contract), fn_name, n_inputs)
+    if key not in _codecs:
+        with _codecs_lock:
+            if key not in _codecs:
+                _codecs[key] = _function_codec(json.dumps(_function_abi(contract, fn_name, n_inputs), sort_keys=True))
+    return _codecs[key]
+
+
+def _function_abi(contract: Any, fn_name: str, n_inputs: int) -> Dict[str, Any]:
+    abis = [abi for abi in contract.abi if abi.get('type') == 'function' and abi['name'] == fn_name]
+    if not abis:
+        raise AttributeError(f"{contract} has no function '{fn_name}'")
+    if len(abis) == 1:
+        return abis[0]
+    abis = [abi for abi in abis if len(abi['inputs']) == n_inputs]
+    if not abis:
+        raise ValueError("No function matching the given number of arguments")
+    if len(abis) > 1:
+        raise ValueError(f"Contract has more than one function '{fn_name}' requiring {n_inputs} arguments.")
+    return abis[0]
+
+
+# contracts that share an ABI, ie every ERC20, share codecs
+@lru_cache(maxsize=None)
+def _function_codec(abi: str) -> FunctionCodec:
+    return FunctionCodec(json.loads(abi))
+
+
+_STATIC_TYPE = re.compile(r'^(u?int\d*|address|bool)$')
+
+
+def static_output_types(method: str) -> List[str]:
+    '''
+    Returns the output types of `method`, in the format `multicall.Call` uses, ie `'getReserves()((uint112,uint112,uint32))'`.
+    Static tuples are flattened since they are encoded inline. Raises `ValueError` unless every output is a uint, int, address or bool.
+    '''
+    outputs = method[method.index(')') + 1:].replace('(', '').replace(')', '')
+    types = [type_str for type_str in outputs.split(',') if type_str]
+    if not types or not all(_STATIC_TYPE.match(type_str) for type_str in types):
+        raise ValueError(f'{method} must return only uints, ints, addresses and bools')
+    return types
+
+
+def decode_aggregate_columns(response: bytes, output_types: List[str]) -> Tuple[List[np.ndarray], np.ndarray]:
+    '''
+    Decodes the `(bool,bytes)[]` returned by `tryAggregate` or `aggregate3`, where every call returns `output_types`,
+    into one array per output and a mask of the calls that succeeded.
+
+    uints and ints of 64 bits or less are `uint64` and `int64` arrays. Larger ones are `object` arrays of python ints.
+    bools are `bool` arrays and addresses are `S42` arrays of lowercase hex. Calls that failed have zeros.
+    '''
+    n_words = len(output_types)
+    # we pad the response so reading the data of a failed call can't run off the end
+    buf = np.frombuffer(bytes(response) + bytes(32 * n_words), dtype=np.uint8)
+    n_calls = int(_words_to_u64(buf, np.array([32]))[0])
+    # each call's offset is relative to the word after the array's length
+    offsets = _words_to_u64(buf, 64 + 32 * np.arange(n_calls)) + 64
+    success = buf[offsets + 31] != 0
+    lengths = _words_to_u64(buf, offsets + 64)
+    valid = success & (lengths == 32 * n_words)
+
+    starts = np.where(valid, offsets + 96, 0)
+    words = buf[starts[:, None] + np.arange(32 * n_words)].reshape(n_calls, n_words, 32)
+    words[~valid] = 0
+    return [_decode_column(words[:, i, :], type_str) for i, type_str in enumerate(output_types)], valid
+
+
+def _words_to_u64(buf: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    # offsets and lengths always fit in the last 8 bytes of their word
+    return buf[np.asarray(positions)[:, None] + np.arange(24, 32)].copy().view('>u8').ravel().astype(np.int64)
+
+
+def _decode_column(words: np.ndarray, type_str: str) -> np.ndarray:
+    if type_str == 'bool':
+        return words[:, 31] != 0
+    if type_str == 'address':
+        hexed = np.frombuffer(binascii.hexlify(np.ascontiguousarray(words[:, 12:]).tobytes()), dtype='S40')
+        return np.char.add(b'0x', hexed)
+    signed = not type_str.startswith('uint')
+    bits = int(type_str.lstrip('uint') or 256)
+    if bits <= 64:
+        return np.ascontiguousarray(words[:, 24:]).view('>i8' if signed else '>u8').ravel().astype(np.int64 if signed else np.uint64)
+    # too big for a native dtype, so we build python ints from 64 bit limbs
+    limbs = np.ascontiguousarray(words).view('>u8').astype(object)
+    values = ((limbs[:, 0] * 2 ** 64 + limbs[:, 1]) * 2 ** 64 + limbs[:, 2]) * 2 ** 64 + limbs[:, 3]
+    if signed:
+        values = np.where(words[:, 0] >= 0x80, values - 2 ** 256, values)
+    return values
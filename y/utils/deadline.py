@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator, Optional
+
+from y.exceptions import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+"""
+Latency budgets for pricing.
+
+`get_price(..., timeout=10)` runs the pricing cascade inside `time_limit(10)`. Slow steps call `check` before they start,
+and raise `DeadlineExceeded` once the budget is spent, so we stop early instead of working until we find a price.
+The limit is kept per thread. Use `propagate` to carry it into worker threads.
+"""
+
+_local = threading.local()
+
+
+class _Limit:
+    def __init__(self, expires_at: float) -> None:
+        self.expires_at = expires_at
+
+    @property
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+def _current() -> Optional[_Limit]:
+    return getattr(_local, 'limit', None)
+
+
+def _set(limit: Optional[_Limit]) -> None:
+    _local.limit = limit
+
+
+@contextmanager
+def time_limit(timeout: Optional[float]) -> Iterator[Optional[_Limit]]:
+    '''
+    Limits the code inside the `with` block to `timeout` seconds. A `timeout` of `None` means no limit.
+    Nested limits can only tighten the limit that is already active.
+
+    Yields the new limit, or `None` if the active limit was already tighter. Each `DeadlineExceeded` carries the limit that expired,
+    so you can tell whether it was yours.
+    '''
+    previous = _current()
+    limit = None
+    if timeout is not None:
+        expires_at = time.monotonic() + timeout
+        if previous is None or expires_at < previous.expires_at:
+            limit = _Limit(expires_at)
+            _set(limit)
+    try:
+        yield limit
+    finally:
+        _set(previous)
+
+
+def remaining() -> Optional[float]:
+    '''
+    Returns the number of seconds left in the active limit, or `None` if there is no limit.
+    '''
+    limit = _current()
+    return None if limit is None else limit.remaining
+
+
+def check(what: str, seconds: float = 0) -> None:
+    '''
+    Raises `DeadlineExceeded` if the active limit won't allow `what`, which needs at least `seconds`, to finish.
+    '''
+    limit = _current()
+    if limit is not None and limit.remaining < seconds:
+        raise DeadlineExceeded(f'deadline exceeded, skipped {what}', limit=limit)
+
+
+def propagate(func: Callable) -> Callable:
+    '''
+    Returns a wrapped `func` that runs under the caller's limit, whichever thread it runs on.
+    '''
+    limit = _current()
+    if limit is None:
+        return func
+
+    @wraps(func)
+    def propagate_wrap(*args: Any, **kwargs: Any) -> Any:
+        previous = _current()
+        _set(limit)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _set(previous)
+
+    return propagate_wrap
+
+
+def wait(event: threading.Event, what: str) -> None:
+    '''
+    Waits for `event` for as long as the active limit allows. Raises `DeadlineExceeded` if the limit runs out first.
+    '''
+    limit = _current()
+    if limit is None:
+        event.wait()
+    elif not event.wait(max(limit.remaining, 0)):
+        raise DeadlineExceeded(f'deadline exceeded while waiting on {what}', limit=limit)
@@ -14,7 +14,7 @@ from web3.types import LogReceipt
 from y.contracts import contract_creation_block
 from y.decorators import auto_retry
 from y.typing import Address, Block
-from y.utils.cache import memory
+from y.utils import deadline, log_store, trace
 from y.utils.middleware import BATCH_SIZE
 
 logger = logging.getLogger(__name__)
@@ -48,24 +48,36 @@ def create_filter(address, topics=None):
 
 @auto_retry
 def get_logs_asap(address: Optional[Address], topics: Optional[List[str]], from_block: Optional[Block] = None, to_block: Optional[Block] = None, verbose: int = 0) -> List[Any]:
-    logs = []
-
+    '''
+    Returns every log matching `address` and `topics` from `from_block` to `to_block`.
+    Blocks we've already scanned for the same filter are read from `y.utils.log_store`, so we only fetch the rest.
+    '''
     if from_block is None:
         from_block = 0 if address is None else contract_creation_block(address)
     if to_block is None:
         to_block = chain.height
-
-    ranges = list(block_ranges(from_block, to_block, BATCH_SIZE))
+    if from_block > to_block:
+        # the same error `block_ranges` raises, callers rely on it
+        raise TypeError("Incompatible start and stop arguments.\nStart must be less than or equal to stop.")
+
+    log_filter = log_store.filter_key(address, topics)
+    logs, gaps = log_store.lookup(log_filter, from_block, to_block)
+    stored = len(logs)
+    ranges = [batch for start, end in gaps for batch in block_ranges(start, end, BATCH_SIZE)]
     if verbose > 0:
         logger.info('fetching %d batches', len(ranges))
-    
-    batches = Parallel(8, "threading", verbose=verbose)(delayed(_get_logs)(address, topics, start, end) for start, end in ranges)
+
+    get_logs = deadline.propagate(trace.propagate(_get_logs))
+    batches = Parallel(8, "threading", verbose=verbose)(delayed(get_logs)(address, topics, log_filter, start, end) for start, end in ranges)
     
     for batch in batches:
         logs.extend(batch)
         del batch
     del batches
 
+    if stored and ranges:
+        # the blocks we fetched can come before, between or after the ones we had stored
+        logs.sort(key=lambda log: (log['blockNumber'], log['logIndex']))
     return logs
 
 
@@ -100,13 +112,14 @@ def checkpoints_to_weight(checkpoints, start_block: Block, end_block: Block) ->
 def _get_logs(
     address: Optional[ChecksumAddress],
     topics: Optional[List[str]],
+    log_filter: str,
     start: Block,
     end: Block
     ) -> List[LogReceipt]:
-    if end - start == BATCH_SIZE - 1:
-        response = _get_logs_batch_cached(address, topics, start, end)
-    else:
-        response = _get_logs_no_cache(address, topics, start, end)
+    deadline.check(f'fetching logs for {address} from {start} to {end}')
+    response = _get_logs_no_cache(address, topics, start, end)
+    # each batch is stored as soon as we have it, so a scan that dies halfway doesn't have to start over
+    log_store.save(log_filter, start, end, response)
     return response
 
 
@@ -139,12 +152,3 @@ def _get_logs_no_cache(
             raise
     return response
 
-
-@memory.cache()
-def _get_logs_batch_cached(
-    address: Optional[str],
-    topics: Optional[List[str]],
-    start: Block,
-    end: Block
-    ) -> List[LogReceipt]:
-    return _get_logs_no_cache(address, topics, start, end)
@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from brownie import web3
+from joblib.parallel import Parallel, delayed
+from requests.adapters import HTTPAdapter
+from y.exceptions import call_reverted, call_too_large
+from y.utils import call_cache, deadline, trace
+from y.utils.middleware import should_cache
+
+logger = logging.getLogger(__name__)
+
+"""
+A transport for JSON-RPC batches, ie the same `eth_call` at hundreds of blocks in one HTTP request.
+
+`send_batch` takes a list of JSON-RPC requests and returns one response per request, in the same order.
+- batches are split to fit the provider's limit. When the provider rejects a batch as too large we halve the limit
+  for that endpoint and try again.
+- chunks of a batch are sent in parallel over a pooled session
+- a request that fails for any reason other than a revert is retried on its own through web3, so it gets the
+  middleware's caching and retries. Reverts are returned as error responses for the caller to handle.
+- requests that the cache middleware would cache are always sent through web3, so they hit the cache
+- `eth_call`s at finalized blocks are looked up in, and saved to, `y.utils.call_cache` without leaving the batch
+- providers that can't take HTTP batches, ie IPC and websockets, get every request through web3
+"""
+
+# the most requests we start out putting in one HTTP request
+JSONRPC_BATCH_MAX_REQUESTS = int(os.environ.get('YPRICEMAGIC_JSONRPC_BATCH_MAX_REQUESTS', 1_000))
+# how many chunks of one batch we send at once
+JSONRPC_BATCH_THREADS = int(os.environ.get('YPRICEMAGIC_JSONRPC_BATCH_THREADS', 8))
+# how many times we send a chunk before falling back to sending its requests one by one
+JSONRPC_BATCH_RETRIES = 3
+
+# what providers say when a batch has more requests than they take:
+# geth 'batch too large', erigon 'batch limit 100 exceeded', nethermind 'Batch size limit exceeded', alchemy 'Batch size is too large'
+_BATCH_TOO_LARGE = [
+    'batch too large',
+    'batch limit',
+    'batch size',
+]
+
+_batch_sizes: Dict[str, int] = {}
+_batch_sizes_lock = threading.Lock()
+
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=100, pool_maxsize=100))
+_session.mount("https://", HTTPAdapter(pool_connections=100, pool_maxsize=100))
+
+
+def send_batch(jsonrpc_batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Sends each request in `jsonrpc_batch` and returns its response, in the same order as the requests.
+    A request that failed has an `error` instead of a `result`, just like a response from the node.
+    '''
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(jsonrpc_batch)
+    keys = {}
+    if _endpoint() is not None:
+        for i, request in enumerate(jsonrpc_batch):
+            key = call_cache.cache_key(request['method'], request['params'])
+            if key is not None:
+                keys[i] = key
+        cached = call_cache.lookup_many(keys.values())
+        for i, key in keys.items():
+            if key in cached:
+                responses[i] = {'jsonrpc': '2.0', 'id': jsonrpc_batch[i].get('id'), **cached[key]}
+                trace.record_request(jsonrpc_batch[i]['method'], jsonrpc_batch[i]['params'], 0, cache_hit=True)
+
+    direct, batched = [], []
+    for i, request in enumerate(jsonrpc_batch):
+        if responses[i] is not None:
+            continue
+        if _endpoint() is None or should_cache(request['method'], request['params']):
+            direct.append(i)
+        else:
+            batched.append(i)
+
+    size = _batch_size()
+    tasks = [(_send_direct, [i]) for i in direct]
+    tasks += [(_send_chunk, batched[i:i+size]) for i in range(0, len(batched), size)]
+    if len(tasks) > 1:
+        results = Parallel(min(JSONRPC_BATCH_THREADS, len(tasks)), 'threading')(
+            delayed(deadline.propagate(trace.propagate(send)))([jsonrpc_batch[i] for i in indices]) for send, indices in tasks
+        )
+    else:
+        results = [send([jsonrpc_batch[i] for i in indices]) for send, indices in tasks]
+
+    for (_, indices), task_responses in zip(tasks, results):
+        for i, response in zip(indices, task_responses):
+            responses[i] = response
+    call_cache.save_many({keys[i]: responses[i] for i in batched if i in keys})
+    return responses
+
+
+def _send_direct(jsonrpc_batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_send_one(request) for request in jsonrpc_batch]
+
+
+def _send_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for attempt in range(JSONRPC_BATCH_RETRIES):
+        try:
+            responses = _post(chunk)
+            break
+        except Exception as e:
+            if len(chunk) > 1 and _too_large(e):
+                _shrink(len(chunk))
+                half = len(chunk) // 2
+                return _send_chunk(chunk[:half]) + _send_chunk(chunk[half:])
+            logger.debug(f'batch of {len(chunk)} requests failed, attempt {attempt + 1}. {e.__class__.__name__}: {e}')
+            if attempt + 1 < JSONRPC_BATCH_RETRIES:
+                deadline.check(f'retrying a batch of {len(chunk)} requests after a {2 ** attempt}s sleep', seconds=2 ** attempt)
+                time.sleep(2 ** attempt)
+    else:
+        # the provider just won't take this batch
+        return _send_direct(chunk)
+
+    # some providers drop requests from a batch, so we match responses to requests by id
+    by_id = {response.get('id'): response for response in responses}
+    return [
+        _check_response(request, by_id.get(i))
+        for i, request in enumerate(chunk)
+    ]
+
+
+def _post(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # we number the requests ourselves since the caller's ids don't need to be unique
+    payload = [{**request, 'id': i} for i, request in enumerate(chunk)]
+    start = time.perf_counter()
+    response = _session.post(_endpoint(), json=payload, timeout=600)
+    response.raise_for_status()
+    responses = response.json()
+    if trace.is_active():
+        latency = (time.perf_counter() - start) / len(chunk)
+        for request in chunk:
+            trace.record_request(request['method'], request['params'], latency, batch_size=len(chunk))
+    if not isinstance(responses, list):
+        # the provider rejected the batch as a whole
+        raise ValueError(responses.get('error', responses))
+    return responses
+
+
+def _check_response(request: Dict[str, Any], response: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if response is not None and 'error' not in response:
+        return {**response, 'id': request.get('id')}
+    if response is not None and call_reverted(ValueError(response['error'])):
+        return {**response, 'id': request.get('id')}
+    # the request was dropped, rate limited, timed out, etc. it gets another chance on its own.
+    return _send_one(request)
+
+
+def _send_one(request: Dict[str, Any]) -> Dict[str, Any]:
+    response = {'jsonrpc': '2.0', 'id': request.get('id')}
+    try:
+        response['result'] = web3.manager.request_blocking(request['method'], request['params'])
+    except ValueError as e:
+        response['error'] = e.args[0] if e.args and isinstance(e.args[0], dict) else {'message': str(e)}
+    return response
+
+
+def _too_large(e: Exception) -> bool:
+    message = str(e).lower()
+    return call_too_large(e) or any(trigger in message for trigger in _BATCH_TOO_LARGE)
+
+
+def _batch_size() -> int:
+    return _batch_sizes.get(_endpoint(), JSONRPC_BATCH_MAX_REQUESTS)
+
+
+def _shrink(size: int) -> None:
+    with _batch_sizes_lock:
+        _batch_sizes[_endpoint()] = max(min(_batch_size(), size // 2), 1)
+    logger.info(f'JSON-RPC batch too large for {_endpoint()}, now sending at most {_batch_size()} requests per batch')
+
+
+def _endpoint() -> Optional[str]:
+    endpoint = getattr(web3.provider, 'endpoint_uri', None)
+    return endpoint if endpoint and endpoint.startswith('http') else None
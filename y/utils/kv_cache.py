@@ -0,0 +1,260 @@
+import ast
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+from functools import update_wrapper
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import msgpack
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from y.utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+"""
+A drop-in replacement for joblib's `Memory` that keeps every cached call in one sqlite db.
+
+joblib pickles each call into its own directory. With millions of calls that is slow to read, runs out of inodes
+and races between processes. `SQLiteMemory` keeps them all in one table in WAL mode, so any number of processes
+can read while one writes, and serializes them with msgpack instead of pickle.
+
+    @memory.cache()
+    def has_method(address, method):
+        ...
+
+Calls are keyed by the function and a hash of its arguments, with defaults filled in, so `f(1)` and `f(x=1)` share a result.
+Like joblib, the results of a function are dropped when its source code changes.
+
+Results can be anything msgpack can pack, plus tuples, `HexBytes`, `AttributeDict` and ints of any size.
+Subclasses of builtin types come back as the builtin, ie an `EthAddress` comes back as a `str`.
+Results of any other type are returned but not cached.
+
+Results from an existing joblib cache can be copied over with `migrate_joblib`.
+"""
+
+_HEXBYTES, _ATTRIBUTE_DICT, _TUPLE, _BIG_INT = range(1, 5)
+
+# the only non-literal arguments we know how to read back from joblib's metadata
+_JOBLIB_REPRS = {repr(all): all, repr(any): any}
+
+
+class SQLiteMemory(SQLiteStore):
+    schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS calls (
+            func TEXT NOT NULL,
+            key BLOB NOT NULL,
+            value BLOB NOT NULL,
+            PRIMARY KEY (func, key)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS funcs (
+            func TEXT PRIMARY KEY,
+            version TEXT NOT NULL
+        )
+        ''',
+    )
+
+    def __init__(self, path: str) -> None:
+        SQLiteStore.__init__(self, path)
+        self.functions: Dict[str, CachedFunction] = {}
+
+    def cache(self, func: Optional[Callable] = None) -> Any:
+        '''
+        Decorates `func` so its results are cached. Works with and without parentheses, just like joblib's.
+        '''
+        if func is None:
+            return self.cache
+        cached = CachedFunction(self, func)
+        self.functions[cached.name] = cached
+        return cached
+
+    def get(self, func: str, key: bytes) -> Tuple[bool, Any]:
+        rows = self.execute('SELECT value FROM calls WHERE func = ? AND key = ?', (func, key))
+        return (True, unpackb(rows[0][0])) if rows else (False, None)
+
+    def contains(self, func: str, key: bytes) -> bool:
+        return bool(self.execute('SELECT 1 FROM calls WHERE func = ? AND key = ?', (func, key)))
+
+    def set_many(self, func: str, values: Dict[bytes, bytes]) -> None:
+        '''
+        Writes `values`, which are already packed, for `func`.
+        '''
+        if not values:
+            return
+        self.executemany(
+            'INSERT OR REPLACE INTO calls (func, key, value) VALUES (?, ?, ?)',
+            ((func, key, value) for key, value in values.items()),
+        )
+
+    def check_version(self, func: str, version: str) -> None:
+        '''
+        Drops the results of `func` if they were cached by a different version of its code.
+        '''
+        rows = self.execute('SELECT version FROM funcs WHERE func = ?', (func,))
+        if rows and rows[0][0] == version:
+            return
+        if rows:
+            logger.info(f'the code for {func} has changed, dropping its cached results')
+            self.execute('DELETE FROM calls WHERE func = ?', (func,))
+        self.execute('INSERT OR REPLACE INTO funcs (func, version) VALUES (?, ?)', (func, version))
+
+
+class CachedFunction:
+    '''
+    A function whose results are cached in a `SQLiteMemory`. Returned by `SQLiteMemory.cache`.
+    '''
+
+    def __init__(self, memory: SQLiteMemory, func: Callable) -> None:
+        self.memory = memory
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self._signature = inspect.signature(func)
+        self._checked = False
+        self._lock = threading.Lock()
+        update_wrapper(self, func)
+
+    def __repr__(self) -> str:
+        return f"<CachedFunction {self.name}>"
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        self._check_version()
+        key = self._key(args, kwargs)
+        found, value = self.memory.get(self.name, key)
+        if found:
+            return value
+        value = self.func(*args, **kwargs)
+        try:
+            packed = packb(value)
+        except (TypeError, ValueError, OverflowError) as e:
+            logger.debug(f'unable to cache the result of {self.name}. {e.__class__.__name__}: {e}')
+        else:
+            self.memory.set_many(self.name, {key: packed})
+        return value
+
+    def check_call_in_cache(self, *args: Any, **kwargs: Any) -> bool:
+        self._check_version()
+        return self.memory.contains(self.name, self._key(args, kwargs))
+
+    def _key(self, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> bytes:
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        packed = msgpack.packb(list(bound.arguments.items()), default=_key_default)
+        return hashlib.blake2b(packed, digest_size=20).digest()
+
+    def _check_version(self) -> None:
+        if self._checked:
+            return
+        with self._lock:
+            if not self._checked:
+                self.memory.check_version(self.name, _version(self.func))
+                self._checked = True
+
+
+def migrate_joblib(memory: SQLiteMemory, location: str) -> int:
+    '''
+    Copies the results in the joblib cache at `location` into `memory`, for every function cached with `memory`.
+    Import the modules that define your cached functions first. Returns the number of results copied.
+
+    Results whose arguments joblib didn't record as python literals, ie contracts, can't be keyed and are skipped.
+    The joblib cache is left as it was.
+    '''
+    # joblib is only needed for the migration
+    import joblib
+    from joblib.func_inspect import get_func_name
+
+    copied = 0
+    for cached in list(memory.functions.values()):
+        module, name = get_func_name(cached.func)
+        directory = os.path.join(location, 'joblib', *module, name)
+        if not os.path.isdir(directory):
+            continue
+        cached._check_version()
+        values, skipped = {}, 0
+        for entry in os.scandir(directory):
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, 'metadata.json')) as f:
+                    input_args = json.load(f)['input_args']
+                kwargs = {arg: _literal(value) for arg, value in input_args.items()}
+                values[cached._key((), kwargs)] = packb(joblib.load(os.path.join(entry.path, 'output.pkl')))
+            except Exception as e:
+                logger.debug(f'unable to migrate {entry.path}. {e.__class__.__name__}: {e}')
+                skipped += 1
+        memory.set_many(cached.name, values)
+        copied += len(values)
+        logger.info(f'migrated {len(values)} results for {cached.name} from {directory}, skipped {skipped}')
+    return copied
+
+
+def _version(func: Callable) -> str:
+    try:
+        code = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        code = getattr(getattr(func, '__code__', None), 'co_code', b'')
+    return hashlib.blake2b(code, digest_size=16).hexdigest()
+
+
+def _literal(value: str) -> Any:
+    if value in _JOBLIB_REPRS:
+        return _JOBLIB_REPRS[value]
+    return ast.literal_eval(value)
+
+
+def _key_default(obj: Any) -> Any:
+    # arguments only need to hash the same way every time, they never need to be read back
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        return f'{obj.__module__}.{obj.__qualname__}'
+    if isinstance(obj, int):
+        return str(obj)
+    # ie a brownie `Contract`, which is its address
+    return f'{type(obj).__name__}:{obj}'
+
+
+def packb(value: Any) -> bytes:
+    '''
+    Serializes `value` with msgpack. See the module docstring for the types we support.
+    '''
+    return msgpack.packb(value, default=_default, strict_types=True)
+
+
+def unpackb(packed: bytes) -> Any:
+    return msgpack.unpackb(packed, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def _default(obj: Any) -> Any:
+    # with `strict_types`, subclasses of builtin types end up here too
+    if isinstance(obj, HexBytes):
+        return msgpack.ExtType(_HEXBYTES, bytes(obj))
+    if isinstance(obj, AttributeDict):
+        return msgpack.ExtType(_ATTRIBUTE_DICT, packb(dict(obj)))
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(_TUPLE, packb(list(obj)))
+    if isinstance(obj, bool):
+        return bool(obj)
+    if isinstance(obj, int):
+        if -2 ** 63 <= obj < 2 ** 64:
+            return int(obj)
+        return msgpack.ExtType(_BIG_INT, str(int(obj)).encode())
+    for builtin in (str, bytes, float, dict, list):
+        if isinstance(obj, builtin):
+            return builtin(obj)
+    raise TypeError(f'{type(obj).__name__} is not supported')
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _HEXBYTES:
+        return HexBytes(data)
+    if code == _ATTRIBUTE_DICT:
+        return AttributeDict(unpackb(data))
+    if code == _TUPLE:
+        return tuple(unpackb(data))
+    if code == _BIG_INT:
+        return int(data)
+    return msgpack.ExtType(code, data)
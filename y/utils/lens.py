@@ -0,0 +1,146 @@
+import logging
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+
+from brownie import web3
+from eth_utils import keccak, to_checksum_address
+from hexbytes import HexBytes
+from joblib.parallel import Parallel, delayed
+from y import convert
+from y.contracts import Contract
+from y.typing import Address, AnyAddressType, Block
+from y.utils import trace
+from y.utils.codec import FunctionCodec
+from y.utils.multicall import fetch_multicall, multicall_same_func_no_input
+
+logger = logging.getLogger(__name__)
+
+"""
+Lenses are small helper contracts that don't exist on chain. For the length of one `eth_call` we put a lens's code
+at an empty address with a state override, so it can read from many contracts and send back only what we need,
+packed tightly. A scan that would return megabytes of abi encoded tuples through a multicall comes back as one small response.
+
+The vyper source for each lens is in `lenses/` at the root of the repo. The runtime code below was compiled with vyper 0.3.10:
+    vyper -f bytecode_runtime lenses/<name>.vy
+
+A node that doesn't support state overrides can't run a lens. When a lens call fails we fall back to multicalls, which give the same results.
+"""
+
+# how many lens calls we send at once
+LENS_THREADS = 8
+
+# the lenses put this in place of a result they couldn't read
+FAILED = 2 ** 256 - 1
+RESERVE_MASK = 2 ** 128 - 1
+
+
+class Lens:
+    '''
+    A helper contract with one view function, injected into the state for each call.
+    '''
+
+    def __init__(self, name: str, code: str, abi: Dict[str, Any], max_inputs: int) -> None:
+        self.name = name
+        self.code = code
+        self.codec = FunctionCodec(abi)
+        # the most items the lens takes in one call, the lens reverts if we send more
+        self.max_inputs = max_inputs
+        # nothing lives at this address, so the code we put there can't hide a real contract
+        self.address = to_checksum_address(keccak(text=f'ypricemagic.lens.{name}')[-20:])
+
+    def __repr__(self) -> str:
+        return f"<Lens {self.name}>"
+
+    def call(self, *args: Any, block: Optional[Block] = None) -> Any:
+        tx = {'to': self.address, 'data': self.codec.encode_input(*args)}
+        response = web3.eth.call(tx, block or 'latest', {self.address: {'code': self.code}})
+        return self.codec.decode_raw(response)[0]
+
+    def call_in_chunks(self, items: Sequence[Any], build_args: Callable[[Sequence[Any]], Tuple], block: Optional[Block] = None) -> List[Any]:
+        '''
+        Calls the lens once for each chunk of `items` that it can take, in parallel, and returns the results in order.
+        `build_args` turns a chunk into the lens's args.
+        '''
+        chunks = [items[i:i+self.max_inputs] for i in range(0, len(items), self.max_inputs)]
+        if len(chunks) > 1:
+            results = Parallel(min(LENS_THREADS, len(chunks)), 'threading')(delayed(trace.propagate(self.call))(*build_args(chunk), block=block) for chunk in chunks)
+        else:
+            results = [self.call(*build_args(chunk), block=block) for chunk in chunks]
+        return [result for chunk_results in results for result in chunk_results]
+
+
+UNISWAP_V2_RESERVES = Lens(
+    'uniswap_v2_reserves',
+    '0x5f3560e01c63c21934c9811861028457604436103417610288576004356004016107d08135116102885780355f816107d0811161028857801561006357905b8060051b6020850101358060a01c610288578160051b6060015260010181811861003e575b50508060405250505f61fa60525f6040516107d0811161028857801561022157905b8060051b606001516201f480526040366201f4a0376201f480515a60046201f540527f0902f1ac000000000000000000000000000000000000000000000000000000006201f560526201f5405060606201f5a06201f540516201f5608585fa905090506201f4a0523d606081183d60601002186201f580526201f5806020815101806201f4c0828460045afa5050506201f4a05161012457600161012e565b603f6201f4c05111155b156101785761fa60516107cf8111610288577fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff8160051b61fa8001526001810161fa605250610216565b6201f4c07fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff60208251031360011615610288575f60051c60051b60200181015190506201f540526201f4c0601f6020825103136001161561028857602060051c60051b60200181015190506201f5605261fa60516107cf8111610288576201f560516201f5405160801b178160051b61fa8001526001810161fa6052505b600101818118610085575b50506020806201f48052806201f480015f61fa60518083528060051b5f826107d0811161028857801561026e57905b8060051b61fa8001518160051b602088010152600101818118610250575b505082016020019150509050810190506201f480f35b5f5ffd5b5f80fd',
+    {'name': 'reserves', 'inputs': [{'name': 'pairs', 'type': 'address[]'}], 'outputs': [{'name': '', 'type': 'uint256[]'}]},
+    max_inputs=2_000,
+)
+
+BALANCER_V2_POOL_TOKENS = Lens(
+    'balancer_v2_pool_tokens',
+    '0x5f3560e01c6343173711811861038557606436103417610389576004358060a01c610389576040526024356004016101f481351161038957803560208160051b0180836060375050505f613f00525f6060516101f4811161038957801561032257905b8060051b6080015162084da05260403662084dc0376040515a63f94d4668620852c452600462084da051620852e452602001620852c052620852c0506104c062085340620852c051620852e08585fa9050905062084dc0523d6104c081183d6104c010021862085320526208532060208151018062084de0828460045afa50505062084dc0516100f3576001610112565b6104a162084de051101561010f57609f62084de0511115610112565b60015b1561015c57613f00516140738111610389577fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff8160051b613f20015260018101613f005250610317565b5f620852c0525f620854e0525f620857005262084de0516104a18110609f82111615610389575062084e005162084e000160108151116103895780515f81601081116103895780156101d157905b8060051b6020850101518060a01c610389578160051b6208574001526001018181186101aa575b5050806208572052505062084e205162084e0001601081511161038957805160208160051b018062085940828560045afa5050505062084e405162085b605262085720805160208160051b0180620852c0828560045afa5050506102208101805160208160051b0180620854e0828560045afa50505050610440810151620857005250613f0051614073811161038957620852c0518160051b613f20015260018101613f0052505f6010905b806208572052620852c05162085720511061029757610314565b613f00516140738111610389576208572051620852c0518110156103895760051b620852e001518160051b613f20015260018101613f005250613f00516140738111610389576208572051620854e0518110156103895760051b6208550001518160051b613f20015260018101613f00525060010181811861027d575b50505b600101818118610062575b505060208062084da0528062084da0015f613f00518083528060051b5f82614074811161038957801561036f57905b8060051b613f2001518160051b602088010152600101818118610351575b5050820160200191505090508101905062084da0f35b5f5ffd5b5f80fd',
+    {
+        'name': 'pool_tokens',
+        'inputs': [{'name': 'vault', 'type': 'address'}, {'name': 'pool_ids', 'type': 'bytes32[]'}],
+        'outputs': [{'name': '', 'type': 'uint256[]'}],
+    },
+    max_inputs=500,
+)
+
+
+def uniswap_v2_reserves(pairs: Iterable[AnyAddressType], block: Optional[Block] = None) -> List[Optional[Tuple[int, int]]]:
+    '''
+    Returns `(reserve0, reserve1)` for each uniswap v2 style pair in `pairs`, or `None` if we can't read its reserves.
+    '''
+    pairs = [convert.to_address(pair) for pair in pairs]
+    try:
+        packed = UNISWAP_V2_RESERVES.call_in_chunks(pairs, lambda chunk: (chunk,), block=block)
+    except Exception as e:
+        _log_fallback(UNISWAP_V2_RESERVES, e)
+        reserves = multicall_same_func_no_input(pairs, 'getReserves()((uint112,uint112,uint32))', block=block, return_None_on_failure=True)
+        return [None if reserve is None else (reserve[0], reserve[1]) for reserve in reserves]
+    return [None if word == FAILED else (word >> 128, word & RESERVE_MASK) for word in packed]
+
+
+def balancer_v2_pool_tokens(
+    vault: AnyAddressType,
+    pool_ids: Iterable[Any],
+    block: Optional[Block] = None
+    ) -> List[Optional[Tuple[List[Address], List[int]]]]:
+    '''
+    Returns `(tokens, balances)` from the vault for each pool id in `pool_ids`, or `None` if we can't read them.
+    '''
+    vault = convert.to_address(vault)
+    pool_ids = [bytes(HexBytes(pool_id)).rjust(32, b'\x00') for pool_id in pool_ids]
+    try:
+        packed = BALANCER_V2_POOL_TOKENS.call_in_chunks(pool_ids, lambda chunk: (vault, chunk), block=block)
+    except Exception as e:
+        _log_fallback(BALANCER_V2_POOL_TOKENS, e)
+        return _pool_tokens_with_multicall(vault, pool_ids, block)
+
+    pools, i = [], 0
+    while i < len(packed):
+        num_tokens = packed[i]
+        i += 1
+        if num_tokens == FAILED:
+            pools.append(None)
+            continue
+        words = packed[i:i + 2 * num_tokens]
+        pools.append(([convert.to_address(f'0x{token:040x}') for token in words[::2]], list(words[1::2])))
+        i += 2 * num_tokens
+
+    # the lens can't read a pool with more than 16 tokens, or one whose call reverts. we ask the vault for those directly.
+    failed = [index for index, pool in enumerate(pools) if pool is None]
+    if failed:
+        for index, pool in zip(failed, _pool_tokens_with_multicall(vault, [pool_ids[index] for index in failed], block)):
+            pools[index] = pool
+    return pools
+
+
+def _pool_tokens_with_multicall(vault: Address, pool_ids: List[bytes], block: Optional[Block]) -> List[Optional[Tuple[List[Address], List[int]]]]:
+    infos = fetch_multicall(*[[Contract(vault), 'getPoolTokens', pool_id] for pool_id in pool_ids], block=block)
+    return [None if info is None else ([convert.to_address(token) for token in info[0]], list(info[1])) for info in infos]
+
+
+def _log_fallback(lens: Lens, e: Exception) -> None:
+    logger.debug(f'{lens} failed, falling back to multicall. {e.__class__.__name__}: {e}')
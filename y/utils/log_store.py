@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+from typing import Any, List, Optional, Tuple
+
+from brownie import chain
+from eth_utils import encode_hex
+from web3.types import LogReceipt
+from y.utils.cache import finalized_block
+from y.utils.kv_cache import packb, unpackb
+from y.utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+"""
+An on-disk store for the logs `y.utils.events.get_logs_asap` has fetched.
+
+For each filter, ie an address and a list of topics, we keep every log we've fetched and the block ranges we've covered.
+Adjacent and overlapping ranges are merged, so a filter that has been scanned up to block N is one range no matter how it
+was fetched. The next scan only fetches the blocks we haven't covered yet, whatever its `from_block` is.
+Only finalized blocks are stored, the blocks after them are fetched every time.
+
+The default store is a sqlite db at $YPRICEMAGIC_LOG_STORE_PATH (default: cache/logs.sqlite).
+You can plug in your own store, or disable the store entirely, with `set_log_store`.
+"""
+
+LOG_STORE_PATH = os.environ.get('YPRICEMAGIC_LOG_STORE_PATH', 'cache/logs.sqlite')
+
+Range = Tuple[int, int]
+
+
+class LogStore:
+    '''
+    Base class for log stores. Subclass this and pass an instance to `set_log_store` to use your own backend.
+    Ranges are inclusive at both ends. Implementations must be thread-safe.
+    '''
+
+    def get_ranges(self, log_filter: str, start: int, end: int) -> List[Range]:
+        '''
+        Returns the ranges we've covered for `log_filter` that overlap `start` to `end`, in order.
+        '''
+        raise NotImplementedError
+
+    def get_logs(self, log_filter: str, start: int, end: int) -> List[LogReceipt]:
+        '''
+        Returns the stored logs for `log_filter` from `start` to `end`, in the order they were emitted.
+        '''
+        raise NotImplementedError
+
+    def add(self, log_filter: str, start: int, end: int, logs: List[LogReceipt]) -> None:
+        '''
+        Stores `logs`, which must be every log for `log_filter` from `start` to `end`, and marks that range covered.
+        '''
+        raise NotImplementedError
+
+
+class SQLiteLogStore(LogStore, SQLiteStore):
+    schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS log_ranges (
+            chainid INTEGER NOT NULL,
+            filter TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            PRIMARY KEY (chainid, filter, start)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS logs (
+            chainid INTEGER NOT NULL,
+            filter TEXT NOT NULL,
+            block INTEGER NOT NULL,
+            log_index INTEGER NOT NULL,
+            log BLOB NOT NULL,
+            PRIMARY KEY (chainid, filter, block, log_index)
+        )
+        ''',
+    )
+
+    def __init__(self, path: str = LOG_STORE_PATH) -> None:
+        SQLiteStore.__init__(self, path)
+        self.chainid = chain.id
+
+    def get_ranges(self, log_filter: str, start: int, end: int) -> List[Range]:
+        return self.execute(
+            'SELECT start, end FROM log_ranges WHERE chainid = ? AND filter = ? AND end >= ? AND start <= ? ORDER BY start',
+            (self.chainid, log_filter, start, end),
+        )
+
+    def get_logs(self, log_filter: str, start: int, end: int) -> List[LogReceipt]:
+        rows = self.execute(
+            'SELECT log FROM logs WHERE chainid = ? AND filter = ? AND block >= ? AND block <= ? ORDER BY block, log_index',
+            (self.chainid, log_filter, start, end),
+        )
+        return [unpackb(log) for log, in rows]
+
+    def add(self, log_filter: str, start: int, end: int, logs: List[LogReceipt]) -> None:
+        rows = [(self.chainid, log_filter, log['blockNumber'], log['logIndex'], packb(log)) for log in logs]
+        # the logs and the range they cover are written together, so a crash can't leave a range without its logs
+        with self.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO logs (chainid, filter, block, log_index, log) VALUES (?, ?, ?, ?, ?)', rows)
+            # merge with every range that overlaps or touches this one
+            touching = conn.execute(
+                'SELECT start, end FROM log_ranges WHERE chainid = ? AND filter = ? AND end >= ? AND start <= ?',
+                (self.chainid, log_filter, start - 1, end + 1),
+            ).fetchall()
+            start = min([start] + [s for s, _ in touching])
+            end = max([end] + [e for _, e in touching])
+            conn.executemany(
+                'DELETE FROM log_ranges WHERE chainid = ? AND filter = ? AND start = ?',
+                ((self.chainid, log_filter, s) for s, _ in touching),
+            )
+            conn.execute(
+                'INSERT INTO log_ranges (chainid, filter, start, end) VALUES (?, ?, ?, ?)',
+                (self.chainid, log_filter, start, end),
+            )
+
+
+def _default_log_store() -> Optional[LogStore]:
+    try:
+        return SQLiteLogStore()
+    except Exception as e:
+        logger.warning(f'unable to open the log store at {LOG_STORE_PATH}, continuing without it. {e.__class__.__name__}: {e}')
+        return None
+
+_log_store: Optional[LogStore] = _default_log_store()
+
+
+def get_log_store() -> Optional[LogStore]:
+    return _log_store
+
+
+def set_log_store(log_store: Optional[LogStore]) -> None:
+    '''
+    Replaces the store `get_logs_asap` reads from and writes to. Pass `None` to disable the store.
+    '''
+    global _log_store
+    _log_store = log_store
+
+
+def filter_key(address: Any, topics: Any) -> str:
+    '''
+    Returns the same string for every filter that matches the same logs.
+    '''
+    if isinstance(address, (list, tuple)):
+        address = sorted(str(a).lower() for a in address)
+    elif address is not None:
+        address = str(address).lower()
+    return json.dumps([address, topics], default=encode_hex)
+
+
+def lookup(log_filter: str, start: int, end: int) -> Tuple[List[LogReceipt], List[Range]]:
+    '''
+    Returns the stored logs for `log_filter` from `start` to `end` and the ranges we still need to fetch.
+    '''
+    store = get_log_store()
+    if store is None:
+        return [], [(start, end)]
+    ranges = store.get_ranges(log_filter, start, end)
+    gaps, position = [], start
+    for range_start, range_end in ranges:
+        if range_start > position:
+            gaps.append((position, range_start - 1))
+        position = max(position, range_end + 1)
+    if position <= end:
+        gaps.append((position, end))
+    # a range another process covered since we read the ranges would otherwise be returned twice
+    logs = [log for log in store.get_logs(log_filter, start, end) if not any(s <= log['blockNumber'] <= e for s, e in gaps)]
+    return logs, gaps
+
+
+def save(log_filter: str, start: int, end: int, logs: List[LogReceipt]) -> None:
+    '''
+    Stores the logs for `log_filter` from `start` to `end`, skipping any blocks that aren't finalized yet.
+    '''
+    store = get_log_store()
+    if store is None:
+        return
+    end = min(end, finalized_block())
+    if end < start:
+        return
+    store.add(log_filter, start, end, [log for log in logs if log['blockNumber'] <= end])
@@ -1,4 +1,5 @@
 import logging
+import time
 from typing import Any, Callable
 
 from brownie import web3
@@ -8,6 +9,7 @@ from requests import Session
 from requests.adapters import HTTPAdapter
 from web3 import HTTPProvider, Web3
 from web3.middleware import filter
+from y.utils import batch, call_cache, trace
 from y.utils.cache import memory
 
 logger = logging.getLogger(__name__)
@@ -35,14 +37,31 @@ def should_cache(method: str, params: Any) -> bool:
 
 
 def cache_middleware(make_request: Callable, web3: Web3) -> Callable:
+    cached = memory.cache(make_request)
+
     def middleware(method: str, params: Any) -> Any:
         logger.debug("%s %s", method, params)
 
-        if should_cache(method, params):
-            response = memory.cache(make_request)(method, params)
+        start = time.perf_counter()
+        cache_hit = False
+        # calls at finalized blocks are kept in the call cache, see `y.utils.call_cache`
+        key = None if should_cache(method, params) else call_cache.cache_key(method, params)
+        cached_response = None if key is None else call_cache.lookup(key)
+        if cached_response is not None:
+            cache_hit = True
+            response = {'jsonrpc': '2.0', 'id': 0, **cached_response}
+        elif should_cache(method, params):
+            if trace.is_active():
+                cache_hit = cached.check_call_in_cache(method, params)
+            response = cached(method, params)
+        elif batch.should_batch(method, params):
+            response = batch.submit(make_request, params)
         else:
             response = make_request(method, params)
+        if key is not None and not cache_hit:
+            call_cache.save(key, response)
 
+        trace.record_request(method, params, time.perf_counter() - start, cache_hit=cache_hit)
         return response
 
     return middleware
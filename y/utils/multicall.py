@@ -1,24 +1,36 @@
 import logging
+import os
+import threading
 from collections import defaultdict
+from functools import lru_cache, partial
 from itertools import count, product
-from operator import itemgetter
-from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+from typing import (Any, Callable, Dict, Iterable, List, Optional,
+                    Tuple, TypeVar, Union)
 
 import brownie
-import requests
+import numpy as np
 from brownie import chain, web3
 from eth_abi.exceptions import InsufficientDataBytes
+from eth_utils import encode_hex
+from hexbytes import HexBytes
+from joblib.parallel import Parallel, delayed
 from web3.exceptions import CannotHandleRequest
 from y import convert
 from y.contracts import Contract, contract_creation_block
 from y.decorators import log
-from y.exceptions import continue_if_call_reverted
+from y.exceptions import (call_reverted, call_too_large,
+                          continue_if_call_reverted)
 from y.interfaces.multicall2 import MULTICALL2_ABI
+from y.interfaces.multicall3 import MULTICALL3_ABI
 from y.networks import Network
 from y.typing import Address, AddressOrContract, AnyAddressType, Block
+from y.utils import jsonrpc, trace
+from y.utils.codec import (FunctionCodec, codec, decode_aggregate_columns,
+                           static_output_types)
 from y.utils.raw_calls import _decimals, _totalSupply
 
 from multicall import Call, Multicall
+from multicall.signature import Signature
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +57,130 @@ code = "0x608060405234801561001057600080fd5b50600436106100b45760003560e01c806372
 
 multicall_deploy_block = contract_creation_block(multicall2.address)
 
+# multicall3 is deployed at the same address on every chain that has it
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11" if chain.id in [
+    Network.Mainnet,
+    Network.Arbitrum,
+    Network.Avalanche,
+    Network.BinanceSmartChain,
+    Network.Fantom,
+    Network.Harmony,
+    Network.Moonriver,
+    Network.Polygon,
+    Network.xDai,
+    Network.Aurora,
+    Network.Cronos,
+] else None
+
+multicall3 = brownie.Contract.from_abi("Multicall3", MULTICALL3, MULTICALL3_ABI) if MULTICALL3 else None
+multicall3_deploy_block = contract_creation_block(MULTICALL3) if MULTICALL3 else None
+
+# the most calls, calldata bytes and estimated gas we start out putting in one multicall
+MULTICALL_MAX_CALLS = int(os.environ.get('YPRICEMAGIC_MULTICALL_MAX_CALLS', 1_000))
+MULTICALL_MAX_BYTES = int(os.environ.get('YPRICEMAGIC_MULTICALL_MAX_BYTES', 128_000))
+MULTICALL_MAX_GAS = int(os.environ.get('YPRICEMAGIC_MULTICALL_MAX_GAS', 40_000_000))
+# how many chunks of one multicall we send at once
+MULTICALL_THREADS = int(os.environ.get('YPRICEMAGIC_MULTICALL_THREADS', 8))
+
+# our guess at the gas each call in a multicall uses, we don't know how much work the call itself does
+GAS_PER_CALL = 30_000
+GAS_PER_CALLDATA_BYTE = 16
+
+# an abi encoded empty `(bool,bytes)[]`
+_EMPTY_AGGREGATE = bytes(31) + b'\x20' + bytes(32)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class ChunkLimits:
+    '''
+    How much we put in one multicall to one endpoint.
+
+    When the endpoint rejects a multicall as too large, each limit drops to half of what that multicall held.
+    After every `grow_after` multicalls in a row that succeed, the limits grow by 10%, up to where they started.
+    '''
+
+    grow_after = 100
+
+    def __init__(self) -> None:
+        self.max_calls = MULTICALL_MAX_CALLS
+        self.max_bytes = MULTICALL_MAX_BYTES
+        self.max_gas = MULTICALL_MAX_GAS
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<ChunkLimits calls={self.max_calls} bytes={self.max_bytes} gas={self.max_gas}>"
+
+    def chunk(self, items: List[T], size: Callable[[T], int]) -> List[List[T]]:
+        '''
+        Splits `items` into chunks that fit within the limits. `size` returns the calldata bytes for an item.
+        '''
+        chunks, chunk, chunk_bytes, chunk_gas = [], [], 0, 0
+        for item in items:
+            item_bytes = size(item)
+            item_gas = _estimate_gas(item_bytes)
+            if chunk and (
+                len(chunk) >= self.max_calls
+                or chunk_bytes + item_bytes > self.max_bytes
+                or chunk_gas + item_gas > self.max_gas
+            ):
+                chunks.append(chunk)
+                chunk, chunk_bytes, chunk_gas = [], 0, 0
+            chunk.append(item)
+            chunk_bytes += item_bytes
+            chunk_gas += item_gas
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def shrink(self, calls: int, calldata_bytes: int, gas: int) -> None:
+        with self._lock:
+            self.max_calls = max(min(self.max_calls, calls // 2), 1)
+            self.max_bytes = max(min(self.max_bytes, calldata_bytes // 2), 1)
+            self.max_gas = max(min(self.max_gas, gas // 2), 1)
+            self._successes = 0
+        logger.info(f'multicall too large for {_endpoint()}, now using {self}')
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._successes += 1
+            if self._successes < self.grow_after:
+                return
+            self._successes = 0
+            self.max_calls = min(int(self.max_calls * 1.1) + 1, MULTICALL_MAX_CALLS)
+            self.max_bytes = min(int(self.max_bytes * 1.1) + 1, MULTICALL_MAX_BYTES)
+            self.max_gas = min(int(self.max_gas * 1.1) + 1, MULTICALL_MAX_GAS)
+
+
+_chunk_limits: Dict[str, ChunkLimits] = {}
+_chunk_limits_lock = threading.Lock()
+
+
+def chunk_limits() -> ChunkLimits:
+    '''
+    Returns the limits for the endpoint we're connected to.
+    '''
+    endpoint = _endpoint()
+    with _chunk_limits_lock:
+        if endpoint not in _chunk_limits:
+            _chunk_limits[endpoint] = ChunkLimits()
+        return _chunk_limits[endpoint]
+
+
+@log(logger)
+def multicall_in_chunks(calls: List[Call], block: Optional[Block] = None, require_success: bool = True) -> Dict[Any, Any]:
+    '''
+    Same as `Multicall(calls, block_id=block, require_success=require_success)()`, but large batches are split into chunks
+    that fit within `chunk_limits()` and the chunks are sent in parallel.
+    '''
+    send = lambda chunk: Multicall(chunk, block_id=block, require_success=require_success)()
+    results = {}
+    for chunk_results in _send_in_chunks(calls, send, lambda call: len(call.data)):
+        results.update(chunk_results)
+    return results
+
 
 @log(logger)
 def multicall_same_func_no_input(
@@ -57,7 +193,7 @@ def multicall_same_func_no_input(
 
     addresses = _clean_addresses(addresses)
     calls = [Call(address, [method], [[address,apply_func]]) for address in addresses]
-    return [result for result in Multicall(calls, block_id=block, require_success=(not return_None_on_failure))().values()]
+    return [result for result in multicall_in_chunks(calls, block=block, require_success=(not return_None_on_failure)).values()]
 
 
 @log(logger)
@@ -72,7 +208,31 @@ def multicall_same_func_different_contracts_same_input(
     assert input
     addresses = _clean_addresses(addresses)
     calls = [Call(address, [method, input], [[address,apply_func]]) for address in addresses]
-    return [result for result in Multicall(calls, block_id=block)().values()]
+    return [result for result in multicall_in_chunks(calls, block=block).values()]
+
+
+@log(logger)
+def multicall_same_func_no_input_arrays(
+    addresses: Iterable[AddressOrContract],
+    method: str,
+    block: Optional[Block] = None
+    ) -> Tuple[List[np.ndarray], np.ndarray]:
+    '''
+    Same as `multicall_same_func_no_input`, for methods that only return uints, ints, addresses and bools,
+    but the results are decoded straight into one numpy array per output, ie reserve0s, reserve1s and timestamps for
+    `'getReserves()((uint112,uint112,uint32))'`. Also returns a mask of the calls that succeeded.
+    See `y.utils.codec.decode_aggregate_columns` for the dtypes.
+    '''
+    output_types = static_output_types(method)
+    selector = HexBytes(Signature(method).encode_data(None))
+    multicall_input = [(address, True, selector) for address in _clean_addresses(addresses)]
+    send = lambda chunk: [_aggregate_raw(chunk, block)]
+    responses = [response for chunk in _send_in_chunks(multicall_input, send, _input_size) for response in chunk]
+    decoded = [decode_aggregate_columns(response, output_types) for response in responses]
+    if not decoded:
+        return decode_aggregate_columns(_EMPTY_AGGREGATE, output_types)
+    columns = [np.concatenate([chunk_columns[i] for chunk_columns, _ in decoded]) for i in range(len(output_types))]
+    return columns, np.concatenate([valid for _, valid in decoded])
 
 
 @log(logger)
@@ -88,7 +248,7 @@ def multicall_same_func_same_contract_different_inputs(
     assert inputs
     address = convert.to_address(address)
     calls = [Call(address, [method, input], [[input,apply_func]]) for input in inputs]
-    return [result for result in Multicall(calls, block_id=block, require_success = not return_None_on_failure)().values()]
+    return [result for result in multicall_in_chunks(calls, block=block, require_success = not return_None_on_failure).values()]
 
 
 @log(logger)
@@ -132,43 +292,161 @@ def multicall_balanceOf(
 
 
 @log(logger)
-def fetch_multicall(*calls: Any, block: Optional[Block] = None) -> List[Optional[Any]]:
+def fetch_multicall(*calls: Any, block: Optional[Block] = None, require_success: Union[bool, Iterable[bool]] = False) -> List[Optional[Any]]:
+    """
+    Makes each call in `calls`, `[contract, 'func', *args]`, in as few multicalls as possible.
+    A call that fails returns `None`, unless it's required to succeed, in which case the whole multicall raises.
+    `require_success` is either one flag for every call or a flag for each call, so strict and lenient calls can share one multicall.
+    """
     # https://github.com/makerdao/multicall
-    multicall_input = []
-    fn_list = []
-    decoded = []
+    codecs, multicall_input = _prepare_multicall(calls, require_success)
+    chunks = _send_in_chunks(multicall_input, partial(_aggregate, block=block), _input_size)
+    return _decode_multicall(codecs, [result for chunk in chunks for result in chunk])
 
-    for contract, fn_name, *fn_inputs in calls:
-        fn = getattr(contract, fn_name)
 
-        # check that there aren't multiple functions with the same name
-        if hasattr(fn, "_get_fn_from_args"):
-            fn = fn._get_fn_from_args(fn_inputs)
+def eth_balance_call(address: AnyAddressType) -> List[Any]:
+    '''
+    A call for `fetch_multicall` that returns the native balance of `address`, so it can share a multicall with other calls.
+    '''
+    return [_aggregator(), 'getEthBalance', convert.to_address(address)]
 
-        fn_list.append(fn)
-        multicall_input.append((contract, fn.encode_input(*fn_inputs)))
 
-    if isinstance(block, int) and block < multicall_deploy_block:
-        # use state override to resurrect the contract prior to deployment
-        data = multicall2.tryAggregate.encode_input(False, multicall_input)
-        call = web3.eth.call(
-            {'to': str(multicall2), 'data': data},
-            block or 'latest',
-            {str(multicall2): {'code': f'0x{multicall2.bytecode}'}},
-        )
-        result = multicall2.tryAggregate.decode_output(call)
+def block_number_call() -> List[Any]:
+    '''
+    A call for `fetch_multicall` that returns the number of the block the multicall ran at.
+    '''
+    return [_aggregator(), 'getBlockNumber']
+
+
+def block_timestamp_call() -> List[Any]:
+    '''
+    A call for `fetch_multicall` that returns the timestamp of the block the multicall ran at.
+    '''
+    return [_aggregator(), 'getCurrentBlockTimestamp']
+
+
+def _aggregate(multicall_input: List[Tuple[str, bool, bytes]], block: Optional[Block] = None) -> List[Tuple[bool, bytes]]:
+    return _decode_aggregate(multicall_input, _aggregate_raw(multicall_input, block))
+
+
+def _aggregate_raw(multicall_input: List[Tuple[str, bool, bytes]], block: Optional[Block] = None) -> bytes:
+    tx, state_override = _aggregate_tx(multicall_input, block)
+    if state_override:
+        return web3.eth.call(tx, block or 'latest', state_override)
+    return web3.eth.call(tx, block or 'latest')
+
+
+def _aggregate_tx(multicall_input: List[Tuple[str, bool, bytes]], block: Optional[Block]) -> Tuple[Dict[str, str], Optional[Dict[str, Any]]]:
+    '''
+    Returns the `eth_call` for `multicall_input` at `block`, and the state override it needs if the aggregator wasn't deployed yet.
+    '''
+    state_override = None
+    if multicall3:
+        tx = {'to': MULTICALL3, 'data': codec(multicall3, 'aggregate3', 1).encode_input(multicall_input)}
+        if isinstance(block, int) and block < multicall3_deploy_block:
+            # use state override to resurrect the contract prior to deployment
+            state_override = {MULTICALL3: {'code': _multicall3_code()}}
     else:
-        result = multicall2.tryAggregate.call(
-            False, multicall_input, block_identifier=block or 'latest'
-        )
+        calls = [(target, data) for target, _, data in multicall_input]
+        tx = {'to': str(multicall2), 'data': codec(multicall2, 'tryAggregate', 2).encode_input(False, calls)}
+        if isinstance(block, int) and block < multicall_deploy_block:
+            # use state override to resurrect the contract prior to deployment
+            state_override = {str(multicall2): {'code': f'0x{multicall2.bytecode}'}}
+    return tx, state_override
+
+
+def _decode_aggregate(multicall_input: List[Tuple[str, bool, bytes]], response: bytes) -> List[Tuple[bool, bytes]]:
+    if multicall3:
+        # aggregate3 reverts by itself if a call that can't fail does
+        return codec(multicall3, 'aggregate3', 1).decode_raw(response)[0]
+    results = codec(multicall2, 'tryAggregate', 2).decode_raw(response)[0]
+    for (_, allow_failure, _), (success, _) in zip(multicall_input, results):
+        if not success and not allow_failure:
+            raise ValueError('execution reverted: Multicall3: call failed')
+    return results
+
 
-    for fn, (ok, data) in zip(fn_list, result):
+@lru_cache(maxsize=None)
+def _multicall3_code() -> str:
+    return encode_hex(web3.eth.get_code(MULTICALL3))
+
+
+def _aggregator() -> Contract:
+    # multicall2 has the same helper functions, for chains without multicall3
+    return multicall3 or multicall2
+
+
+def _send_in_chunks(items: List[T], send: Callable[[List[T]], R], size: Callable[[T], int]) -> List[R]:
+    '''
+    Sends `items` in chunks that fit within `chunk_limits()`, in parallel. Returns the result of `send` for each chunk, in order.
+    '''
+    chunks = chunk_limits().chunk(list(items), size)
+    if len(chunks) <= 1:
+        return [_send_chunk(chunk, send, size) for chunk in chunks]
+    return Parallel(min(MULTICALL_THREADS, len(chunks)), 'threading')(delayed(trace.propagate(_send_chunk))(chunk, send, size) for chunk in chunks)
+
+
+def _send_chunk(chunk: List[T], send: Callable[[List[T]], R], size: Callable[[T], int]) -> R:
+    try:
+        result = send(chunk)
+    except Exception as e:
+        if len(chunk) == 1 or not call_too_large(e):
+            raise
+        _shrink(chunk, size)
+        half = len(chunk) // 2
+        return _merge(_send_chunk(chunk[:half], send, size), _send_chunk(chunk[half:], send, size))
+    chunk_limits().succeeded()
+    return result
+
+
+def _shrink(chunk: List[T], size: Callable[[T], int]) -> None:
+    sizes = [size(item) for item in chunk]
+    chunk_limits().shrink(len(chunk), sum(sizes), sum(_estimate_gas(item_bytes) for item_bytes in sizes))
+
+
+def _merge(first: R, second: R) -> R:
+    # `Multicall` returns dicts, `tryAggregate` returns lists
+    if isinstance(first, dict):
+        return {**first, **second}
+    return [*first, *second]
+
+
+def _estimate_gas(calldata_bytes: int) -> int:
+    return GAS_PER_CALL + GAS_PER_CALLDATA_BYTE * calldata_bytes
+
+
+def _input_size(multicall_input: Tuple[str, bool, bytes]) -> int:
+    _, _, data = multicall_input
+    return len(data)
+
+
+def _endpoint() -> str:
+    return getattr(web3.provider, 'endpoint_uri', None) or str(web3.provider)
+
+
+def _prepare_multicall(calls: Iterable[Any], require_success: Union[bool, Iterable[bool]] = False) -> Tuple[List[FunctionCodec], List[Tuple[str, bool, bytes]]]:
+    calls = list(calls)
+    if isinstance(require_success, bool):
+        require_success = [require_success] * len(calls)
+    codecs = []
+    multicall_input = []
+    for (contract, fn_name, *fn_inputs), required in zip(calls, require_success):
+        fn = codec(contract, fn_name, len(fn_inputs))
+        codecs.append(fn)
+        multicall_input.append((str(contract), not required, HexBytes(fn.encode_input(*fn_inputs))))
+    return codecs, multicall_input
+
+
+def _decode_multicall(codecs: List[FunctionCodec], result: Iterable[Tuple[bool, bytes]]) -> List[Optional[Any]]:
+    decoded = []
+    for fn, (ok, data) in zip(codecs, result):
+        if not ok:
+            decoded.append(None)
+            continue
         try:
-            assert ok, "call failed"
             decoded.append(fn.decode_output(data))
-        except (AssertionError, InsufficientDataBytes):
+        except InsufficientDataBytes:
             decoded.append(None)
-
     return decoded
 
 
@@ -187,20 +465,19 @@ def multicall_matrix(contracts, params, block="latest"):
 
 
 @log(logger)
-def batch_call(calls: Tuple[Contract,str,List[Any],Block]) -> List[Any]:
+def batch_call(calls: Tuple[Contract,str,List[Any],Block], return_None_on_failure: bool = False) -> List[Any]:
     """
     Similar interface but block height as last param. Uses JSON-RPC batch.
     [[contract, 'func', arg, block_identifier]]
+    Results are returned in the same order as `calls`. A call that reverts raises, or returns `None` if `return_None_on_failure`.
     """
     jsonrpc_batch = []
-    fn_list = []
+    codecs = []
     ids = count()
 
     for contract, fn_name, *fn_inputs, block in calls:
-        fn = getattr(contract, fn_name)
-        if hasattr(fn, "_get_fn_from_args"):
-            fn = fn._get_fn_from_args(fn_inputs)
-        fn_list.append(fn)
+        fn = codec(contract, fn_name, len(fn_inputs))
+        codecs.append(fn)
 
         jsonrpc_batch.append(
             {
@@ -209,17 +486,79 @@ def batch_call(calls: Tuple[Contract,str,List[Any],Block]) -> List[Any]:
                 'method': 'eth_call',
                 'params': [
                     {'to': str(contract), 'data': fn.encode_input(*fn_inputs)},
-                    block,
+                    _block_identifier(block),
                 ],
             }
         )
 
-    response = requests.post(web3.provider.endpoint_uri, json=jsonrpc_batch).json()
-    return [
-        fn.decode_output(res['result'])
-        for res in sorted(response, key=itemgetter('id'))
+    results = []
+    for fn, res in zip(codecs, jsonrpc.send_batch(jsonrpc_batch)):
+        try:
+            if 'error' in res:
+                raise ValueError(res['error'])
+            results.append(fn.decode_output(res['result']))
+        except (ValueError, InsufficientDataBytes) as e:
+            if not return_None_on_failure:
+                raise
+            if isinstance(e, ValueError) and not call_reverted(e):
+                raise
+            results.append(None)
+    return results
+
+
+@log(logger)
+def batch_call_same_func_at_blocks(
+    address: AnyAddressType,
+    method: str,
+    blocks: Iterable[Block],
+    inputs: Optional[Union[List, Tuple]] = None,
+    apply_func: Optional[Callable] = None,
+    return_None_on_failure: bool = False
+    ) -> List[Any]:
+    """
+    Calls `method` on `address` at each block in `blocks` using one JSON-RPC batch.
+    `method` uses the same format as `multicall.Call`, ie `'latestAnswer()(int256)'`,
+    and `inputs` holds the positional args for `method`, if any.
+    Results are returned in the same order as `blocks`.
+    """
+    address = convert.to_address(address)
+    signature = Signature(method)
+    data = encode_hex(signature.encode_data(inputs))
+    jsonrpc_batch = [
+        {
+            'jsonrpc': '2.0',
+            'id': i,
+            'method': 'eth_call',
+            'params': [{'to': address, 'data': data}, _block_identifier(block)],
+        }
+        for i, block in enumerate(blocks)
     ]
 
+    results = []
+    for res in jsonrpc.send_batch(jsonrpc_batch):
+        try:
+            if 'error' in res:
+                raise ValueError(res['error'])
+            output = signature.decode_data(HexBytes(res['result']))
+            if len(output) == 1:
+                output = output[0]
+            results.append(apply_func(output) if apply_func else output)
+        except (ValueError, InsufficientDataBytes) as e:
+            if not return_None_on_failure:
+                raise
+            if isinstance(e, ValueError) and not call_reverted(e):
+                raise
+            results.append(None)
+    return results
+
+
+def _block_identifier(block: Optional[Block]) -> str:
+    if block is None:
+        return 'latest'
+    if isinstance(block, int):
+        return hex(block)
+    return block
+
 
 @log(logger)
 def _clean_addresses(
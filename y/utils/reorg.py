@@ -0,0 +1,186 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from y.typing import Block
+from y.utils.cache import CONFIRMATIONS, is_finalized
+
+logger = logging.getLogger(__name__)
+
+"""
+Reorg-aware caching for blocks near the chain head.
+
+A block in the reorg window, ie one of the last `y.utils.cache.CONFIRMATIONS` blocks, can still be replaced.
+`block_hashes` tracks the canonical hash of every block in the window, and `reorg_cache` tags each result for a block
+in the window with that block's hash. A result whose block has been reorged out no longer matches and is recomputed.
+Once a block leaves the window its results are promoted to plain lru entries, the same as results for finalized blocks.
+
+    @reorg_cache(maxsize=1_000)
+    def get_price(self, token, block=None):
+        ...
+
+`block_hashes` syncs with the node at most once every $YPRICEMAGIC_REORG_SYNC_INTERVAL seconds (default: 2),
+and only while something asks it about a block in the window. A sync costs one request for the head plus one for each new block.
+"""
+
+REORG_SYNC_INTERVAL = float(os.environ.get('YPRICEMAGIC_REORG_SYNC_INTERVAL', 2))
+
+# we remember the hashes of this many blocks after they leave the window so we can promote results cached for them
+_FINALIZED_HASHES = 10_000
+
+# (number, hash, parent hash)
+Header = Tuple[int, str, str]
+
+
+class BlockHashes:
+    '''
+    Tracks the canonical hash of every block in the reorg window.
+    '''
+
+    def __init__(self, window: int = CONFIRMATIONS, sync_interval: float = REORG_SYNC_INTERVAL) -> None:
+        self.window = window
+        self.sync_interval = sync_interval
+        self.head: Optional[int] = None
+        self.reorgs = 0
+        self._headers: Dict[int, Header] = {}
+        self._finalized: 'OrderedDict[int, str]' = OrderedDict()
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"<BlockHashes head={self.head} window={self.window} reorgs={self.reorgs}>"
+
+    def hash_of(self, block: Block) -> Optional[str]:
+        '''
+        Returns the canonical hash of `block`, or `None` if it is older than anything we've seen or hasn't been mined yet.
+        '''
+        try:
+            self.sync()
+        except Exception as e:
+            # if we can't tell whether `block` was reorged, we don't vouch for it
+            logger.debug(f'unable to sync block hashes. {e.__class__.__name__}: {e}')
+            return None
+        header = self._headers.get(block)
+        return header[1] if header else self._finalized.get(block)
+
+    def sync(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            self._sync()
+            self._synced_at = time.monotonic()
+
+    def _sync(self) -> None:
+        head = _fetch_headers(['latest'])[0]
+        number = head[0]
+        if self.head is None or not 0 <= number - self.head <= self.window:
+            # first sync, a long gap since the last one, or the node went backwards. we start over.
+            self._headers.clear()
+            heights = range(max(number - self.window + 1, 0), number)
+        else:
+            heights = range(self.head + 1, number)
+        self._headers.update(zip(heights, _fetch_headers([hex(height) for height in heights])))
+        self._headers[number] = head
+        for height in [height for height in self._headers if height > number]:
+            del self._headers[height]
+
+        # every block must be the parent of the one above it. any block that isn't was reorged out.
+        reorged = []
+        for height in range(number, min(self._headers), -1):
+            if height - 1 in self._headers and self._headers[height - 1][1] != self._headers[height][2]:
+                self._headers[height - 1] = _fetch_headers([hex(height - 1)])[0]
+                reorged.append(height - 1)
+        if reorged:
+            self.reorgs += 1
+            logger.info(f'reorg detected at blocks {min(reorged)} to {max(reorged)}, cached results for them will be recomputed')
+
+        for height in sorted(self._headers):
+            if height > number - self.window:
+                break
+            self._finalized[height] = self._headers.pop(height)[1]
+        while len(self._finalized) > _FINALIZED_HASHES:
+            self._finalized.popitem(last=False)
+        self.head = number
+
+
+block_hashes = BlockHashes()
+
+
+def reorg_cache(maxsize: Optional[int] = 128) -> Callable[[Callable], Callable]:
+    '''
+    Like `functools.lru_cache`, for functions with a `block` argument. See the module docstring.
+    Calls with `block=None` mean 'latest', so they are never cached.
+    '''
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        if 'block' not in signature.parameters:
+            raise TypeError(f'{func.__qualname__} has no `block` argument')
+        cache: 'OrderedDict[Tuple, Tuple[Optional[str], Any]]' = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def reorg_cache_wrap(*args: Any, **kwargs: Any) -> Any:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            block = bound.arguments['block']
+            if not isinstance(block, int):
+                return func(*args, **kwargs)
+            key = tuple(bound.arguments.values())
+
+            with lock:
+                entry = cache.get(key)
+                if entry is not None:
+                    cache.move_to_end(key)
+            if entry is not None:
+                tag, value = entry
+                if tag is None:
+                    return value
+                if block_hashes.hash_of(block) == tag:
+                    if is_finalized(block):
+                        with lock:
+                            cache[key] = (None, value)
+                    return value
+
+            # results for finalized blocks don't need a tag. we don't cache results for blocks we have no hash for.
+            tag = None if is_finalized(block) else block_hashes.hash_of(block)
+            value = func(*args, **kwargs)
+            if tag is None and not is_finalized(block):
+                return value
+            with lock:
+                cache[key] = (tag, value)
+                cache.move_to_end(key)
+                if maxsize is not None and len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        reorg_cache_wrap.cache_clear = cache.clear
+        return reorg_cache_wrap
+
+    return decorator
+
+
+def _fetch_headers(block_identifiers: List[str]) -> List[Header]:
+    # imported here to avoid a circular import, `y.utils.jsonrpc` imports the middleware, which uses `y.utils.call_cache`
+    from y.utils import jsonrpc
+
+    if not block_identifiers:
+        return []
+    jsonrpc_batch = [
+        {'jsonrpc': '2.0', 'id': i, 'method': 'eth_getBlockByNumber', 'params': [block_identifier, False]}
+        for i, block_identifier in enumerate(block_identifiers)
+    ]
+    headers = []
+    for block_identifier, response in zip(block_identifiers, jsonrpc.send_batch(jsonrpc_batch)):
+        if 'error' in response or not response.get('result'):
+            raise ValueError(f'unable to fetch block {block_identifier}. {response.get("error")}')
+        block = response['result']
+        headers.append((int(block['number'], 16), block['hash'], block['parentHash']))
+    return headers
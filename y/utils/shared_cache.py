@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import msgpack
+from brownie import chain
+
+logger = logging.getLogger(__name__)
+
+"""
+An optional cache shared by every ypricemagic process on a host.
+
+When you run many workers, each one fetches the same calls and works out the same prices at startup.
+With a shared cache, what one worker learns is visible to all the others right away:
+- `y.utils.call_cache` reads `eth_call` responses from it after its own store misses, and writes every response to it
+- `y.prices.utils.price_store` does the same for prices, including prices at blocks in the reorg window, keyed by block hash
+
+Set $YPRICEMAGIC_SHARED_CACHE_URL to enable it:
+- `unix:///path/to.sock` for ypricemagic's own cache server, which you start with `python -m y.utils.shared_cache /path/to.sock`
+  in the same environment as your workers, since importing ypricemagic connects to a network
+- `redis://host:port/db` for redis, or anything that speaks its protocol. This needs the `redis` package.
+
+ypricemagic's server keeps everything in memory and holds at most $YPRICEMAGIC_SHARED_CACHE_MAX_MB megabytes (default: 1024),
+evicting the least recently used entries. Entries written to redis expire after $YPRICEMAGIC_SHARED_CACHE_TTL seconds (default: 1 day).
+
+The shared cache is only ever a shortcut. If it goes away, we log a warning, carry on without it, and try it again later.
+"""
+
+SHARED_CACHE_URL = os.environ.get('YPRICEMAGIC_SHARED_CACHE_URL')
+SHARED_CACHE_MAX_MB = int(os.environ.get('YPRICEMAGIC_SHARED_CACHE_MAX_MB', 1024))
+SHARED_CACHE_TTL = int(os.environ.get('YPRICEMAGIC_SHARED_CACHE_TTL', 86_400))
+# seconds we wait on the shared cache before carrying on without it
+SHARED_CACHE_TIMEOUT = float(os.environ.get('YPRICEMAGIC_SHARED_CACHE_TIMEOUT', 1))
+# after an error, we leave the shared cache alone for this many seconds
+SHARED_CACHE_RETRY_AFTER = 30
+
+
+class SharedCache:
+    '''
+    Base class for shared caches. Subclass this and pass an instance to `set_shared_cache` to use your own backend.
+    Keys and values are bytes. Implementations must be thread-safe and may raise on any error, see `lookup_many`.
+    '''
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        '''
+        Returns the value for each key in `keys` that has one. Keys that aren't stored are left out.
+        '''
+        raise NotImplementedError
+
+    def set_many(self, values: Dict[bytes, bytes]) -> None:
+        raise NotImplementedError
+
+
+class UnixSocketCache(SharedCache):
+    '''
+    A client for `CacheServer`. Each thread keeps its own connection.
+    '''
+
+    def __init__(self, path: str, timeout: float = SHARED_CACHE_TIMEOUT) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __repr__(self) -> str:
+        return f"<UnixSocketCache '{self.path}'>"
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        values = self._request('get', keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values: Dict[bytes, bytes]) -> None:
+        self._request('set', list(values.items()))
+
+    def _request(self, op: str, payload: Any) -> Any:
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = self._local.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+        try:
+            _send_message(sock, [op, payload])
+            return _recv_message(sock)
+        except BaseException:
+            # the connection may be out of sync with the server now, so the next request gets a new one
+            self._local.sock = None
+            sock.close()
+            raise
+
+
+class RedisCache(SharedCache):
+    def __init__(self, url: str, ttl: int = SHARED_CACHE_TTL, timeout: float = SHARED_CACHE_TIMEOUT) -> None:
+        # redis is optional, you only need it if you use it
+        import redis
+        self.url = url
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def __repr__(self) -> str:
+        return f"<RedisCache '{self.url}'>"
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        return {key: value for key, value in zip(keys, self._client.mget(keys)) if value is not None}
+
+    def set_many(self, values: Dict[bytes, bytes]) -> None:
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set(key, value, ex=self.ttl)
+        pipeline.execute()
+
+
+class CacheServer:
+    '''
+    An in-memory lru cache served over a unix socket, for `UnixSocketCache` clients.
+    '''
+
+    def __init__(self, path: str, max_mb: int = SHARED_CACHE_MAX_MB) -> None:
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[bytes, bytes]' = OrderedDict()
+        self._bytes = 0
+
+    def __repr__(self) -> str:
+        return f"<CacheServer '{self.path}' entries={len(self._entries)} bytes={self._bytes}>"
+
+    def serve_forever(self) -> None:
+        asyncio.run(self._serve())
+
+    async def _serve(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f'{self} listening')
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                length = int.from_bytes(await reader.readexactly(4), 'big')
+                op, payload = msgpack.unpackb(await reader.readexactly(length))
+                data = msgpack.packb(self._respond(op, payload))
+                writer.write(len(data).to_bytes(4, 'big') + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, op: str, payload: Any) -> Any:
+        if op == 'get':
+            return [self._get(key) for key in payload]
+        if op == 'set':
+            for key, value in payload:
+                self._set(key, value)
+            return len(payload)
+        if op == 'stats':
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+        raise ValueError(f'unknown op {op}')
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: bytes, value: bytes) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(key) + len(old)
+        self._entries[key] = value
+        self._bytes += len(key) + len(value)
+        while self._bytes > self.max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_key) + len(evicted)
+
+
+def _send_message(sock: socket.socket, message: Any) -> None:
+    data = msgpack.packb(message)
+    sock.sendall(len(data).to_bytes(4, 'big') + data)
+
+
+def _recv_message(sock: socket.socket) -> Any:
+    length = int.from_bytes(_recv_exactly(sock, 4), 'big')
+    return msgpack.unpackb(_recv_exactly(sock, length))
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    chunks, remaining = [], n
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            raise ConnectionError('the shared cache closed the connection')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _default_shared_cache() -> Optional[SharedCache]:
+    if not SHARED_CACHE_URL:
+        return None
+    url = urlparse(SHARED_CACHE_URL)
+    try:
+        if url.scheme == 'unix':
+            return UnixSocketCache(url.path)
+        if url.scheme in ('redis', 'rediss'):
+            return RedisCache(SHARED_CACHE_URL)
+        raise ValueError(f'unsupported scheme {url.scheme}')
+    except Exception as e:
+        logger.warning(f'unable to use the shared cache at {SHARED_CACHE_URL}, continuing without it. {e.__class__.__name__}: {e}')
+        return None
+
+_shared_cache: Optional[SharedCache] = _default_shared_cache()
+_unavailable_until = 0.0
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    return _shared_cache
+
+
+def set_shared_cache(shared_cache: Optional[SharedCache]) -> None:
+    '''
+    Replaces the cache shared between processes. Pass `None` to disable it.
+    '''
+    global _shared_cache, _unavailable_until
+    _shared_cache = shared_cache
+    _unavailable_until = 0.0
+
+
+def lookup_many(namespace: str, keys: Iterable[bytes]) -> Dict[bytes, bytes]:
+    '''
+    Returns the value for each key in `namespace` that the shared cache has. Never raises.
+    '''
+    cache = _available()
+    keys = list(keys)
+    if cache is None or not keys:
+        return {}
+    prefix = _prefix(namespace)
+    try:
+        values = cache.get_many([prefix + key for key in keys])
+    except Exception as e:
+        _failed(e)
+        return {}
+    return {key[len(prefix):]: value for key, value in values.items()}
+
+
+def save_many(namespace: str, values: Dict[bytes, bytes]) -> None:
+    '''
+    Writes `values` to `namespace` in the shared cache. Never raises.
+    '''
+    cache = _available()
+    if cache is None or not values:
+        return
+    prefix = _prefix(namespace)
+    try:
+        cache.set_many({prefix + key: value for key, value in values.items()})
+    except Exception as e:
+        _failed(e)
+
+
+def _available() -> Optional[SharedCache]:
+    return None if time.monotonic() < _unavailable_until else _shared_cache
+
+
+def _failed(e: Exception) -> None:
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + SHARED_CACHE_RETRY_AFTER
+    logger.warning(f'the shared cache {_shared_cache} failed, trying again in {SHARED_CACHE_RETRY_AFTER}s. {e.__class__.__name__}: {e}')
+
+
+def _prefix(namespace: str) -> bytes:
+    # processes on different chains can share one cache
+    return f'ypricemagic:{chain.id}:{namespace}:'.encode()
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Serves a cache shared by every ypricemagic process on this host.')
+    parser.add_argument('path', help='the unix socket to listen on')
+    parser.add_argument('--max-mb', type=int, default=SHARED_CACHE_MAX_MB, help='the most memory the cache can hold, in megabytes')
+    parsed = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    CacheServer(parsed.path, parsed.max_mb).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    '''
+    A thin, thread-safe wrapper around one sqlite connection in WAL mode.
+    WAL lets any number of processes read the file while one of them writes.
+    '''
+
+    # subclasses define their tables here
+    schema: Tuple[str, ...] = ()
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                self._conn.execute(statement)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} '{self.path}'>"
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Iterable[Any]]) -> None:
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(sql, seq_of_params)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        '''
+        Yields the connection inside a transaction that is committed when the `with` block exits, or rolled back if it raises.
+        Don't call `execute` or `executemany` inside the block, they would wait on the lock we hold.
+        '''
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def size(self) -> int:
+        '''
+        Returns the number of bytes in use by the database, not counting free pages.
+        '''
+        with self._lock:
+            page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist_count = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - freelist_count) * page_size
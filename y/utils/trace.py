@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+"""
+Opt-in tracing of the work done by ypricemagic.
+
+    with y.trace() as t:
+        y.get_price(token, block)
+    print(t.summary())
+
+While a trace is active it records:
+- the bucket chosen for each token
+- each pricing source tried, with its result and latency
+- every rpc request, with its latency, whether it was served from the cache, and the pricing stack it was issued from
+
+Work we hand to worker threads is wrapped with `propagate`, so it keeps the pricing stack of the thread that handed it off.
+
+Requests are recorded from every thread, so anything else priced while the trace is active will show up too.
+"""
+
+_active_traces: List['Trace'] = []
+_active_traces_lock = threading.Lock()
+
+# each thread keeps its own stack of (token, source) frames so we know where every request came from
+_local = threading.local()
+
+
+class RpcRequest:
+    def __init__(self, method: str, params: Any, latency: float, cache_hit: bool, batch_size: int = 1) -> None:
+        self.method = method
+        self.to, self.selector, self.block = _describe_params(method, params)
+        self.latency = latency
+        self.cache_hit = cache_hit
+        self.batch_size = batch_size
+        self.path = _path()
+        self.depth = len(self.path)
+        self.token, self.source = self.path[-1] if self.path else (None, None)
+        self.thread = threading.current_thread().name
+
+    def __repr__(self) -> str:
+        return f"<RpcRequest {self.method} to={self.to} selector={self.selector} block={self.block} latency={round(self.latency, 4)} cache_hit={self.cache_hit} source={self.source}>"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in vars(self).items()}
+
+
+class SourceAttempt:
+    def __init__(self, source: str, token: Any, block: Any, price: Optional[float], latency: float, error: Optional[str] = None) -> None:
+        self.source = source
+        self.token = token
+        self.block = block
+        self.price = price
+        self.latency = latency
+        self.error = error
+        self.path = _path()
+        self.depth = len(self.path)
+        self.thread = threading.current_thread().name
+
+    def __repr__(self) -> str:
+        return f"<SourceAttempt {self.source} token={self.token} block={self.block} price={self.price} latency={round(self.latency, 4)}>"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in vars(self).items()}
+
+
+class Trace:
+    def __init__(self) -> None:
+        self.buckets: Dict[str, Optional[str]] = {}
+        self.sources: List[SourceAttempt] = []
+        self.requests: List[RpcRequest] = []
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return f"<Trace requests={len(self.requests)} sources={len(self.sources)}>"
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rpc_count(self, method: Optional[str] = None, include_cache_hits: bool = False) -> int:
+        return sum(
+            1 for request in self.requests
+            if (method is None or request.method == method) and (include_cache_hits or not request.cache_hit)
+        )
+
+    def by_method(self) -> Dict[str, Dict[str, float]]:
+        return self._aggregate(lambda request: request.method)
+
+    def by_source(self) -> Dict[Optional[str], Dict[str, float]]:
+        return self._aggregate(lambda request: request.source)
+
+    def by_token(self) -> Dict[Optional[str], Dict[str, float]]:
+        return self._aggregate(lambda request: request.token)
+
+    def hot_spots(self, n: int = 10) -> List[Tuple[Tuple[Optional[str], Optional[str], Optional[str]], int]]:
+        '''
+        The `n` (token, source, selector) combinations responsible for the most requests.
+        '''
+        return Counter((request.token, request.source, request.selector) for request in self.requests).most_common(n)
+
+    def to_dicts(self) -> Dict[str, Any]:
+        return {
+            'buckets': dict(self.buckets),
+            'sources': [source.as_dict() for source in self.sources],
+            'requests': [request.as_dict() for request in self.requests],
+        }
+
+    def summary(self) -> str:
+        lines = [f'{len(self.requests)} rpc requests, {self.rpc_count()} sent to the node, {len(self.sources)} pricing sources tried']
+        for method, stats in sorted(self.by_method().items(), key=lambda item: -item[1]['count']):
+            lines.append(f"  {method}: {int(stats['count'])} requests, {int(stats['cache_hits'])} cache hits, {round(stats['latency'], 3)}s")
+        return '\n'.join(lines)
+
+    def _aggregate(self, key: Callable[[RpcRequest], Any]) -> Dict[Any, Dict[str, float]]:
+        stats = defaultdict(lambda: {'count': 0, 'cache_hits': 0, 'latency': 0.0})
+        for request in self.requests:
+            group = stats[key(request)]
+            group['count'] += 1
+            group['cache_hits'] += request.cache_hit
+            group['latency'] += request.latency
+        return dict(stats)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    '''
+    Records everything ypricemagic does inside the `with` block. See the module docstring for details.
+    '''
+    t = Trace()
+    with _active_traces_lock:
+        _active_traces.append(t)
+    t.started = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t.finished = time.perf_counter()
+        with _active_traces_lock:
+            _active_traces.remove(t)
+
+
+def is_active() -> bool:
+    return bool(_active_traces)
+
+
+def source(name: str, func: Callable, token: Any, block: Any) -> Any:
+    '''
+    Calls `func(token, block=block)` as pricing source `name`, recording the attempt if a trace is active.
+    `token` can also be a list of tokens for sources that price in bulk.
+    '''
+    if not _active_traces:
+        return func(token, block=block)
+
+    label = tuple(token) if isinstance(token, list) else token
+    stack = _stack()
+    stack.append((label, name))
+    start = time.perf_counter()
+    price, error = None, None
+    try:
+        price = func(token, block=block)
+        return price
+    except Exception as e:
+        error = f'{e.__class__.__name__}: {e}'
+        raise
+    finally:
+        latency = time.perf_counter() - start
+        stack.pop()
+        attempt = SourceAttempt(name, label, block, price if isinstance(price, (int, float)) else None, latency, error)
+        for t in list(_active_traces):
+            t.sources.append(attempt)
+
+
+def propagate(func: Callable) -> Callable:
+    '''
+    Returns a wrapped `func` that runs with the caller's pricing stack, whichever thread it runs on,
+    so requests made from worker threads are still credited to the token and source that made them.
+    '''
+    if not _active_traces:
+        return func
+    path = _path()
+
+    @wraps(func)
+    def propagate_wrap(*args: Any, **kwargs: Any) -> Any:
+        previous = _stack()
+        _local.stack = list(path)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.stack = previous
+
+    return propagate_wrap
+
+
+def record_bucket(token: str, bucket: Optional[str]) -> None:
+    for t in list(_active_traces):
+        t.buckets[token] = bucket
+
+
+def record_request(method: str, params: Any, latency: float, cache_hit: bool = False, batch_size: int = 1) -> None:
+    if not _active_traces:
+        return
+    request = RpcRequest(method, params, latency, cache_hit, batch_size)
+    for t in list(_active_traces):
+        t.requests.append(request)
+
+
+def _stack() -> List[Tuple[Optional[str], str]]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _path() -> Tuple[Tuple[Optional[str], str], ...]:
+    return tuple(_stack())
+
+
+def _describe_params(method: str, params: Any) -> Tuple[Optional[str], Optional[str], Any]:
+    try:
+        if method == 'eth_call':
+            return params[0].get('to'), str(params[0].get('data', ''))[:10], params[1]
+        if method == 'eth_getCode':
+            return params[0], None, params[1]
+        if method == 'eth_getLogs':
+            return params[0].get('address'), None, (params[0].get('fromBlock'), params[0].get('toBlock'))
+    except (IndexError, KeyError, AttributeError, TypeError):
+        pass
+    return None, None, None